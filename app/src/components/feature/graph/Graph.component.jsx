@@ -18,6 +18,7 @@ function Graph(props) {
     const [timer, setTimer] = useState(null);
     const { width, height } = useResizeDetector({ containerRef });
     const [linkOpacity, setLinkOpacity] = useState(0.3);
+    const hoveredLink = useRef(null);
 
     const [windowSize, setWindowSize] = useState({
         width: window.innerWidth,
@@ -253,17 +254,30 @@ function Graph(props) {
         [store.graphInstance]
     );
 
+    const setLinkHoverData = link => {
+        store.graphInstance.setHoverData(
+            link.connections.map(connection => {
+                return {
+                    label: connection.label,
+                    feature: connection.feature,
+                    count: connection.count
+                };
+            })
+        );
+    };
+
     const handleLinkHover = link => {
+        hoveredLink.current = link;
+
         if (link && link.connections) {
-            store.graphInstance.setHoverData(
-                link.connections.map(connection => {
-                    return {
-                        label: connection.label,
-                        feature: connection.feature,
-                        count: connection.count
-                    };
-                })
-            );
+            setLinkHoverData(link);
+
+            // Capped edges only come with a sample of their connections, the full list is fetched once the edge is opened
+            store.graph.loadEdgeConnections(link).then(() => {
+                if (hoveredLink.current === link) {
+                    setLinkHoverData(link);
+                }
+            });
         } else {
             store.graphInstance.setHoverData([]);
         }
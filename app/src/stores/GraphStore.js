@@ -913,6 +913,50 @@ export class GraphStore {
         ];
     };
 
+    loadEdgeConnections = async edge => {
+        // Overview edges carry a sample of their connections when the server caps them, their weight is the number of shared links
+        if (
+            !edge.connections ||
+            edge.connections.length >= edge.weight ||
+            edge.connectionsRequest
+        ) {
+            return edge.connectionsRequest;
+        }
+
+        const historyItemId =
+            this.store.core.studyHistory[this.store.core.studyHistoryItemIndex]
+                .id;
+
+        edge.connectionsRequest = safeRequest(
+            axios.get(
+                `studies/${this.store.core.studyUuid}/history/${historyItemId}/edges/connections`,
+                {
+                    params: {
+                        source:
+                            typeof edge.source === 'object'
+                                ? edge.source.id
+                                : edge.source,
+                        target:
+                            typeof edge.target === 'object'
+                                ? edge.target.id
+                                : edge.target
+                    },
+                    headers: { user_id: this.store.core.userUuid }
+                }
+            )
+        ).then(({ response, error }) => {
+            if (error) {
+                this.store.core.handleRequestError(error);
+                edge.connectionsRequest = null;
+                return;
+            }
+
+            edge.connections = response.data.connections;
+        });
+
+        return edge.connectionsRequest;
+    };
+
     handleRetrievedGraph = (response, graphType, query) => {
         this.store.graphInstance.setIsSelfCentric(false);
         this.store.graphInstance.setIsFiltered(false);
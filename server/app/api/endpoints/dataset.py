@@ -2,6 +2,7 @@ import os
 from os.path import exists
 from typing import Dict, List, Union
 
+import app.services.graph.edges as csx_edges
 import app.services.graph.nodes as csx_nodes
 import app.services.search.autocomplete as csx_auto
 import polars as pl
@@ -111,6 +112,7 @@ def delete_dataset(
     if config:
         search.delete_dataset(dataset_name)
         storage.delete_dataset(dataset_name)
+        csx_edges.invalidate_schema_path_plans(dataset_name)
 
         if exists(f"./app/data/autocomplete/auto_{dataset_name}"):
             os.remove(f"./app/data/autocomplete/auto_{dataset_name}")
@@ -261,9 +263,9 @@ async def save_dataset_settings(
     if len(list_properties) > 0:
         dataset_df = search.get_full_dataset(data.name)
         print("***** Generating nodes")
-        nodes, _ = csx_nodes.get_nodes(dataset_df)
+        node_table, _ = csx_nodes.get_nodes(dataset_df)
         print("***** Generating mongo nodes")
-        list_nodes = [node for node in nodes if node["feature"] in list_properties]
+        list_nodes = node_table.to_nodes(node_table.get_feature_index(list_properties))
         print("***** Populating mongo")
         storage.insert_nodes(data.name, list_nodes)
     else:
@@ -433,5 +435,6 @@ def update_dataset_settings(
     }
 
     storage.update_config(dataset_name, config)
+    csx_edges.invalidate_schema_path_plans(dataset_name)
 
     return Response(status_code=status.HTTP_200_OK)
@@ -1,12 +1,16 @@
 import itertools
 import json
 import os
-import pickle
 from typing import List, Literal, Union
 
+import app.services.graph.adjacency as csx_adjacency
+import app.services.graph.centrality as csx_centrality
+import app.services.graph.edges as csx_edges
 import app.services.graph.graph as csx_graph
+import app.services.graph.paths as csx_paths
 import app.services.study.study as csx_study
 import pandas as pd
+import pyarrow.compute as pc
 from app.api.dependencies import (
     get_current_study,
     get_external_search_connector,
@@ -25,8 +29,7 @@ from app.services.search.external.base import BaseExternalSearchConnector
 from app.services.storage.base import BaseStorageConnector
 from app.utils.typecheck import isJson, isNumber
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 
 router = APIRouter(prefix="/studies/{study_id}/history", tags=["history"])
 
@@ -82,18 +85,20 @@ def get_history_item(
         if entry["item_id"] == ObjectId(history_item_id)
     ][0]["charts"]
 
-    history_item = storage.get_history_item(history_id)
-
-    history = csx_study.extract_history_items(study)
-
     graph_type = [
         entry
         for entry in study["history"]
         if entry["item_id"] == ObjectId(history_item_id)
     ][0]["graph_type"]
 
+    history_item = storage.get_history_item(history_id, [graph_type, "global"])
+
+    history = csx_study.extract_history_items(study)
+
     return {
-        "graph": history_item[graph_type],
+        "graph": csx_graph.get_response_graph(
+            history_item[graph_type], csx_study.get_results(history_item["global"])
+        ),
         "name": study["study_name"],
         "description": study["study_description"],
         "author": study["study_author"] if "study_author" in study else "",
@@ -139,7 +144,9 @@ def create_history_item(
         storage.update_study_settings(study_id, user_id, {"index": index})
         graph_type_changed = False
     else:
-        cache_data = storage.get_history_item(history_item_id)
+        cache_data = csx_study.drop_derived_data(
+            storage.get_history_item(history_item_id)
+        )
         study = storage.get_study(user_id, study_id)
 
         if not study:
@@ -220,8 +227,7 @@ def create_history_item(
     if len(results.index) == 0:
         return {"nodes": []}
 
-    json_results = results.to_json(orient="records")
-    elastic_json = json.loads(json_results)
+    search_results = csx_study.get_results_table(results)
 
     if index != "openalex":
         dataset_features = search.get_dataset_features(index)
@@ -265,12 +271,11 @@ def create_history_item(
             storage,
             graph_type,
             dimensions,
-            elastic_json,
+            search_results,
             visible_entries,
             index,
             cache_data,
             search_uuid,
-            results,
             user_id,
             schema,
             anchor_properties,
@@ -288,7 +293,7 @@ def create_history_item(
             comparison_res,
             graph_type,
             dimensions,
-            elastic_json,
+            search_results,
             user_id,
             study_id,
             comparison_res["action"],
@@ -306,7 +311,7 @@ def create_history_item(
             storage,
             graph_type,
             dimensions,
-            elastic_json,
+            search_results,
             visible_entries,
             cache_data,
             user_id,
@@ -343,6 +348,10 @@ def create_history_item(
 
     graph = comparison_switch[comparison_res["action"]]()
 
+    # Graphs built from scratch come with new search results, all others keep the cached ones
+    if comparison_res["action"] != "from_scratch":
+        search_results = cache_data["global"]["results"]
+
     study = storage.get_study(user_id, study_id)
 
     if not study:
@@ -351,7 +360,7 @@ def create_history_item(
         )
 
     return {
-        "graph": graph,
+        "graph": csx_graph.get_response_graph(graph, search_results),
         "history": storage.get_history_items(study_id, user_id),
     }
 
@@ -369,6 +378,225 @@ def update_history_item(
     return Response(status_code=status.HTTP_200_OK)
 
 
+@router.get("/{history_item_id}/edges/connections", status_code=status.HTTP_200_OK)
+def get_edge_connections(
+    history_item_id: str,
+    study_id: str,
+    source: str,
+    target: str,
+    study: dict = Depends(get_current_study),
+    storage: BaseStorageConnector = Depends(get_storage_connector),
+):
+    """Get all connections of the overview edge between the given anchors."""
+    if not study:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study not found",
+        )
+
+    history_entry = next(
+        (
+            entry
+            for entry in study["history"]
+            if entry["item_id"] == ObjectId(history_item_id)
+        ),
+        None,
+    )
+
+    if not history_entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="History item not found"
+        )
+
+    # Only the connection index and its lookup are read, the edges of the overview are not needed
+    overview = storage.get_history_item(
+        history_item_id, ["overview.connection_index", "overview.connection_lookup"]
+    ).get("overview")
+
+    if overview and "connection_index" not in overview:
+        # Overview items stored before the connection index was introduced keep all connections on their edges
+        overview = storage.get_history_item(history_item_id, ["overview"])["overview"]
+        overview = {
+            "connection_index": csx_edges.get_connection_index_from_edges(
+                overview["edges"]
+            )
+        }
+
+    if not overview:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+        )
+
+    # Overview items stored before the lookup was introduced only carry the connection index
+    connection_lookup = overview.get(
+        "connection_lookup"
+    ) or csx_edges.get_connection_lookup(overview["connection_index"])
+
+    connections = csx_edges.get_edge_connections(
+        overview["connection_index"],
+        connection_lookup,
+        {"source": source, "target": target},
+    )
+
+    if not connections:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Edge not found"
+        )
+
+    return {"connections": connections}
+
+
+@router.get("/{history_item_id}/centrality", status_code=status.HTTP_200_OK)
+def get_centrality(
+    history_item_id: str,
+    study_id: str,
+    graph_type: Union[Literal["overview", "detail"], None] = None,
+    limit: Union[int, None] = None,
+    user_id: str = Depends(verify_user_exists),
+    study: dict = Depends(get_current_study),
+    storage: BaseStorageConnector = Depends(get_storage_connector),
+):
+    """Get node rankings by centrality metrics, rankings are computed once per history item and graph type."""
+    if not study:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study not found",
+        )
+
+    history_entry = next(
+        (
+            entry
+            for entry in study["history"]
+            if entry["item_id"] == ObjectId(history_item_id)
+        ),
+        None,
+    )
+
+    if not history_entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="History item not found"
+        )
+
+    if graph_type is None:
+        graph_type = history_entry["graph_type"]
+
+    centrality = storage.get_history_item_centrality(history_item_id, graph_type)
+
+    if centrality is None:
+        cache_data = storage.get_history_item(history_item_id, [graph_type])
+
+        if not cache_data.get(graph_type):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+            )
+
+        centrality = csx_centrality.get_centrality(cache_data[graph_type])
+
+        storage.insert_history_item_centrality(history_item_id, graph_type, centrality)
+
+    return {
+        "graph_type": graph_type,
+        "centrality": {
+            metric: ranking[:limit] for metric, ranking in centrality.items()
+        },
+    }
+
+
+@router.get("/{history_item_id}/neighbourhood", status_code=status.HTTP_200_OK)
+def get_neighbourhood(
+    history_item_id: str,
+    study_id: str,
+    node_ids: List[str] = Query(...),
+    hops: int = Query(1, ge=0, le=csx_adjacency.MAX_EGO_HOPS),
+    max_fanouts: Union[List[int], None] = Query(None, ge=0),
+    graph_type: Union[Literal["overview", "detail"], None] = None,
+    study: dict = Depends(get_current_study),
+    storage: BaseStorageConnector = Depends(get_storage_connector),
+):
+    """Get all nodes within a number of hops of the given nodes, each hop can limit the neighbours followed per node."""
+    if not study:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study not found",
+        )
+
+    history_entry = next(
+        (
+            entry
+            for entry in study["history"]
+            if entry["item_id"] == ObjectId(history_item_id)
+        ),
+        None,
+    )
+
+    if not history_entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="History item not found"
+        )
+
+    graph_type = graph_type or history_entry["graph_type"]
+    cache_data = storage.get_history_item(history_item_id, [graph_type])
+    graph_data = cache_data.get(graph_type)
+
+    if not graph_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+        )
+
+    return {
+        "graph": csx_adjacency.get_ego_graph(graph_data, node_ids, hops, max_fanouts)
+    }
+
+
+@router.get("/{history_item_id}/paths", status_code=status.HTTP_200_OK)
+def get_paths(
+    history_item_id: str,
+    study_id: str,
+    source_ids: List[str] = Query(...),
+    target_ids: List[str] = Query(...),
+    max_paths: int = Query(1, ge=1, le=csx_paths.MAX_PATHS),
+    max_distance: Union[int, None] = None,
+    graph_type: Union[Literal["overview", "detail"], None] = None,
+    study: dict = Depends(get_current_study),
+    storage: BaseStorageConnector = Depends(get_storage_connector),
+):
+    """Get shortest paths between two sets of nodes, at most max_paths of all equally short paths are returned."""
+    if not study:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Study not found",
+        )
+
+    history_entry = next(
+        (
+            entry
+            for entry in study["history"]
+            if entry["item_id"] == ObjectId(history_item_id)
+        ),
+        None,
+    )
+
+    if not history_entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="History item not found"
+        )
+
+    graph_type = graph_type or history_entry["graph_type"]
+    cache_data = storage.get_history_item(history_item_id, [graph_type])
+    graph_data = cache_data.get(graph_type)
+
+    if not graph_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Graph not found"
+        )
+
+    return {
+        "graph": csx_paths.get_path_graph(
+            graph_data, source_ids, target_ids, max_paths, max_distance
+        )
+    }
+
+
 @router.put("/{history_item_id}/nodes/expand", status_code=status.HTTP_200_OK)
 def expand_nodes(
     data: ExpandNodesData,
@@ -382,7 +610,7 @@ def expand_nodes(
         get_external_search_connector
     ),
 ):
-    cache_data = storage.get_history_item(history_item_id)
+    cache_data = csx_study.drop_derived_data(storage.get_history_item(history_item_id))
 
     last_history_item = study["history"][-1]
 
@@ -595,31 +823,21 @@ def expand_nodes(
             cache_data["global"]["index"],
             query,
             dimension_types,
-            cache_data["global"]["elastic_json"],
+            csx_study.get_result_rows(cache_data["global"]["results"]),
             data.page,
         )
 
         results = advanced_search_results["data"]
         pages = advanced_search_results["pages"]
 
-    elastic_json = cache_data["global"]["elastic_json"]
-    new_elastic_json = json.loads(results.to_json(orient="records"))
-
-    entries = list(set([row["entry"] for row in elastic_json]))
-
-    elastic_json = elastic_json + [
-        row for row in new_elastic_json if row["entry"] not in entries
-    ]
+    entry_count = pc.count_distinct(
+        cache_data["global"]["results"].column("entry")
+    ).as_py()
 
-    if results.size > 0:
-        results = pd.concat(
-            [
-                pd.read_json(cache_data["global"]["results_df"]),
-                results[~results["entry"].isin(entries)],
-            ]
-        ).reset_index(drop=True)
-    else:
-        results = pd.read_json(cache_data["global"]["results_df"])
+    # Search results of entries already in the table are skipped
+    search_results = csx_study.concat_results(
+        cache_data["global"]["results"], csx_study.get_results_table(results)
+    )
 
     if index != "openalex":
         dataset_features = search.get_dataset_features(index)
@@ -650,12 +868,11 @@ def expand_nodes(
         storage,
         graph_type,
         dimensions,
-        elastic_json,
+        search_results,
         [],
         index,
         cache_data,
         cache_data["global"]["search_uuid"],
-        results,
         user_id,
         schema,
         anchor_properties,
@@ -667,12 +884,13 @@ def expand_nodes(
         history_parent_id,
         charts,
         external_search,
+        delta=True,
     )
 
     return {
-        "graph": graph,
+        "graph": csx_graph.get_response_graph(graph, search_results),
         "history": storage.get_history_items(study_id, user_id),
-        "entry_delta": len(results) - len(entries),
+        "entry_delta": search_results.num_rows - entry_count,
         "pages": pages if pages and pages > 1 else None,
     }
 
@@ -685,8 +903,8 @@ def delete_nodes(
     user_id: str = Depends(verify_user_exists),
     storage: BaseStorageConnector = Depends(get_storage_connector),
 ):
-    cache_data = storage.get_history_item(history_item_id)
-    initial_entry_count = len(cache_data["global"]["elastic_json"])
+    cache_data = csx_study.drop_derived_data(storage.get_history_item(history_item_id))
+    initial_entry_count = cache_data["global"]["results"].num_rows
 
     entry_list = [
         node["entries"]
@@ -697,19 +915,26 @@ def delete_nodes(
     entries = list(set([entry for entries in entry_list for entry in entries]))
 
     cache_data = calculate_global_cache_properties(cache_data, entries)
-    new_entry_count = len(cache_data["global"]["elastic_json"])
+    new_entry_count = cache_data["global"]["results"].num_rows
+
+    # Labels of both graph types are counted on the same table of the remaining results
+    results = cache_data["global"]["results"]
 
     if data.graph_type == "overview":
-        cache_data = csx_graph.calculate_trimmed_graph(cache_data, entries, "overview")
+        cache_data = csx_graph.calculate_trimmed_graph(
+            cache_data, entries, "overview", results
+        )
         if cache_data["detail"] != {}:
             cache_data = csx_graph.calculate_trimmed_graph(
-                cache_data, entries, "detail"
+                cache_data, entries, "detail", results
             )
     else:
-        cache_data = csx_graph.calculate_trimmed_graph(cache_data, entries, "detail")
+        cache_data = csx_graph.calculate_trimmed_graph(
+            cache_data, entries, "detail", results
+        )
         if cache_data["overview"] != {}:
             cache_data = csx_graph.calculate_trimmed_graph(
-                cache_data, entries, "overview"
+                cache_data, entries, "overview", results
             )
 
     study = storage.get_study(user_id, study_id)
@@ -727,7 +952,7 @@ def delete_nodes(
         {
             "action": f"{data.delete_type} nodes",
             "graph_type": data.graph_type,
-            "graph_data": pickle.dumps(cache_data),
+            "graph_data": cache_data,
             "query": last_history_item["query"],
             "action_time": data.action_time,
             "schema": last_history_item["schema"],
@@ -739,6 +964,7 @@ def delete_nodes(
             "charts": data.charts,
             "edge_count": len(cache_data[data.graph_type]["edges"]),
             "node_count": len(cache_data[data.graph_type]["nodes"]),
+            "delta": True,
         },
     )
 
@@ -750,30 +976,19 @@ def delete_nodes(
         )
 
     return {
-        "graph": cache_data[data.graph_type],
+        "graph": csx_graph.get_response_graph(
+            cache_data[data.graph_type], cache_data["global"]["results"]
+        ),
         "history": storage.get_history_items(study_id, user_id),
         "entry_delta": initial_entry_count - new_entry_count,
     }
 
 
 def calculate_global_cache_properties(cache_data, entries):
-    # Filter table data to include only entries necessary
-    cache_data["global"]["table_data"] = [
-        data for data in cache_data["global"]["table_data"] if data["entry"] in entries
-    ]
-
-    # Filter tabular data by entries
-    tabular_data_df = pd.read_json(cache_data["global"]["results_df"])
-
-    cache_data["global"]["results_df"] = tabular_data_df[
-        tabular_data_df["entry"].isin(entries)
-    ].to_json()
-
-    cache_data["global"]["elastic_json"] = [
-        data
-        for data in cache_data["global"]["elastic_json"]
-        if data["entry"] in entries
-    ]
+    # Filter search results to include only entries necessary
+    cache_data["global"]["results"] = csx_study.filter_results(
+        cache_data["global"]["results"], entries
+    )
 
     return cache_data
 
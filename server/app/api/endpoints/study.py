@@ -1,5 +1,6 @@
 import uuid
 
+import app.services.graph.graph as csx_graph
 import app.services.study.study as csx_study
 from app.api.dependencies import (
     get_current_study,
@@ -36,14 +37,16 @@ def get_study(
 
     charts = study["history"][-1]["charts"]
 
-    history_item = storage.get_history_item(history_id)
-
     history = csx_study.extract_history_items(study)
 
     graph_type = history[len(history) - 1]["graph_type"]
 
+    history_item = storage.get_history_item(history_id, [graph_type, "global"])
+
     return {
-        "graph": history_item[graph_type],
+        "graph": csx_graph.get_response_graph(
+            history_item[graph_type], csx_study.get_results(history_item["global"])
+        ),
         "name": study["study_name"],
         "description": study["study_description"],
         "author": study["study_author"] if "study_author" in study else "",
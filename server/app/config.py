@@ -1,4 +1,6 @@
-from pydantic import BaseSettings
+from typing import Literal, Union
+
+from pydantic import BaseSettings, Field
 
 
 class Settings(BaseSettings):
@@ -10,6 +12,16 @@ class Settings(BaseSettings):
     show_docs: bool
     show_external_sources: bool = True
     openalex_email: str = ""
+    overview_sparsification: Union[Literal["disparity", "top_k", "threshold"], None] = (
+        None
+    )
+    overview_sparsification_parameter: Union[float, None] = None
+    overview_max_edges: Union[int, None] = None
+    # Edges keep at least their top ranked connection, so that connection lists line up with the edges. The client fetches the full list of a capped edge when it is hovered
+    overview_max_connections: Union[int, None] = Field(10, ge=1)
+    community_resolution: float = Field(1.0, gt=0)
+    # Community detection is bounded by its number of levels, the time limit in seconds only caps it on very large graphs
+    community_time_limit: Union[float, None] = Field(10.0, gt=0)
 
     class Config:
         fields = {
@@ -21,6 +33,14 @@ class Settings(BaseSettings):
             "show_docs": {"env": "SHOW_DOCS"},
             "show_external_sources": {"env": "SHOW_EXTERNAL_SOURCES"},
             "openalex_email": {"env": "OPENALEX_EMAIL"},
+            "overview_sparsification": {"env": "OVERVIEW_SPARSIFICATION"},
+            "overview_sparsification_parameter": {
+                "env": "OVERVIEW_SPARSIFICATION_PARAMETER"
+            },
+            "overview_max_edges": {"env": "OVERVIEW_MAX_EDGES"},
+            "overview_max_connections": {"env": "OVERVIEW_MAX_CONNECTIONS"},
+            "community_resolution": {"env": "COMMUNITY_RESOLUTION"},
+            "community_time_limit": {"env": "COMMUNITY_TIME_LIMIT"},
         }
 
 
@@ -0,0 +1,135 @@
+from typing import Dict, List, Tuple, Union
+
+import app.services.graph.components as csx_components
+import numpy as np
+from app.utils.timer import use_timing
+
+# Ego graphs reach at most this many hops, each hop can grow the subgraph by the neighbours of every node found so far
+MAX_EGO_HOPS = 10
+
+
+@use_timing
+def get_csr_adjacency(
+    graph_data: Dict,
+    edge_index: Union[np.ndarray, None] = None,
+    node_ids: Union[List[str], None] = None,
+) -> Dict:
+    """Get compressed sparse row adjacency of an undirected graph.
+
+    Neighbours of each node are ordered by descending edge weight, node positions follow the order of the graph nodes. Weights are kept along with the neighbours.
+    An edge index already built for the graph can be passed in to avoid building it again.
+    """
+
+    edges = graph_data["edges"]
+
+    if edge_index is None or node_ids is None:
+        edge_index, node_ids = csx_components.get_edge_index(
+            graph_data["nodes"], [(edge["source"], edge["target"]) for edge in edges]
+        )
+    weights = np.array([edge.get("weight", 1) for edge in edges], dtype=np.float64)
+
+    sources = np.concatenate([edge_index[:, 0], edge_index[:, 1]])
+    targets = np.concatenate([edge_index[:, 1], edge_index[:, 0]])
+    weights = np.concatenate([weights, weights])
+
+    order = np.lexsort((-weights, sources))
+
+    return {
+        "node_ids": node_ids,
+        "offsets": np.searchsorted(sources[order], np.arange(len(node_ids) + 1)),
+        "neighbours": targets[order],
+        "weights": weights[order],
+    }
+
+
+def get_adjacency(graph_data: Dict) -> Dict:
+    """Get cached adjacency of a graph, graphs stored without one or with one without weights get it built on the fly."""
+
+    if "weights" in graph_data.get("meta", {}).get("adjacency", {}):
+        return graph_data["meta"]["adjacency"]
+
+    return get_csr_adjacency(graph_data)
+
+
+def get_neighbours(
+    adjacency: Dict, frontier: np.ndarray, max_fanout: Union[int, None] = None
+) -> np.ndarray:
+    """Get the neighbours of all frontier nodes, at most max_fanout of the heaviest neighbours per node."""
+
+    starts = adjacency["offsets"][frontier]
+    counts = adjacency["offsets"][frontier + 1] - starts
+
+    if max_fanout is not None:
+        counts = np.minimum(counts, max_fanout)
+
+    # Positions of the selected neighbours within the neighbour array
+    group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    positions = np.repeat(starts, counts) + np.arange(counts.sum()) - group_starts
+
+    return adjacency["neighbours"][positions]
+
+
+@use_timing
+def get_ego_network(
+    adjacency: Dict,
+    seeds: np.ndarray,
+    hops: int,
+    max_fanouts: Union[List[int], None] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get all nodes within the given number of hops of the seed nodes and their distances using breadth first search.
+
+    Each hop can limit the number of neighbours followed from each node, the last limit applies to all further hops.
+    """
+
+    distances = np.full(len(adjacency["node_ids"]), -1, dtype=np.int64)
+    distances[seeds] = 0
+    frontier = np.unique(seeds)
+
+    for hop in range(1, hops + 1):
+        if len(frontier) == 0:
+            break
+
+        max_fanout = (
+            max_fanouts[min(hop, len(max_fanouts)) - 1] if max_fanouts else None
+        )
+        neighbours = np.unique(get_neighbours(adjacency, frontier, max_fanout))
+        frontier = neighbours[distances[neighbours] < 0]
+        distances[frontier] = hop
+
+    reached = np.flatnonzero(distances >= 0)
+
+    return reached, distances[reached]
+
+
+def get_ego_graph(
+    graph_data: Dict,
+    node_ids: List[str],
+    hops: int,
+    max_fanouts: Union[List[int], None] = None,
+) -> Dict:
+    """Get the subgraph of all nodes within the given number of hops of the given nodes."""
+
+    adjacency = get_adjacency(graph_data)
+    positions = {node_id: i for i, node_id in enumerate(adjacency["node_ids"])}
+    seeds = np.array(
+        [positions[node_id] for node_id in node_ids if node_id in positions],
+        dtype=np.int64,
+    )
+
+    reached, distances = get_ego_network(adjacency, seeds, hops, max_fanouts)
+    hop_counts = dict(
+        zip(
+            [adjacency["node_ids"][position] for position in reached.tolist()],
+            distances.tolist(),
+        )
+    )
+
+    return {
+        "nodes": [node for node in graph_data["nodes"] if node["id"] in hop_counts],
+        "edges": [
+            edge
+            for edge in graph_data["edges"]
+            if edge["source"] in hop_counts and edge["target"] in hop_counts
+        ],
+        "hops": hop_counts,
+    }
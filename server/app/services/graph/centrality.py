@@ -0,0 +1,171 @@
+from typing import Dict, List
+
+import app.services.graph.adjacency as csx_adjacency
+import numpy as np
+from app.types import CentralityEntry
+from app.utils.timer import use_timing
+from scipy import sparse
+
+# Betweenness searches from this many sources at once, memory grows with the vertex count times this
+BETWEENNESS_CHUNK_SIZE = 8
+
+
+def get_pagerank(
+    adjacency: sparse.csr_matrix,
+    damping: float = 0.85,
+    tolerance: float = 1e-8,
+    max_iterations: int = 100,
+) -> np.ndarray:
+    """Get PageRank of all vertices of a weighted undirected graph using power iteration."""
+
+    vertex_count = adjacency.shape[0]
+
+    if vertex_count == 0:
+        return np.zeros(0)
+
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    is_dangling = degrees == 0
+    transition = (
+        sparse.diags(
+            np.divide(1, degrees, out=np.zeros(vertex_count), where=~is_dangling)
+        )
+        @ adjacency
+    )
+    transition = transition.T.tocsr()
+
+    ranks = np.full(vertex_count, 1 / vertex_count)
+
+    for _ in range(max_iterations):
+        # Rank of dangling vertices is spread evenly over all vertices
+        new_ranks = (
+            damping * (transition @ ranks + ranks[is_dangling].sum() / vertex_count)
+            + (1 - damping) / vertex_count
+        )
+
+        if np.abs(new_ranks - ranks).sum() < vertex_count * tolerance:
+            return new_ranks
+
+        ranks = new_ranks
+
+    return ranks
+
+
+def get_dependencies(adjacency: sparse.csr_matrix, sources: np.ndarray) -> np.ndarray:
+    """Get summed dependencies of all vertices on shortest paths from the given sources of an unweighted graph.
+
+    Breadth first searches of all sources advance together level by level as sparse matrix products.
+    """
+
+    vertex_count = adjacency.shape[0]
+    source_count = len(sources)
+
+    # Number of shortest paths and distances from each source, one column per source
+    path_counts = np.zeros((vertex_count, source_count))
+    path_counts[sources, np.arange(source_count)] = 1
+    distances = np.full((vertex_count, source_count), -1, dtype=np.int64)
+    distances[sources, np.arange(source_count)] = 0
+
+    frontier = path_counts.copy()
+    level = 0
+
+    while frontier.any():
+        level += 1
+        reached = adjacency @ frontier
+        is_new = (reached > 0) & (distances < 0)
+        distances[is_new] = level
+        frontier = np.where(is_new, reached, 0)
+        path_counts += frontier
+
+    # Accumulate dependencies from the deepest level back to the sources
+    dependencies = np.zeros((vertex_count, source_count))
+    inverse_counts = np.divide(
+        1, path_counts, out=np.zeros_like(path_counts), where=path_counts > 0
+    )
+
+    for current in range(level - 1, 0, -1):
+        successors = np.where(
+            distances == current + 1, (1 + dependencies) * inverse_counts, 0
+        )
+        dependencies += np.where(
+            distances == current, path_counts * (adjacency @ successors), 0
+        )
+
+    return dependencies.sum(axis=1)
+
+
+def get_betweenness(
+    adjacency: sparse.csr_matrix, sample_size: int = 64, seed: int = 0
+) -> np.ndarray:
+    """Get approximate betweenness of all vertices of an unweighted undirected graph, normalised to [0, 1].
+
+    Runs Brandes' algorithm from a random sample of source vertices, a few sources at a time.
+    """
+
+    vertex_count = adjacency.shape[0]
+
+    if vertex_count < 3:
+        return np.zeros(vertex_count)
+
+    adjacency = (adjacency != 0).astype(np.float64).tocsr()
+    rng = np.random.default_rng(seed)
+    sources = (
+        np.arange(vertex_count)
+        if vertex_count <= sample_size
+        else rng.choice(vertex_count, sample_size, replace=False)
+    )
+
+    dependencies = np.zeros(vertex_count)
+
+    for start in range(0, len(sources), BETWEENNESS_CHUNK_SIZE):
+        dependencies += get_dependencies(
+            adjacency, sources[start : start + BETWEENNESS_CHUNK_SIZE]
+        )
+
+    betweenness = dependencies * (vertex_count / len(sources))
+
+    # Each undirected path is counted from both ends
+    return betweenness / ((vertex_count - 1) * (vertex_count - 2))
+
+
+def get_ranking(node_ids: List[str], values: np.ndarray) -> List[CentralityEntry]:
+    """Get nodes ordered by descending metric value."""
+
+    order = np.argsort(-values, kind="stable")
+
+    return [
+        {"id": node_ids[position], "value": float(values[position])}
+        for position in order.tolist()
+    ]
+
+
+def get_weighted_adjacency(adjacency: Dict) -> sparse.csr_matrix:
+    """Get weighted adjacency matrix from a compressed sparse row adjacency, self loops are dropped and parallel edges summed."""
+
+    vertex_count = len(adjacency["node_ids"])
+    sources = np.repeat(np.arange(vertex_count), np.diff(adjacency["offsets"]))
+    is_loop = sources == adjacency["neighbours"]
+
+    return sparse.csr_matrix(
+        (
+            adjacency["weights"][~is_loop],
+            (sources[~is_loop], adjacency["neighbours"][~is_loop]),
+        ),
+        shape=(vertex_count, vertex_count),
+    )
+
+
+@use_timing
+def get_centrality(graph_data: Dict) -> Dict[str, List[CentralityEntry]]:
+    """Get rankings of the nodes of a graph by degree, PageRank and approximate betweenness centrality."""
+
+    nodes = graph_data["nodes"]
+    cached_adjacency = csx_adjacency.get_adjacency(graph_data)
+    adjacency = get_weighted_adjacency(cached_adjacency)
+    node_ids = cached_adjacency["node_ids"][: len(nodes)]
+    degrees = np.asarray((adjacency != 0).sum(axis=1)).ravel()
+
+    return {
+        "degree": get_ranking(node_ids, degrees[: len(nodes)]),
+        "pagerank": get_ranking(node_ids, get_pagerank(adjacency)[: len(nodes)]),
+        "betweenness": get_ranking(node_ids, get_betweenness(adjacency)[: len(nodes)]),
+    }
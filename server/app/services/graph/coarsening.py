@@ -0,0 +1,257 @@
+from typing import Dict, List, Literal
+
+import app.services.graph.components as csx_components
+import app.services.graph.nodes as csx_nodes
+import numpy as np
+from app.types import Edge, Node
+from app.utils.timer import use_timing
+
+# Level of detail graphs are not served yet, the client cannot render cluster nodes or drill into them
+ClusterKey = Literal["community", "component"]
+
+
+def get_cluster_node_id(cluster: int) -> str:
+    return f"csx_cluster_{cluster}"
+
+
+def get_node_clusters(
+    nodes: List[Node], cluster_key: ClusterKey, max_clusters: int
+) -> np.ndarray:
+    """Get cluster of each node, clusters are numbered by descending size and all clusters beyond the limit are merged into the last one.
+
+    Nodes which all share the same key are split into chunks of equal size instead, so that drilling into a cluster always gets to smaller clusters.
+    """
+
+    max_clusters = max(max_clusters, 2)
+    keys = np.array([node.get(cluster_key, 0) for node in nodes], dtype=np.int64)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    if len(counts) == 1:
+        return np.arange(len(nodes), dtype=np.int64) * max_clusters // len(nodes)
+
+    order = np.argsort(-counts, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    return np.minimum(rank[inverse], max_clusters - 1)
+
+
+def get_edge_clusters(
+    nodes: List[Node], edges: List[Edge], clusters: np.ndarray
+) -> np.ndarray:
+    """Get clusters of the source and target of each edge, edges to unknown nodes get -1."""
+
+    node_clusters = {node["id"]: cluster for node, cluster in zip(nodes, clusters)}
+
+    return np.array(
+        [
+            (
+                node_clusters.get(edge["source"], -1),
+                node_clusters.get(edge["target"], -1),
+            )
+            for edge in edges
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+def get_cluster_nodes(nodes: List[Node], clusters: np.ndarray) -> List[Node]:
+    """Collapse the nodes of each cluster into a single node labelled by its largest member."""
+
+    cluster_count = int(clusters.max()) + 1 if len(clusters) > 0 else 0
+    sizes = np.array([node["size"] for node in nodes], dtype=np.float64)
+    frequencies = np.array(
+        [node.get("csx_frequency", 1) for node in nodes], dtype=np.int64
+    )
+    node_counts = np.bincount(clusters, minlength=cluster_count)
+    cluster_frequencies = np.bincount(
+        clusters, weights=frequencies, minlength=cluster_count
+    )
+
+    # Largest member of each cluster, the first one on ties
+    order = np.lexsort((-sizes, clusters))
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = clusters[order][1:] != clusters[order][:-1]
+    largest = np.zeros(cluster_count, dtype=np.int64)
+    largest[clusters[order][is_first]] = order[is_first]
+
+    positions = np.array(
+        [(node.get("x", np.nan), node.get("y", np.nan)) for node in nodes],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    has_position = ~np.isnan(positions).any(axis=1)
+    position_weights = np.where(has_position, sizes, 0)
+    position_totals = np.bincount(
+        clusters, weights=position_weights, minlength=cluster_count
+    )
+    centers = np.stack(
+        [
+            np.bincount(
+                clusters,
+                weights=np.where(has_position, positions[:, axis], 0)
+                * position_weights,
+                minlength=cluster_count,
+            )
+            for axis in range(2)
+        ],
+        axis=1,
+    )
+
+    entries = [set() for _ in range(cluster_count)]
+
+    for node, cluster in zip(nodes, clusters.tolist()):
+        entries[cluster].update(node["entries"])
+
+    cluster_sizes = csx_nodes.get_node_sizes(cluster_frequencies)
+    cluster_nodes = []
+
+    for cluster in range(cluster_count):
+        largest_node = nodes[largest[cluster]]
+        cluster_node = {
+            "id": get_cluster_node_id(cluster),
+            "feature": largest_node["feature"],
+            "label": largest_node["label"],
+            "csx_frequency": int(cluster_frequencies[cluster]),
+            "entries": list(entries[cluster]),
+            "csx_entry_frequency": len(entries[cluster]),
+            "community": cluster,
+            "component": 0,
+            "size": int(cluster_sizes[cluster]),
+            "cluster": cluster,
+            "node_count": int(node_counts[cluster]),
+        }
+
+        if position_totals[cluster] > 0:
+            cluster_node["x"] = float(centers[cluster, 0] / position_totals[cluster])
+            cluster_node["y"] = float(centers[cluster, 1] / position_totals[cluster])
+
+        cluster_nodes.append(cluster_node)
+
+    return cluster_nodes
+
+
+def get_cluster_edges(edges: List[Edge], edge_clusters: np.ndarray) -> List[Edge]:
+    """Merge edges between the same pair of clusters into a single edge weighted by the sum of their weights."""
+
+    weights = np.array([edge.get("weight", 1) for edge in edges], dtype=np.float64)
+    is_between = (edge_clusters >= 0).all(axis=1) & (
+        edge_clusters[:, 0] != edge_clusters[:, 1]
+    )
+    pairs = np.sort(edge_clusters[is_between], axis=1)
+
+    if len(pairs) == 0:
+        return []
+
+    cluster_count = pairs.max() + 1
+    pair_keys, pair_index, edge_counts = np.unique(
+        pairs[:, 0] * cluster_count + pairs[:, 1],
+        return_inverse=True,
+        return_counts=True,
+    )
+    pair_weights = np.bincount(pair_index, weights=weights[is_between])
+    sources = pair_keys // cluster_count
+    targets = pair_keys % cluster_count
+
+    return [
+        {
+            "id": f"{get_cluster_node_id(source)}_{get_cluster_node_id(target)}",
+            "source": get_cluster_node_id(source),
+            "target": get_cluster_node_id(target),
+            "visible": True,
+            "weight": int(pair_weights[i]),
+            "edge_count": int(edge_counts[i]),
+        }
+        for i, (source, target) in enumerate(zip(sources.tolist(), targets.tolist()))
+    ]
+
+
+@use_timing
+def get_coarse_graph(
+    graph_data: Dict, max_clusters: int, cluster_key: ClusterKey = "community"
+) -> Dict:
+    """Get level of detail graph where each community or component is collapsed into a single node.
+
+    At most max_clusters nodes are returned, edges between clusters carry the summed weight of the edges they replace.
+    """
+
+    clusters = get_node_clusters(graph_data["nodes"], cluster_key, max_clusters)
+    edge_clusters = get_edge_clusters(
+        graph_data["nodes"], graph_data["edges"], clusters
+    )
+
+    nodes = get_cluster_nodes(graph_data["nodes"], clusters)
+    edges = get_cluster_edges(graph_data["edges"], edge_clusters)
+
+    edge_index, node_ids = csx_components.get_edge_index(
+        nodes, [(edge["source"], edge["target"]) for edge in edges]
+    )
+    components = csx_components.get_components(nodes, edge_index, node_ids)
+    nodes = csx_nodes.enrich_with_neighbors(nodes, edge_index, node_ids)
+
+    coarse_graph = {
+        key: value
+        for key, value in graph_data.items()
+        if key not in ["nodes", "edges", "components", "connection_index"]
+    }
+
+    return {
+        **coarse_graph,
+        "nodes": nodes,
+        "edges": edges,
+        "components": components,
+        "level_of_detail": {
+            "cluster_key": cluster_key,
+            "cluster_count": len(nodes),
+            "node_count": len(graph_data["nodes"]),
+            "edge_count": len(graph_data["edges"]),
+        },
+    }
+
+
+@use_timing
+def get_cluster_graph(
+    graph_data: Dict,
+    path: List[int],
+    max_clusters: int,
+    cluster_key: ClusterKey = "community",
+) -> Dict:
+    """Get the subgraph of all nodes collapsed into a cluster of the level of detail graph.
+
+    The path lists the cluster drilled into on each level, subgraphs with more nodes than the limit are collapsed into clusters again.
+    """
+
+    nodes = graph_data["nodes"]
+
+    for cluster in path:
+        clusters = get_node_clusters(nodes, cluster_key, max_clusters)
+        nodes = [
+            node
+            for node, node_cluster in zip(nodes, clusters.tolist())
+            if node_cluster == cluster
+        ]
+
+    node_ids = set(node["id"] for node in nodes)
+
+    cluster_graph = {
+        "nodes": nodes,
+        "edges": [
+            edge
+            for edge in graph_data["edges"]
+            if edge["source"] in node_ids and edge["target"] in node_ids
+        ],
+        "components": [
+            component
+            for component in graph_data["components"]
+            if not node_ids.isdisjoint(component["nodes"])
+        ],
+    }
+
+    if len(nodes) <= max_clusters:
+        return cluster_graph
+
+    coarse_graph = get_coarse_graph(cluster_graph, max_clusters, cluster_key)
+
+    return {
+        **coarse_graph,
+        "level_of_detail": {**coarse_graph["level_of_detail"], "path": path},
+    }
@@ -0,0 +1,259 @@
+import logging
+import time
+from typing import Tuple, Union
+
+import numpy as np
+from app.utils.timer import use_timing
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Share of the improving vertices that move in each sweep, moving all of them at once makes neighbours swap communities
+MOVE_PROBABILITY = 0.5
+
+# Vertices stop moving within a level after this many sweeps or once fewer than this share of them can improve
+MAX_SWEEPS = 8
+MIN_MOVING_SHARE = 0.01
+
+# Communities are merged at most this many times, modularity rarely improves after a handful of levels
+MAX_LEVELS = 10
+
+
+def get_adjacency(
+    vertex_count: int, edges: np.ndarray, weights: Union[np.ndarray, None] = None
+) -> sparse.csr_matrix:
+    """Get symmetric weighted adjacency matrix of an undirected graph, edges are pairs of vertex positions."""
+
+    if weights is None:
+        weights = np.ones(len(edges), dtype=np.float64)
+
+    edges = edges.reshape(-1, 2)
+    is_loop = edges[:, 0] == edges[:, 1]
+    edges = edges[~is_loop]
+    weights = np.asarray(weights, dtype=np.float64)[~is_loop]
+
+    return sparse.csr_matrix(
+        (
+            np.concatenate([weights, weights]),
+            (
+                np.concatenate([edges[:, 0], edges[:, 1]]),
+                np.concatenate([edges[:, 1], edges[:, 0]]),
+            ),
+        ),
+        shape=(vertex_count, vertex_count),
+    )
+
+
+def get_modularity(
+    adjacency: sparse.csr_matrix, labels: np.ndarray, resolution: float = 1.0
+) -> float:
+    """Get modularity of a partition of the vertices of a weighted graph."""
+
+    coo = adjacency.tocoo()
+
+    return get_edge_modularity(
+        coo.row,
+        coo.col,
+        coo.data,
+        np.asarray(adjacency.sum(axis=1)).ravel(),
+        labels,
+        resolution,
+    )
+
+
+def get_edge_modularity(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    weights: np.ndarray,
+    degrees: np.ndarray,
+    labels: np.ndarray,
+    resolution: float,
+) -> float:
+    """Get modularity of a partition from the entries of a symmetric adjacency matrix."""
+
+    total_weight = degrees.sum()
+
+    if total_weight == 0:
+        return 0.0
+
+    internal_weight = weights[labels[rows] == labels[columns]].sum()
+    community_degrees = np.bincount(labels, weights=degrees)
+
+    return float(
+        internal_weight / total_weight
+        - resolution * ((community_degrees / total_weight) ** 2).sum()
+    )
+
+
+def get_best_moves(
+    rows: np.ndarray,
+    columns: np.ndarray,
+    weights: np.ndarray,
+    degrees: np.ndarray,
+    labels: np.ndarray,
+    resolution: float,
+) -> np.ndarray:
+    """Get the neighbouring community with the largest modularity gain for each vertex, vertices without an improving move keep their label.
+
+    The adjacency entries must not contain self loops, those move together with their vertex and do not affect the gain.
+    """
+
+    vertex_count = len(labels)
+    total_weight = degrees.sum()
+
+    # Weight from each vertex to each neighbouring community
+    pairs, pair_index = np.unique(
+        rows * vertex_count + labels[columns], return_inverse=True
+    )
+    pair_weights = np.bincount(pair_index, weights=weights)
+    pair_vertices = pairs // vertex_count
+    pair_labels = pairs % vertex_count
+
+    own_weights = np.zeros(vertex_count)
+    is_own = pair_labels == labels[pair_vertices]
+    own_weights[pair_vertices[is_own]] = pair_weights[is_own]
+
+    community_degrees = np.bincount(labels, weights=degrees, minlength=vertex_count)
+    vertex_degrees = degrees[pair_vertices]
+
+    gains = (
+        pair_weights - own_weights[pair_vertices]
+    ) - resolution * vertex_degrees * (
+        community_degrees[pair_labels]
+        - community_degrees[labels[pair_vertices]]
+        + vertex_degrees
+    ) / total_weight
+
+    # Sort candidates by vertex and gain to pick the best candidate of each vertex
+    order = np.lexsort((-gains, pair_vertices))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_vertices[order][1:] != pair_vertices[order][:-1]
+    best = order[first & ~is_own[order]]
+    best = best[gains[best] > 1e-12]
+
+    moves = labels.copy()
+    moves[pair_vertices[best]] = pair_labels[best]
+
+    return moves
+
+
+def move_vertices(
+    adjacency: sparse.csr_matrix,
+    labels: np.ndarray,
+    resolution: float,
+    rng: np.random.Generator,
+    deadline: Union[float, None] = None,
+    max_sweeps: int = MAX_SWEEPS,
+) -> Tuple[np.ndarray, bool]:
+    """Move vertices between neighbouring communities as long as modularity improves.
+
+    Returns the new labels and whether moving stopped at the deadline.
+    """
+
+    coo = adjacency.tocoo()
+    degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+    is_loop = coo.row == coo.col
+    rows = coo.row[~is_loop].astype(np.int64)
+    columns = coo.col[~is_loop].astype(np.int64)
+    weights = coo.data[~is_loop]
+
+    modularity = get_edge_modularity(
+        coo.row, coo.col, coo.data, degrees, labels, resolution
+    )
+    move_probability = MOVE_PROBABILITY
+
+    for _ in range(max_sweeps):
+        if deadline is not None and time.perf_counter() > deadline:
+            return labels, True
+
+        moves = get_best_moves(rows, columns, weights, degrees, labels, resolution)
+        is_moving = moves != labels
+
+        # Few remaining moves are left to the next level where they are cheaper
+        if is_moving.sum() <= MIN_MOVING_SHARE * len(labels):
+            break
+
+        is_moving &= rng.random(len(labels)) < move_probability
+        new_labels = np.where(is_moving, moves, labels)
+        new_modularity = get_edge_modularity(
+            coo.row, coo.col, coo.data, degrees, new_labels, resolution
+        )
+
+        if new_modularity <= modularity:
+            move_probability /= 2
+
+            if move_probability < 0.01:
+                break
+
+            continue
+
+        labels, modularity = new_labels, new_modularity
+
+    return labels, False
+
+
+@use_timing
+def get_communities(
+    vertex_count: int,
+    edges: np.ndarray,
+    weights: Union[np.ndarray, None] = None,
+    resolution: float = 1.0,
+    time_limit: Union[float, None] = None,
+    seed: int = 0,
+    max_levels: int = MAX_LEVELS,
+) -> np.ndarray:
+    """Get Louvain style community labels of all vertices, edges are pairs of vertex positions.
+
+    Vertices are moved between communities, then communities are merged into single vertices and moved again until modularity stops improving or max_levels levels are done.
+    The work is bounded by the number of levels and sweeps, so the same graph always gets the same communities. The time limit in seconds is only a safety cap, graphs which hit it get the communities found so far.
+    Higher resolutions result in more and smaller communities, community 0 is the largest one.
+    """
+
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    rng = np.random.default_rng(seed)
+
+    adjacency = get_adjacency(vertex_count, edges, weights)
+    labels = np.arange(vertex_count)
+
+    level_adjacency = adjacency
+    level_labels = np.arange(vertex_count)
+
+    for level in range(max_levels):
+        moved_labels, is_out_of_time = move_vertices(
+            level_adjacency, level_labels, resolution, rng, deadline
+        )
+
+        if is_out_of_time:
+            logger.warning(
+                "Community detection hit its time limit of %s seconds at level %s",
+                time_limit,
+                level,
+            )
+
+        if (moved_labels == level_labels).all():
+            break
+
+        # Each community of the current level becomes a single vertex of the next level
+        _, moved_labels = np.unique(moved_labels, return_inverse=True)
+        labels = moved_labels[labels]
+
+        if is_out_of_time:
+            break
+
+        aggregation = sparse.csr_matrix(
+            (
+                np.ones(len(moved_labels)),
+                (np.arange(len(moved_labels)), moved_labels),
+            ),
+            shape=(len(moved_labels), moved_labels.max() + 1),
+        )
+        level_adjacency = (aggregation.T @ level_adjacency @ aggregation).tocsr()
+        level_labels = np.arange(level_adjacency.shape[0])
+
+    # Number communities by descending size so that ids do not depend on the order communities were merged in
+    _, labels, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    return rank[labels]
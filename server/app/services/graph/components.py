@@ -1,67 +1,122 @@
 from collections import Counter
-from typing import List, Tuple, cast, Union
+from typing import Dict, List, Tuple, cast
 
-import networkx as nx
-from app.types import Component, ConnectionCount, Edge, Node
+import numpy as np
+from app.types import Component, ConnectionCount, ConnectionIndexEntry, Edge, Node
 from app.utils.timer import use_timing
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+def get_edge_index(
+    nodes: List[Node], edges: List[Tuple[str, str]]
+) -> Tuple[np.ndarray, List[str]]:
+    """Get edges as pairs of positions into the returned node id list.
+
+    The given nodes come first, nodes which are only referenced by edges are appended after them.
+    """
+
+    node_index = {node["id"]: i for i, node in enumerate(nodes)}
+    node_ids = [node["id"] for node in nodes]
+
+    # Edges can reference nodes that are not in the node list, those still connect components
+    for edge in edges:
+        for node_id in edge:
+            if node_id not in node_index:
+                node_index[node_id] = len(node_ids)
+                node_ids.append(node_id)
+
+    edge_index = np.fromiter(
+        (node_index[node_id] for edge in edges for node_id in edge),
+        dtype=np.int64,
+        count=2 * len(edges),
+    ).reshape(-1, 2)
+
+    return edge_index, node_ids
+
+
+def get_component_labels(vertex_count: int, edges: np.ndarray) -> np.ndarray:
+    """Label each vertex with the id of its connected component using a single sweep over the sparse adjacency matrix."""
+
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])),
+        shape=(vertex_count, vertex_count),
+    )
+
+    _, labels = csgraph.connected_components(adjacency, directed=False)
+
+    return labels
+
+
+def get_node_components(components: List[Component]) -> Dict[str, int]:
+    """Get lookup of component ids by node id."""
+
+    return {
+        node_id: component["id"]
+        for component in components
+        for node_id in component["nodes"]
+    }
 
 
 @use_timing
 def get_components(
-    nodes: List[Node],
-    edges: List[Tuple[str, str]],
-    graph: Union[nx.Graph, None] = None,
+    nodes: List[Node], edges: np.ndarray, node_ids: List[str]
 ) -> List[Component]:
-    """Extract components from given nodes and edges."""
+    """Extract components from given nodes and edges, edges are pairs of positions into the node id list."""
 
-    if not graph:
-        graph = nx.Graph()
-        graph.add_nodes_from([node["id"] for node in nodes])
-        graph.add_edges_from(edges)
+    labels = get_component_labels(len(node_ids), edges)
 
-    # Extract the actual component nodes and edges
-    components = []
-    components_with_large_nodes = []
+    component_count = labels.max() + 1 if len(labels) > 0 else 0
+    node_labels = labels[: len(nodes)]
+    node_sizes = np.array([node["size"] for node in nodes], dtype=np.float64)
 
-    for i, component in enumerate(nx.connected_components(graph)):
-        new_component = {"id": i, "node_count": 0, "largest_nodes": [], "nodes": []}
+    node_counts = np.bincount(node_labels, minlength=component_count)
 
-        component_nodes = []
-        largest_size = 0
-        component_entries = []
-        node_sizes = []
-        unique_node_sizes = set()
+    largest_sizes = np.full(component_count, -np.inf)
+    np.maximum.at(largest_sizes, node_labels, node_sizes)
 
-        for node in nodes:
-            if node["id"] in component:
-                node["component"] = i
-                new_component["node_count"] += 1
+    smallest_sizes = np.full(component_count, np.inf)
+    np.minimum.at(smallest_sizes, node_labels, node_sizes)
 
-                component_entries += node["entries"]
-                node_sizes.append(node["size"])
+    # Only components with nodes of different sizes have largest nodes
+    has_large_nodes = largest_sizes > smallest_sizes
 
-                unique_node_sizes.add(node["size"])
+    component_nodes = [set() for _ in range(component_count)]
+    component_entries = [set() for _ in range(component_count)]
+    largest_nodes = [[] for _ in range(component_count)]
 
-                if largest_size < node["size"]:
-                    largest_size = node["size"]
+    for node_id, label in zip(node_ids, labels.tolist()):
+        component_nodes[label].add(node_id)
 
-                component_nodes.append(node)
+    for node, label in zip(nodes, node_labels.tolist()):
+        node["component"] = label
+        component_entries[label].update(node["entries"])
 
-        if len(unique_node_sizes) > 1:
-            new_component["largest_nodes"] = list(
-                filter(lambda node: node["size"] == largest_size, component_nodes)
-            )
+        if has_large_nodes[label] and node["size"] == largest_sizes[label]:
+            largest_nodes[label].append(node)
 
-        new_component["entries"] = list(set(component_entries))
-        new_component["nodes"] = component
-        new_component["selectedNodesCount"] = 0
-        new_component["isSelected"] = False
+    # Extract the actual component nodes and edges
+    components = []
+    components_with_large_nodes = []
 
-        if new_component["node_count"] > 1:
-            if new_component["largest_nodes"]:
-                components_with_large_nodes.append(new_component)
-            else:
-                components.append(new_component)
+    for i in range(component_count):
+        if node_counts[i] <= 1:
+            continue
+
+        new_component = {
+            "id": i,
+            "node_count": int(node_counts[i]),
+            "largest_nodes": largest_nodes[i],
+            "nodes": component_nodes[i],
+            "entries": list(component_entries[i]),
+            "selectedNodesCount": 0,
+            "isSelected": False,
+        }
+
+        if new_component["largest_nodes"]:
+            components_with_large_nodes.append(new_component)
+        else:
+            components.append(new_component)
 
     components.sort(key=lambda component: component["node_count"], reverse=True)
     components_with_large_nodes.sort(
@@ -73,23 +128,68 @@ def get_components(
 
 @use_timing
 def enrich_with_top_connections(
-    components: List[Component], edges: List[Edge]
+    components: List[Component],
+    connection_index: List[ConnectionIndexEntry],
+    nodes: List[Node],
+    edges: List[Edge],
 ) -> List[Component]:
-    """Enrich components with top components"""
-    for component in components:
-        component_connections = [
-            edge["connections"]
-            for edge in edges
-            if edge["component"] == component["id"]
-        ]
+    """Enrich components with top connections, a connection is counted once for each edge of the component whose anchors share it.
 
-        connections = []
+    Sparsified graphs do not keep an edge for every pair of anchors sharing a connection, so pairs are counted from the kept edges.
+    """
+    node_components = {node["id"]: node["component"] for node in nodes}
+    component_connections = {component["id"]: Counter() for component in components}
 
-        for subconnections in component_connections:
-            if subconnections:
-                connections.extend([(c["feature"], c["label"]) for c in subconnections])
+    anchor_positions = {}
+    anchor_index = []
+    link_index = []
 
-        connection_counts = Counter(connections).most_common(5)
+    for i, connection in enumerate(connection_index):
+        for anchor in connection["anchors"]:
+            anchor_index.append(
+                anchor_positions.setdefault(anchor, len(anchor_positions))
+            )
+            link_index.append(i)
+
+    edges = [
+        edge
+        for edge in edges
+        if edge["source"] in anchor_positions and edge["target"] in anchor_positions
+    ]
+
+    if edges:
+        incidence = sparse.csr_matrix(
+            (np.ones(len(anchor_index), dtype=np.int64), (anchor_index, link_index)),
+            shape=(len(anchor_positions), len(connection_index)),
+        )
+
+        # Connections shared by the anchors of each edge, one row per edge
+        shared = (
+            incidence[[anchor_positions[edge["source"]] for edge in edges]]
+            .multiply(incidence[[anchor_positions[edge["target"]] for edge in edges]])
+            .tocsr()
+        )
+        edge_components = np.array(
+            [node_components[edge["source"]] for edge in edges], dtype=np.int64
+        )
+
+        keys, counts = np.unique(
+            np.repeat(edge_components, np.diff(shared.indptr)) * len(connection_index)
+            + shared.indices,
+            return_counts=True,
+        )
+
+        # Keys are ordered by connection within each component, so ties keep the order of the connection index
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            component_id, i = divmod(key, len(connection_index))
+
+            if component_id in component_connections:
+                component_connections[component_id][
+                    (connection_index[i]["feature"], connection_index[i]["label"])
+                ] = count
+
+    for component in components:
+        connection_counts = component_connections[component["id"]].most_common(5)
 
         component["largest_connections"] = [
             cast(
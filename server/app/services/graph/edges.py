@@ -1,12 +1,39 @@
+import threading
 import uuid
-from collections import Counter
-from itertools import combinations, permutations, product
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from itertools import combinations, permutations
 from typing import Dict, List, Literal, Set, Tuple, Union, cast
 
+import app.services.graph.components as csx_components
+import app.services.graph.sparsification as csx_sparsification
 import networkx as nx
+import numpy as np
 import pandas as pd
-from app.types import Component, Edge, Node, SchemaElement
+import polars as pl
+from app.services.graph.node_table import NodeTable
+from app.types import (
+    Component,
+    ConnectionIndexEntry,
+    Edge,
+    EdgeConnection,
+    SchemaElement,
+    SparsificationMethod,
+    SparsificationReport,
+)
 from app.utils.timer import use_timing
+from scipy import sparse
+
+# Rows with more distinct values in a list feature do not get co-occurrence edges, the number of pairs grows quadratically
+MAX_COOCCURRENCE_LIST_LENGTH = 50
+
+# Number of schema path plans kept in memory, plans are keyed by dataset, schema, features and visible features
+MAX_SCHEMA_PATH_PLANS = 256
+
+schema_path_plans: OrderedDict = OrderedDict()
+
+# Requests are served from a thread pool, plans are computed while holding the lock so that an invalidated plan is never stored again
+schema_path_plans_lock = threading.Lock()
 
 
 @use_timing
@@ -15,18 +42,35 @@ def get_edge_tuples(
     features: List[str],
     visible_features: List[str],
     schema: List[SchemaElement],
-    entries_with_nodes: Dict,
-    node_ids_with_labels: Dict,
-) -> List[Tuple[str, str]]:
-    """Get node tuples that represent the graphs edges."""
-
-    shortest_paths = get_shortest_schema_paths(features, visible_features, schema)
+    table: NodeTable,
+    index: str,
+) -> List[Tuple[int, int]]:
+    """Get node id tuples that represent the graphs edges."""
+
+    shortest_paths = get_schema_path_plan(index, features, visible_features, schema)
+    cooccurrence_features = get_cooccurrence_features(visible_features, schema)
+
+    path_df = get_path_frame(
+        df,
+        shortest_paths
+        + [
+            [{"src": feature, "dest": feature, "relationship": "manyToMany"}]
+            for feature in cooccurrence_features
+        ],
+    )
+    incidences = {}
 
     edge_tuples = []
 
     for path in shortest_paths:
+        edge_tuples.extend(get_edges_based_on_path(path_df, path, table, incidences))
+
+    for feature in cooccurrence_features:
         edge_tuples.extend(
-            get_edges_based_on_path(df, path, entries_with_nodes, node_ids_with_labels)
+            get_cooccurrence_edges(path_df, feature, table, incidences)
+            .select(["src", "dest"])
+            .collect()
+            .rows()
         )
 
     return edge_tuples
@@ -37,105 +81,378 @@ def get_overview_edge_tuples(
     df: pd.DataFrame,
     anchor: str,
     links: List[str],
-    nodes: List[Node],
-    entries_with_nodes: Dict,
-    node_ids_with_labels: Dict,
-) -> Dict:
-    """Generate dictionary with edges as keys and their properties as values"""
+    table: NodeTable,
+    max_connections: Union[int, None] = None,
+    sparsification: Union[SparsificationMethod, None] = None,
+    sparsification_parameter: Union[float, None] = None,
+    max_edges: Union[int, None] = None,
+) -> Tuple[Dict, List[ConnectionIndexEntry], Union[SparsificationReport, None]]:
+    """Generate dictionary with node id tuples as keys and edge properties as values and the connection index of the overview graph.
+
+    Edges can optionally be sparsified, the report of dropped edges is returned along with them.
+    """
     overview_schema_paths = get_overview_graph_schema(anchor, links)
 
-    candidate_edges = []
+    path_df = get_path_frame(df, overview_schema_paths)
+    incidences = {}
+
+    # Unique anchor node to link node pairs
+    link_incidence = (
+        pl.concat(
+            [
+                get_path_edges(path_df, path, table, incidences).select(["src", "dest"])
+                for path in overview_schema_paths
+            ]
+        )
+        .unique()
+        .collect()
+    )
+
+    if link_incidence.height == 0:
+        return {}, [], None
+
+    anchor_ids, anchor_index = np.unique(
+        link_incidence.get_column("src").to_numpy(), return_inverse=True
+    )
+    link_ids, link_index = np.unique(
+        link_incidence.get_column("dest").to_numpy(), return_inverse=True
+    )
+
+    # Rank links by the number of anchors they connect so that connection samples contain the most prominent links
+    link_order = np.argsort(-np.bincount(link_index), kind="stable")
+    link_rank = np.empty(len(link_ids), dtype=np.int64)
+    link_rank[link_order] = np.arange(len(link_ids))
+
+    link_ids = link_ids[link_order]
+    link_index = link_rank[link_index]
+
+    incidence = get_incidence_matrix(
+        anchor_index, link_index, len(anchor_ids), len(link_ids)
+    )
+    projection = get_projection_weights(incidence)
+    report = None
+
+    # Dropped edges are removed before their connections are collected
+    if sparsification is not None:
+        projection, report = csx_sparsification.sparsify_edges(
+            projection,
+            len(anchor_ids),
+            sparsification,
+            sparsification_parameter,
+            max_edges,
+        )
+
+    shared_links = get_shared_links(incidence, projection)
+    projection = projection.with_columns(
+        get_projection_connections(shared_links, max_connections)
+    )
+
+    # Links of dropped edges do not connect anchors of the sparsified graph, links keep their rank among all links
+    if report:
+        anchor_index, link_index = get_edge_incidence(shared_links, projection)
+
+    link_connections = [
+        {"label": table.labels[link_id], "feature": table.get_feature(link_id)}
+        for link_id in link_ids.tolist()
+    ]
+    anchor_ids = anchor_ids.tolist()
+
+    edge_tuple_lookup = {
+        (anchor_ids[source], anchor_ids[target]): {
+            "weight": weight,
+            "connections": [link_connections[link] for link in connections],
+        }
+        for source, target, weight, connections in projection.iter_rows()
+    }
+
+    connection_index = get_connection_index(
+        table.get_ids(np.array(anchor_ids, dtype=np.int64)).tolist(),
+        anchor_index,
+        link_index,
+        link_connections,
+    )
+
+    return edge_tuple_lookup, connection_index, report
+
+
+def get_connection_index(
+    anchor_ids: List[str],
+    anchor_index: np.ndarray,
+    link_index: np.ndarray,
+    link_connections: List[Dict],
+) -> List[ConnectionIndexEntry]:
+    """Get list of links with the anchors they connect, ordered by the number of connected anchors, links without anchors are left out."""
+
+    link_order = np.argsort(link_index, kind="stable")
+    link_bounds = np.searchsorted(
+        link_index[link_order], np.arange(len(link_connections) + 1)
+    )
+    sorted_anchors = np.array(anchor_ids, dtype=object)[anchor_index[link_order]]
+
+    return [
+        {
+            **connection,
+            "anchors": sorted_anchors[link_bounds[i] : link_bounds[i + 1]].tolist(),
+        }
+        for i, connection in enumerate(link_connections)
+        if link_bounds[i + 1] > link_bounds[i]
+    ]
+
+
+def get_connection_index_from_edges(edges: List[Edge]) -> List[ConnectionIndexEntry]:
+    """Rebuild connection index from edges that store all of their connections."""
+
+    connection_anchors = {}
+
+    for edge in edges:
+        for connection in edge["connections"] or []:
+            key = (connection["feature"], connection["label"])
+
+            if key not in connection_anchors:
+                connection_anchors[key] = set()
+
+            connection_anchors[key].update([edge["source"], edge["target"]])
+
+    return sorted(
+        [
+            {"feature": key[0], "label": key[1], "anchors": list(anchors)}
+            for key, anchors in connection_anchors.items()
+        ],
+        key=lambda connection: -len(connection["anchors"]),
+    )
+
+
+def get_connection_lookup(connection_index: List[ConnectionIndexEntry]) -> Dict:
+    """Get positions of the connections of each anchor in the connection index.
+
+    Anchors are sorted so that the connections of the endpoints of an edge are found by binary search instead of scanning the index.
+    """
+
+    counts = np.array(
+        [len(connection["anchors"]) for connection in connection_index],
+        dtype=np.int64,
+    )
+    anchors, anchor_index = np.unique(
+        np.array(
+            [
+                anchor
+                for connection in connection_index
+                for anchor in connection["anchors"]
+            ],
+            dtype=object,
+        ),
+        return_inverse=True,
+    )
+    order = np.argsort(anchor_index, kind="stable")
+
+    return {
+        "anchors": anchors.tolist(),
+        "offsets": np.concatenate(
+            [[0], np.cumsum(np.bincount(anchor_index, minlength=len(anchors)))]
+        ).astype(np.int64),
+        "connections": np.repeat(np.arange(len(connection_index)), counts)[order],
+    }
+
+
+def get_anchor_connections(connection_lookup: Dict, anchor: str) -> np.ndarray:
+    anchors = connection_lookup["anchors"]
+    i = bisect_left(anchors, anchor)
 
-    for path in overview_schema_paths:
-        candidate_edges.extend(
-            get_edges_based_on_path(df, path, entries_with_nodes, node_ids_with_labels)
+    if i == len(anchors) or anchors[i] != anchor:
+        return np.array([], dtype=np.int64)
+
+    offsets = connection_lookup["offsets"]
+
+    return connection_lookup["connections"][offsets[i] : offsets[i + 1]]
+
+
+def get_edge_connections(
+    connection_index: List[ConnectionIndexEntry], connection_lookup: Dict, edge: Edge
+) -> List[EdgeConnection]:
+    """Get all links shared by the source and target of an overview edge, ordered like the connection index."""
+
+    shared = np.intersect1d(
+        get_anchor_connections(connection_lookup, edge["source"]),
+        get_anchor_connections(connection_lookup, edge["target"]),
+    )
+
+    return [
+        cast(
+            EdgeConnection,
+            {
+                "label": connection_index[i]["label"],
+                "feature": connection_index[i]["feature"],
+            },
         )
+        for i in shared.tolist()
+    ]
+
+
+def trim_connection_index(
+    connection_index: List[ConnectionIndexEntry], node_ids: Set[str]
+) -> List[ConnectionIndexEntry]:
+    """Remove anchors which are no longer part of the graph from connection index."""
+
+    trimmed_index = []
+
+    for connection in connection_index:
+        anchors = [anchor for anchor in connection["anchors"] if anchor in node_ids]
+
+        if len(anchors) > 0:
+            trimmed_index.append({**connection, "anchors": anchors})
+
+    return sorted(trimmed_index, key=lambda connection: -len(connection["anchors"]))
+
+
+def get_incidence_matrix(
+    anchor_index: np.ndarray, link_index: np.ndarray, anchor_count: int, link_count: int
+) -> sparse.csr_matrix:
+    return sparse.csr_matrix(
+        (np.ones(len(anchor_index), dtype=np.int64), (anchor_index, link_index)),
+        shape=(anchor_count, link_count),
+    )
+
+
+def get_projection_weights(incidence: sparse.csr_matrix) -> pl.DataFrame:
+    """Get number of shared links for each pair of anchors from the sparse anchor link incidence matrix."""
+
+    # Only the upper triangle is needed since the projection is symmetric and self loops are not edges
+    projection = sparse.triu(incidence @ incidence.T, k=1).tocoo()
+
+    return pl.DataFrame(
+        {
+            "source": projection.row.astype(np.int64),
+            "target": projection.col.astype(np.int64),
+            "weight": projection.data.astype(np.int64),
+        }
+    )
 
-    graph = nx.MultiGraph()
-    graph.add_nodes_from([node["id"] for node in nodes])
-    graph.add_edges_from(candidate_edges)
 
-    edge_tuple_lookup = {}
+def get_shared_links(
+    incidence: sparse.csr_matrix, pairs: pl.DataFrame
+) -> sparse.csr_matrix:
+    """Get matrix of the links shared by each of the given pairs of anchors.
 
-    link_nodes = [node["id"] for node in nodes if node["feature"] in links]
+    Shared links are the element wise product of the incidence rows of both anchors, so only pairs that are edges are visited.
+    """
 
-    for node in graph.nodes:
-        if node in link_nodes:
-            temp_new_edge_tuples = combinations(list(graph.neighbors(node)), 2)
+    shared = (
+        incidence[pairs.get_column("source").to_numpy()]
+        .multiply(incidence[pairs.get_column("target").to_numpy()])
+        .tocsr()
+    )
+    shared.sort_indices()
+
+    return shared
+
+
+def get_edge_incidence(
+    shared: sparse.csr_matrix, pairs: pl.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get unique anchor link pairs of the links shared by the given pairs of anchors."""
+
+    rows = np.repeat(np.arange(pairs.height), np.diff(shared.indptr))
+    anchors = np.concatenate(
+        [
+            pairs.get_column("source").to_numpy()[rows],
+            pairs.get_column("target").to_numpy()[rows],
+        ]
+    ).astype(np.int64)
+    links = np.concatenate([shared.indices, shared.indices]).astype(np.int64)
+
+    keys = np.unique(anchors * shared.shape[1] + links)
+
+    return keys // shared.shape[1], keys % shared.shape[1]
 
-            node_instance = [
-                node_instance for node_instance in nodes if node_instance["id"] == node
-            ][0]
 
-            for edge in temp_new_edge_tuples:
-                if edge in edge_tuple_lookup:
-                    edge_tuple_lookup[edge].append(
-                        {
-                            "label": node_instance["label"],
-                            "feature": node_instance["feature"],
-                        }
-                    )
-                else:
-                    edge_tuple_lookup[edge] = [
-                        {
-                            "label": node_instance["label"],
-                            "feature": node_instance["feature"],
-                        }
-                    ]
+def get_projection_connections(
+    shared: sparse.csr_matrix, max_connections: Union[int, None] = None
+) -> pl.Series:
+    """Get list of shared links for each pair of anchors from the matrix of shared links, optionally capped to the top ranked links.
 
-    return edge_tuple_lookup
+    Links of each pair are ordered by rank, so capped lists are cut before they are collected.
+    """
+
+    counts = np.diff(shared.indptr)
+    rows = np.repeat(np.arange(shared.shape[0]), counts)
+    links = shared.indices.astype(np.int64)
+
+    if max_connections is not None:
+        # Pairs without a kept link would drop out of the groups below
+        if max_connections < 1:
+            raise ValueError("Edges keep at least one connection")
+
+        is_kept = np.arange(shared.nnz) - shared.indptr[rows] < max_connections
+        rows = rows[is_kept]
+        links = links[is_kept]
+
+    # Every pair shares at least one link, so each pair gets a group
+    return (
+        pl.DataFrame({"row": rows, "connections": links})
+        .groupby("row", maintain_order=True)
+        .agg(pl.col("connections"))
+        .get_column("connections")
+    )
 
 
 @use_timing
-def get_overview_edges(edge_tuple_lookup: Dict, nx_edges: List[str]) -> List[Edge]:
-    """Generate a position for each node in graph."""
+def get_overview_edges(
+    edge_tuple_lookup: Dict, nx_edges: List[Tuple[int, int]], table: NodeTable
+) -> List[Edge]:
+    """Get list of overview edge objects that can be used by the frontend."""
 
-    edge_tuples_counts = Counter(nx_edges)
+    edge_tuples_counts = list(Counter(nx_edges))
+    sources, targets = get_edge_node_ids(edge_tuples_counts, table)
 
     return [
         cast(
             Edge,
             {
                 "id": uuid.uuid4().hex,
-                "source": edge[0],
-                "target": edge[1],
+                "source": sources[i],
+                "target": targets[i],
                 "visible": True,
-                "weight": len(edge_tuple_lookup[edge]),
-                "connections": edge_tuple_lookup[edge],
+                "weight": edge_tuple_lookup[edge]["weight"],
+                "connections": edge_tuple_lookup[edge]["connections"],
             },
         )
-        for edge in edge_tuples_counts
+        for i, edge in enumerate(edge_tuples_counts)
     ]
 
 
 @use_timing
-def get_edges(edge_tuples: List[Tuple[str, str]]) -> List[Edge]:
+def get_edges(edge_tuples: List[Tuple[int, int]], table: NodeTable) -> List[Edge]:
     """Get list of edge objects that can be used by the frontend."""
 
     edge_tuples_counts = Counter(edge_tuples)
+    sources, targets = get_edge_node_ids(list(edge_tuples_counts), table)
 
     return [
         cast(
             Edge,
             {
                 "id": uuid.uuid4().hex,
-                "source": edge[0],
-                "target": edge[1],
+                "source": sources[i],
+                "target": targets[i],
                 "visible": True,
-                "weight": edge_tuples_counts[edge],
+                "weight": weight,
             },
         )
-        for edge in edge_tuples_counts
+        for i, weight in enumerate(edge_tuples_counts.values())
     ]
 
 
-@use_timing
-def get_nx_edges(edge_tuples: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
-    """Get edges which can be used directly in a networkx graph."""
+def get_edge_node_ids(
+    edge_tuples: List[Tuple[int, int]], table: NodeTable
+) -> Tuple[List[str], List[str]]:
+    """Get stable string ids of the source and target nodes of the given edges."""
 
-    # edge_tuples_counts = list(set(edge_tuples))
-    return list(set(edge_tuples))
-    # return [(node_lookup[edge[0]], node_lookup[edge[1]]) for edge in edge_tuples_counts]
+    edge_array = np.array(edge_tuples, dtype=np.int64).reshape(-1, 2)
+
+    return (
+        table.get_ids(edge_array[:, 0]).tolist(),
+        table.get_ids(edge_array[:, 1]).tolist(),
+    )
 
 
 def get_anchor_features(schema: List[SchemaElement], anchor: str) -> List[str]:
@@ -233,6 +550,43 @@ def get_shortest_schema_paths_from_dest_leafs(
     return shortest_schema_paths
 
 
+def get_schema_path_plan(
+    index: str,
+    features: List[str],
+    visible_features: List[str],
+    schema: List[SchemaElement],
+) -> List[List[SchemaElement]]:
+    """Get shortest schema paths of a dataset, plans are computed once per schema, features and visible features."""
+
+    key = (
+        index,
+        tuple((edge["src"], edge["dest"], edge.get("relationship")) for edge in schema),
+        tuple(features),
+        tuple(visible_features),
+    )
+
+    with schema_path_plans_lock:
+        if key in schema_path_plans:
+            schema_path_plans.move_to_end(key)
+        else:
+            schema_path_plans[key] = get_shortest_schema_paths(
+                features, visible_features, schema
+            )
+
+            if len(schema_path_plans) > MAX_SCHEMA_PATH_PLANS:
+                schema_path_plans.popitem(last=False)
+
+        return list(schema_path_plans[key])
+
+
+def invalidate_schema_path_plans(index: str) -> None:
+    """Remove all cached schema path plans of a dataset."""
+
+    with schema_path_plans_lock:
+        for key in [key for key in schema_path_plans if key[0] == index]:
+            del schema_path_plans[key]
+
+
 def get_shortest_schema_paths(
     features: List[str], visible_features: List[str], schema: List[SchemaElement]
 ) -> List[List[SchemaElement]]:
@@ -333,252 +687,245 @@ def add_shortest_path_from_leafs(
     return shortest_schema_paths
 
 
-def get_single_column_edges(
-    df: pd.DataFrame, feature: str, entries_with_nodes
-) -> List[Tuple[str, str]]:
-    """Get edges for a single feature by generating edges between all of its values in each row."""
-
-    # TODO: Check if row[feature] contains only lists and only in that case create combinations otherwise return an empty list
+def get_cooccurrence_features(
+    visible_features: List[str], schema: List[SchemaElement]
+) -> List[str]:
+    """Get visible features which are related to themselves in the schema."""
 
-    feature_is_list = (
-        (df[feature].sample(100).apply(type).astype(str) == "<class 'list'>").all()
-        if df.shape[0] > 100
-        else (df[feature].apply(type).astype(str) == "<class 'list'>").all()
+    return list(
+        dict.fromkeys(
+            edge["src"]
+            for edge in schema
+            if edge["src"] == edge["dest"]
+            and edge["src"] in visible_features
+            and edge.get("relationship")
+        )
     )
 
-    if not feature_is_list:
-        return []
 
-    edges = []
-    edge_groups = df.apply(
-        lambda row: {
-            "entry": row["entry"],
-            "edges": list(combinations(row[feature], 2)),
-        },
-        axis=1,
-    ).tolist()
+def get_cooccurrence_edges(
+    df: pl.DataFrame,
+    feature: str,
+    table: NodeTable,
+    incidences: Union[Dict[str, pl.LazyFrame], None] = None,
+    max_list_length: Union[int, None] = MAX_COOCCURRENCE_LIST_LENGTH,
+) -> pl.LazyFrame:
+    """Get lazy frame of unique per row edges between all pairs of values of a list feature, e.g. authors of the same paper.
 
-    for group in edge_groups:
-        entry_nodes = entries_with_nodes[group.entry]
+    Rows with more than max_list_length distinct values are skipped, the number of edges per row grows quadratically with the list length.
+    """
 
-        for edge in group["edges"]:
-            if str(edge[0]) == "" or str(edge[1]) == "":
-                continue
-            # TODO: Check if this makes any sense
-            src_val = next(
-                filter(
-                    lambda node: node["feature"] == feature and node["id"] == edge[0],
-                    entry_nodes,
-                )
-            )
+    if incidences is None:
+        incidences = {}
 
-            dest_val = next(
-                filter(
-                    lambda node: node["feature"] == feature and node["id"] == edge[1],
-                    entry_nodes,
-                )
-            )
-
-            edges.append((src_val, dest_val))
+    if feature not in incidences:
+        incidences[feature] = get_feature_incidence(df, feature, table).collect().lazy()
 
-    return edges
+    row_nodes = incidences[feature].select(["csx_row", "id"]).unique()
 
+    if max_list_length is not None:
+        row_nodes = row_nodes.filter(pl.count().over("csx_row") <= max_list_length)
 
-# TODO: ignores relationships in the column itself those should be generated separately!
-def get_edges_based_on_path(
-    df: pd.DataFrame,
-    path: List[SchemaElement],
-    entries_with_nodes,
-    node_ids_with_labels,
-) -> List[Tuple[str, str]]:
-    """Extract all relevant edges from row based on given path."""
-
-    edges = []
-
-    edge_groups = cast(
-        List[List[Tuple[str, str]]],
-        df.apply(
-            lambda row: get_row_edge_based_on_path(
-                row,
-                path,
-                entries_with_nodes,
-                node_ids_with_labels,
-            ),
-            axis=1,
-        ).tolist(),
+    # Each unordered pair is kept once per row, weights follow from the number of rows sharing the pair
+    return (
+        row_nodes.join(row_nodes, on="csx_row", how="inner", suffix="_dest")
+        .filter(pl.col("id") < pl.col("id_dest"))
+        .select(
+            [
+                pl.col("csx_row"),
+                pl.col("id").alias("src"),
+                pl.col("id_dest").alias("dest"),
+            ]
+        )
     )
 
-    for group in edge_groups:
-        edges.extend(group)
-
-    return edges
-
-
-# TODO: also check if shortest path that exists is actually shorter than proposed path
-def shortest_path_exists(
-    shortest_paths: List[List[SchemaElement]], src: str, dest: str
-) -> bool:
-    """Check if there exists a shortest schema path with given source or destination."""
-
-    for path in shortest_paths:
-        if path[0]["src"] == src or path[-1]["dest"] == dest:
-            return True
-    return False
 
+def get_path_frame(df: pd.DataFrame, paths: List[List[SchemaElement]]) -> pl.DataFrame:
+    """Convert features used in the given schema paths into a polars frame with a row index."""
 
-def shortest_path_with_dest_exists(
-    shortest_paths: List[List[SchemaElement]], src: str, dest: str, graph
-) -> bool:
-    for path in shortest_paths:
-        if path[0]["src"] == src and path[-1]["dest"] == dest:
-            return True
-        if path[-1]["dest"] == dest and (
-            nx.has_path(graph, path[0]["src"], src)
-            or nx.has_path(graph, src, path[0]["src"])
-        ):
-            return True
-    return False
-
-
-def get_row_edge_based_on_path(
-    row: pd.Series,
-    path: List[SchemaElement],
-    entries_with_nodes,
-    node_ids_with_labels,
-) -> List[Tuple[str, str]]:
-    """Extract edge for single row based on given path"""
-    generated_edges = []
-    chained_edges = []
+    path_features = list(
+        dict.fromkeys(
+            feature
+            for path in paths
+            for link in path
+            for feature in (link["src"], link["dest"])
+        )
+    )
 
-    # TODO: add info about value type in edge dest and src (e.g. is it a title, abstract, etc.)
+    return pl.from_pandas(df[path_features]).with_row_count("csx_row")
 
-    # Paths can be either signle linked or multi linked
-    # Single linked: Node Type 1 -> Node Type 2
-    # Multi linked: NT1 -> NT3 -> NT4 -> NT5
-    # In either case paths are generated by generating paths link by link
 
-    for i, link in enumerate(path):
-        src_type = link["src"]
-        dest_type = link["dest"]
+def get_feature_node_lookup(
+    table: NodeTable, feature: str, dtype: pl.PolarsDataType
+) -> pl.DataFrame:
+    """Get label to node id lookup frame for non empty nodes of a given feature."""
 
-        entry_nodes = entries_with_nodes[row.entry]
+    node_index = table.get_feature_index([feature])
+    node_index = node_index[table.labels[node_index] != ""]
 
-        src_val_temp = {
-            node["label"]: node["id"]
-            for node in list(
-                filter(lambda node: node["feature"] == src_type, entry_nodes)
-            )
-        }
-
-        if isinstance(row[src_type], list):
-            src_val = [src_val_temp[label] for label in row[src_type]]
-        else:
-            src_val = [src_val_temp[row[src_type]]]
+    return pl.DataFrame(
+        [
+            pl.Series("label", table.labels[node_index].tolist(), dtype=dtype),
+            pl.Series("id", node_index, dtype=pl.Int64),
+        ]
+    )
 
-        if len(src_val) == 1:
-            src_val = src_val[0]
 
-        dest_val_temp = {
-            node["label"]: node["id"]
-            for node in list(
-                filter(lambda node: node["feature"] == dest_type, entry_nodes)
-            )
-        }
-
-        if isinstance(row[dest_type], list):
-            dest_val = [dest_val_temp[label] for label in row[dest_type]]
-        else:
-            dest_val = [dest_val_temp[row[dest_type]]]
+def get_feature_incidence(
+    df: pl.DataFrame, feature: str, table: NodeTable
+) -> pl.LazyFrame:
+    """Map each value of a feature in each row to its node id and its position in the row."""
 
-        if len(dest_val) == 1:
-            dest_val = dest_val[0]
+    dtype = df.schema[feature]
+    data = df.lazy().select([pl.col("csx_row"), pl.col(feature).alias("label")])
 
-        relationship = link["relationship"]
+    if isinstance(dtype, pl.List):
+        dtype = dtype.inner
+        data = data.explode("label").with_columns(
+            pl.col("csx_row").cumcount().over("csx_row").alias("csx_position")
+        )
+    else:
+        data = data.with_columns(pl.lit(0, dtype=pl.UInt32).alias("csx_position"))
+
+    return (
+        data.drop_nulls("label")
+        .join(
+            get_feature_node_lookup(
+                table, feature, cast(pl.PolarsDataType, dtype)
+            ).lazy(),
+            on="label",
+            how="inner",
+        )
+        .select(["csx_row", "csx_position", "id"])
+    )
 
-        if i == 0:
-            # There are no existing edges so there is no need to chain our edges to existing edges
-            for edge in generate_edges(src_val, dest_val, relationship):
-                if edge_has_empty_node(edge, node_ids_with_labels):
-                    continue
 
-                src = edge[0]
+def get_link_edges(
+    src: pl.LazyFrame, dest: pl.LazyFrame, relationship: str
+) -> pl.LazyFrame:
+    """Generate unique per row edges between source and destination nodes based on given relationship."""
 
-                dest = edge[1]
+    if relationship == "oneToOne":
+        # Values of both features are paired by their position in the row
+        join_columns = ["csx_row", "csx_position"]
+    elif relationship in ["oneToMany", "manyToOne", "manyToMany"]:
+        join_columns = ["csx_row"]
+    else:
+        return src.select(
+            [pl.col("csx_row"), pl.col("id").alias("src"), pl.col("id").alias("dest")]
+        ).clear()
+
+    return (
+        src.join(dest, on=join_columns, how="inner", suffix="_dest")
+        .select(
+            [
+                pl.col("csx_row"),
+                pl.col("id").alias("src"),
+                pl.col("id_dest").alias("dest"),
+            ]
+        )
+        .unique()
+    )
 
-                if not edge_is_in_list(generated_edges, src, dest):
-                    generated_edges.append((src, dest))
 
-        else:
-            # There are existing edges therfore we have to chain our edges to existing edges
-            for chained_edge in generate_edges(src_val, dest_val, relationship):
-                if edge_has_empty_node(chained_edge, node_ids_with_labels):
-                    continue
-                for edge in generated_edges:
-                    # src = str(chained_edge[0]) + str(src_type)
-                    # dest = str(chained_edge[1]) + str(dest_type)
-                    src = chained_edge[0]
-                    dest = chained_edge[1]
+def get_edges_based_on_path(
+    df: pl.DataFrame,
+    path: List[SchemaElement],
+    table: NodeTable,
+    incidences: Union[Dict[str, pl.LazyFrame], None] = None,
+) -> List[Tuple[int, int]]:
+    """Extract all relevant edges from all rows based on given path."""
+
+    return (
+        get_path_edges(df, path, table, incidences)
+        .select(["src", "dest"])
+        .collect()
+        .rows()
+    )
 
-                    if edge[1] == src and not edge_is_in_list(
-                        chained_edges, edge[0], dest
-                    ):
-                        chained_edges.append((edge[0], dest))
 
-            generated_edges = chained_edges
-            chained_edges = []
+def get_path_edges(
+    df: pl.DataFrame,
+    path: List[SchemaElement],
+    table: NodeTable,
+    incidences: Union[Dict[str, pl.LazyFrame], None] = None,
+) -> pl.LazyFrame:
+    """Get lazy frame of unique per row edges based on given path."""
 
-    return generated_edges
+    # Paths can be either signle linked or multi linked
+    # Single linked: Node Type 1 -> Node Type 2
+    # Multi linked: NT1 -> NT3 -> NT4 -> NT5
+    # In either case edges are generated by joining the path link by link
 
+    if incidences is None:
+        incidences = {}
 
-def generate_edges(
-    src: Union[str, List[str]], dest: Union[str, List[str]], relationship: str
-) -> Union[List[List[str]], List[Tuple[str, str]]]:
-    """Generate edges based on given relationship, source and destination."""
+    for link in path:
+        for feature in (link["src"], link["dest"]):
+            if feature not in incidences:
+                incidences[feature] = (
+                    get_feature_incidence(df, feature, table).collect().lazy()
+                )
 
-    if relationship == "oneToOne":
-        if not isinstance(src, list):
-            src = [src]
-        if not isinstance(dest, list):
-            dest = [dest]
+    chained_edges = None
 
-        return list(zip(src, dest))
+    for link in path:
+        link_edges = get_link_edges(
+            incidences[link["src"]], incidences[link["dest"]], link["relationship"]
+        )
 
-    if relationship == "oneToMany":
-        if not isinstance(dest, list):
-            dest = [dest]
+        if chained_edges is None:
+            chained_edges = link_edges
+            continue
 
-        return [[src, entry] for entry in dest]
+        # Chain existing edges with new edges through their shared node within the same row
+        chained_edges = (
+            chained_edges.join(
+                link_edges.rename({"src": "csx_via", "dest": "csx_dest"}),
+                left_on=["csx_row", "dest"],
+                right_on=["csx_row", "csx_via"],
+                how="inner",
+            )
+            .select(
+                [pl.col("csx_row"), pl.col("src"), pl.col("csx_dest").alias("dest")]
+            )
+            .unique()
+        )
 
-    if relationship == "manyToOne":
-        if not isinstance(src, list):
-            src = [src]
+    if chained_edges is None:
+        return pl.DataFrame(
+            [
+                pl.Series("csx_row", [], dtype=pl.UInt32),
+                pl.Series("src", [], dtype=pl.Int64),
+                pl.Series("dest", [], dtype=pl.Int64),
+            ]
+        ).lazy()
 
-        return [[entry, dest] for entry in src]
+    return chained_edges
 
-    if relationship == "manyToMany":
-        if not isinstance(src, list):
-            src = [src]
-        if not isinstance(dest, list):
-            dest = [dest]
 
-        return list(product(src, dest))
+# TODO: also check if shortest path that exists is actually shorter than proposed path
+def shortest_path_exists(
+    shortest_paths: List[List[SchemaElement]], src: str, dest: str
+) -> bool:
+    """Check if there exists a shortest schema path with given source or destination."""
 
-    return []
+    for path in shortest_paths:
+        if path[0]["src"] == src or path[-1]["dest"] == dest:
+            return True
+    return False
 
 
-def edge_has_empty_node(
-    edge: Union[List[str], Tuple[str, str]], node_ids_with_labels
+def shortest_path_with_dest_exists(
+    shortest_paths: List[List[SchemaElement]], src: str, dest: str, graph
 ) -> bool:
-    """Check if edge contains an empty node."""
-    return not str(node_ids_with_labels[edge[0]]) or not str(
-        node_ids_with_labels[edge[1]]
-    )
-
-
-def edge_is_in_list(edges: List[Tuple[str, str]], dest: str, src: str) -> bool:
-    """Check if edge with a specified destination and source is in given edge list."""
-    for edge in edges:
-        if edge[0] == dest and edge[1] == src:
+    for path in shortest_paths:
+        if path[0]["src"] == src and path[-1]["dest"] == dest:
+            return True
+        if path[-1]["dest"] == dest and (
+            nx.has_path(graph, path[0]["src"], src)
+            or nx.has_path(graph, src, path[0]["src"])
+        ):
             return True
     return False
 
@@ -587,11 +934,11 @@ def edge_is_in_list(edges: List[Tuple[str, str]], dest: str, src: str) -> bool:
 def enrich_with_components(
     edges: List[Edge], components: List[Component]
 ) -> List[Edge]:
+    node_components = csx_components.get_node_components(components)
+
     for edge in edges:
-        for component in components:
-            if (
-                edge["source"] in component["nodes"]
-                and edge["target"] in component["nodes"]
-            ):
-                edge["component"] = component["id"]
+        if edge["source"] in node_components and node_components[
+            edge["source"]
+        ] == node_components.get(edge["target"]):
+            edge["component"] = node_components[edge["source"]]
     return edges
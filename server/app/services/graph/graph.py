@@ -1,15 +1,18 @@
 import json
-import pickle
-import uuid
+from collections import Counter
 from datetime import datetime
-from typing import Dict, Generator, List, Literal, cast
+from typing import Dict, Generator, List, Literal, Tuple
 
+import app.services.graph.adjacency as csx_adjacency
 import app.services.graph.components as csx_components
 import app.services.graph.edges as csx_edges
+import app.services.graph.node_table as csx_node_table
 import app.services.graph.nodes as csx_nodes
+import app.services.graph.statistics as csx_statistics
 import app.services.study.study as csx_study
-import networkx as nx
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+from app.config import settings
 from app.services.storage.base import BaseStorageConnector
 from app.types import Node, SchemaElement
 from app.utils.timer import use_timing
@@ -18,108 +21,176 @@ from app.utils.timer import use_timing
 def get_graph(
     storage: Generator[BaseStorageConnector, None, None],
     graph_type: Literal["overview", "detail"],
-    elastic_json: Dict,
+    results: pa.Table,
     dimensions: Dict,
     schema: List[SchemaElement],
     index: str,
     external_search,
-) -> Dict:
-    """Generate graph"""
+    previous_positions: Dict = {},
+) -> Tuple[Dict, np.ndarray, List[str]]:
+    """Generate graph, nodes with previous positions keep them.
+
+    The edge index of the graph is returned along with it so that statistics and the adjacency do not build it again.
+    """
     if graph_type == "overview":
         return get_overview_graph(
             storage,
-            elastic_json,
+            results,
             dimensions["links"],
             dimensions["anchor"]["dimension"],
             dimensions["anchor"]["props"],
             index,
             external_search,
+            previous_positions,
         )
 
     return get_detail_graph(
-        storage, elastic_json, dimensions["all"], dimensions["visible"], schema, index
+        storage,
+        results,
+        dimensions["all"],
+        dimensions["visible"],
+        schema,
+        index,
+        previous_positions,
     )
 
 
+def get_response_graph(graph_data: Dict, results: pa.Table) -> Dict:
+    """Get graph as it is sent to the client.
+
+    Table data is derived from the nodes and the search results table of the graph, it is not cached with the graph.
+    """
+
+    # Connections of single overview edges are served from the connection index and its lookup on request
+    graph_data = {
+        key: value
+        for key, value in graph_data.items()
+        if key not in ["connection_index", "connection_lookup"]
+    }
+
+    # Adjacencies are only used by the server, graphs stored before they were introduced carry networkx graphs instead
+    if "meta" in graph_data:
+        graph_data["meta"] = {
+            key: value
+            for key, value in graph_data["meta"].items()
+            if key not in ["adjacency", "nx_graph"]
+        }
+
+    if "meta" in graph_data:
+        graph_data["meta"]["table_data"] = convert_table_data(
+            graph_data["nodes"], results
+        )
+
+    return graph_data
+
+
 def generate_graph_metadata(
     graph_type: Literal["overview", "detail"],
     dimensions: Dict,
-    table_data,
     schema,
     query,
     visible_entries,
     anchor_properties,
     anchor_property_values,
     graph_data,
+    edge_index: np.ndarray,
+    node_ids: List[str],
 ) -> Dict:
     if graph_type == "overview":
         return {
             "new_dimensions": dimensions["query_generated"],
             "query": query,
-            "table_data": table_data,
             "schema": schema,
             "dimensions": dimensions["links"] + [dimensions["anchor"]["dimension"]],
             "anchor_properties": anchor_properties,
             "anchor_property_values": anchor_property_values,
-            "max_degree": get_max_degree(from_graph_data(graph_data)),
+            **get_graph_statistics_metadata(graph_data, edge_index, node_ids),
         }
 
     return {
         "new_dimensions": dimensions["query_generated"],
         "query": query,
-        "table_data": table_data,
         "schema": schema,
         "dimensions": dimensions["visible"],
         "visible_entries": visible_entries,
-        "max_degree": get_max_degree(from_graph_data(graph_data)),
+        **get_graph_statistics_metadata(graph_data, edge_index, node_ids),
     }
 
 
 @use_timing
 def get_detail_graph(
     storage,
-    search_results,
+    results: pa.Table,
     features: List[str],
     visible_features: List[str],
     schema: List[SchemaElement],
     index,
+    previous_positions: Dict = {},
 ):
     """Convert results retrieved from elastic into a graph representation."""
 
-    search_results_df = pd.DataFrame(search_results)
-
-    nodes, entries_with_nodes = csx_nodes.get_nodes(search_results_df, features)
+    search_results_df = csx_study.get_results_frame(results)
 
-    node_ids_with_labels = csx_nodes.get_node_ids_with_labels(nodes)
+    table, _ = csx_nodes.get_nodes(search_results_df, features)
 
     edge_tuples = csx_edges.get_edge_tuples(
         search_results_df,
         features,
         visible_features,
         schema,
-        entries_with_nodes,
-        node_ids_with_labels,
+        table,
+        index,
     )
 
-    nx_edges = csx_edges.get_nx_edges(edge_tuples)
-    edges = csx_edges.get_edges(edge_tuples)
+    # Edge index rows follow the order of the edges, so that it can be reused with their weights
+    edge_weights = Counter(edge_tuples)
+    nx_edges = list(edge_weights)
+    edges = csx_edges.get_edges(edge_tuples, table)
 
-    nodes = csx_nodes.get_visible_nodes(nodes, visible_features)
-    nodes = csx_nodes.get_positions(nodes, nx_edges)
+    node_index = csx_nodes.get_visible_nodes(table, visible_features)
+    edge_index, node_ids = table.get_edge_index(node_index, nx_edges)
 
-    components = csx_components.get_components(nodes, nx_edges)
+    table = csx_nodes.get_positions(
+        table, node_index, edge_index, node_ids, previous_positions
+    )
+
+    table = csx_nodes.get_communities(
+        table,
+        node_index,
+        edge_index,
+        len(node_ids),
+        np.array([edge_weights[edge] for edge in nx_edges], dtype=np.float64),
+        settings.community_resolution,
+        settings.community_time_limit,
+    )
+
+    nodes = table.to_nodes(node_index)
+
+    components = csx_components.get_components(nodes, edge_index, node_ids)
 
     nodes = csx_nodes.enrich_with_components(nodes, components)
-    nodes = csx_nodes.enrich_with_neighbors(nodes, nx_edges)
+    nodes = csx_nodes.enrich_with_neighbors(nodes, edge_index, node_ids)
     edges = csx_edges.enrich_with_components(edges, components)
 
     components = sorted(components, key=lambda component: -component["node_count"])
 
-    return {
-        "nodes": nodes,
-        "edges": edges,
-        "components": components,
-    }
+    return (
+        {
+            "nodes": nodes,
+            "edges": edges,
+            "components": components,
+        },
+        edge_index,
+        node_ids,
+    )
+
+
+def get_entry_rows(results: pa.Table) -> Dict[str, int]:
+    """Get lookup of search result rows by their entry id, the first row of an entry is kept."""
+
+    entries = results.column("entry").to_pylist()
+
+    return {entry: row for row, entry in reversed(list(enumerate(entries)))}
 
 
 @use_timing
@@ -141,13 +212,16 @@ def get_props_for_cached_nodes(
             if prop not in properties_to_remove
         }
     # add properties
-    for node in comparison_results["data"][graph_type]["nodes"]:
-        for prop in properties_to_add:
-            node["properties"][prop] = next(
-                entry
-                for entry in comparison_results["data"]["global"]["table_data"]
-                if entry["entry"] == node["entries"][0]
-            )[prop]
+    if len(properties_to_add) > 0:
+        results = comparison_results["data"]["global"]["results"]
+        entry_rows = get_entry_rows(results)
+        property_values = csx_study.get_result_columns(results, properties_to_add)
+
+        for node in comparison_results["data"][graph_type]["nodes"]:
+            entry_row = entry_rows[node["entries"][0]]
+
+            for prop in properties_to_add:
+                node["properties"][prop] = property_values[prop][entry_row]
 
     return comparison_results["data"][graph_type]
 
@@ -155,14 +229,15 @@ def get_props_for_cached_nodes(
 @use_timing
 def get_overview_graph(
     storage,
-    search_results,
+    results: pa.Table,
     links: List[str],
     anchor: str,
     anchor_properties: List[str],
     index,
     external_search,
+    previous_positions: Dict = {},
 ):
-    search_results_df = pd.DataFrame(search_results)
+    search_results_df = csx_study.get_results_frame(results)
 
     is_anchor_list = False
     list_links = []
@@ -179,7 +254,7 @@ def get_overview_graph(
         link for link in links if config["dimension_types"][link] != "list"
     ]
 
-    nodes, entries_with_nodes = csx_nodes.get_nodes(
+    table, incidence = csx_nodes.get_nodes(
         search_results_df,
         non_list_links + (list_links + [anchor] if is_anchor_list else list_links),
         anchor,
@@ -187,106 +262,98 @@ def get_overview_graph(
         is_anchor_list,
     )
 
-    if len(list_links) > 0 or is_anchor_list:
-        if is_anchor_list:
-            unique_entry_set = set(search_results_df.entry.tolist())
-            unique_mongo_anchor_node_entry_set = set(
-                [
-                    item
-                    for sublist in [
-                        node["entries"] for node in nodes if node["feature"] == anchor
-                    ]
-                    for item in sublist
-                ]
-            )
-
-            entries_with_no_anchor_value = list(
-                unique_entry_set - unique_mongo_anchor_node_entry_set
-            )
-
-            if len(entries_with_no_anchor_value) > 0:
-                nodes.append(
-                    cast(
-                        Node,
-                        {
-                            "entries": entries_with_no_anchor_value,
-                            "id": uuid.uuid4().hex,
-                            "label": f"CSX_No_{anchor}",
-                            "feature": anchor,
-                            "community": 0,
-                            "component": 0,
-                            "size": len(entries_with_no_anchor_value) + 5,
-                        },
-                    )
-                )
-
-        entries_with_nodes = csx_nodes.enrich_entries_with_nodes(
-            entries_with_nodes, nodes
-        )
-
-        mongo_nodes = csx_nodes.adjust_node_size(
-            nodes,
-            search_results_df,
-            list_links + [anchor] if is_anchor_list else list_links,
+    if is_anchor_list:
+        missing_entries_node = csx_nodes.get_missing_entries_node(
+            table, incidence, anchor
         )
 
-        nodes = mongo_nodes
+        if missing_entries_node.frequencies[0] > 0:
+            table = csx_node_table.concat_node_tables([table, missing_entries_node])
 
-    node_ids_with_labels = csx_nodes.get_node_ids_with_labels(nodes)
-
-    edge_tuple_lookup = csx_edges.get_overview_edge_tuples(
+    (
+        edge_tuple_lookup,
+        connection_index,
+        sparsification,
+    ) = csx_edges.get_overview_edge_tuples(
         search_results_df,
         anchor,
         links,
-        nodes,
-        entries_with_nodes,
-        node_ids_with_labels,
+        table,
+        max_connections=settings.overview_max_connections,
+        sparsification=settings.overview_sparsification,
+        sparsification_parameter=settings.overview_sparsification_parameter,
+        max_edges=settings.overview_max_edges,
     )
 
-    nodes = [node for node in nodes if node["feature"] == anchor]
+    node_index = table.get_feature_index([anchor])
 
     nx_edges = list(edge_tuple_lookup.keys())
 
-    edges = csx_edges.get_overview_edges(edge_tuple_lookup, nx_edges)
+    edges = csx_edges.get_overview_edges(edge_tuple_lookup, nx_edges, table)
+
+    edge_index, node_ids = table.get_edge_index(node_index, nx_edges)
 
-    nodes = csx_nodes.get_positions(nodes, nx_edges)
+    table = csx_nodes.get_positions(
+        table, node_index, edge_index, node_ids, previous_positions
+    )
 
-    components = csx_components.get_components(nodes, nx_edges)
+    table = csx_nodes.get_communities(
+        table,
+        node_index,
+        edge_index,
+        len(node_ids),
+        np.array(
+            [edge_tuple_lookup[edge]["weight"] for edge in nx_edges], dtype=np.float64
+        ),
+        settings.community_resolution,
+        settings.community_time_limit,
+    )
+
+    nodes = table.to_nodes(node_index)
+
+    if len(list_links) > 0 or is_anchor_list:
+        nodes = csx_nodes.adjust_node_size(
+            nodes,
+            results,
+            list_links + [anchor] if is_anchor_list else list_links,
+        )
+
+    components = csx_components.get_components(nodes, edge_index, node_ids)
 
     nodes = csx_nodes.enrich_with_components(nodes, components)
-    nodes = csx_nodes.enrich_with_neighbors(nodes, nx_edges)
+    nodes = csx_nodes.enrich_with_neighbors(nodes, edge_index, node_ids)
     edges = csx_edges.enrich_with_components(edges, components)
-    components = csx_components.enrich_with_top_connections(components, edges)
+    components = csx_components.enrich_with_top_connections(
+        components, connection_index, nodes, edges
+    )
     components = sorted(components, key=lambda component: -component["node_count"])
 
-    return {
+    graph_data = {
         "nodes": nodes,
         "edges": edges,
         "components": components,
+        "connection_index": connection_index,
+        "connection_lookup": csx_edges.get_connection_lookup(connection_index),
     }
 
+    if sparsification:
+        graph_data["sparsification"] = sparsification
 
-def from_graph_data(graph_data) -> nx.Graph:
-    graph = nx.Graph()
-    graph.add_nodes_from([node["id"] for node in graph_data["nodes"]])
-    graph.add_edges_from(
-        [(edge["source"], edge["target"]) for edge in graph_data["edges"]]
-    )
-    return graph
-
+    return graph_data, edge_index, node_ids
 
-def from_cache(graph_data) -> nx.Graph:
-    graph = nx.from_dict_of_dicts(graph_data["meta"]["nx_graph"])
-    return graph
 
+def get_graph_statistics_metadata(graph_data, edge_index=None, node_ids=None) -> Dict:
+    statistics = csx_statistics.get_graph_statistics(graph_data, edge_index, node_ids)
 
-def get_max_degree(graph: nx.Graph):
-    return max([d for n, d in graph.degree()])
+    return {"max_degree": statistics["max_degree"], "statistics": statistics}
 
 
 @use_timing
-def convert_table_data(nodes: List[Node], elastic_results: List[Dict]) -> List[Dict]:
-    """Extract table data from elastic results and node list and generate particular entries needed for client side."""
+def convert_table_data(nodes: List[Node], results: pa.Table) -> List[Dict]:
+    """Extract table data from the search results table and node list and generate particular entries needed for client side.
+
+    Rows are only built here, for the response.
+    """
 
     dataEntries = {}
 
@@ -298,19 +365,21 @@ def convert_table_data(nodes: List[Node], elastic_results: List[Dict]) -> List[D
         for entryId in node["entries"]:
             dataEntries[entryId][f"{node['feature']}_{node['label']}_id"] = node["id"]
 
-    return [{**dataEntries[row["entry"]], **row} for row in elastic_results]
+    return [
+        {**dataEntries[row["entry"]], **row}
+        for row in csx_study.get_result_rows(results)
+    ]
 
 
 def get_graph_from_scratch(
     storage,
     graph_type,
     dimensions,
-    elastic_json,
+    results,
     visible_entries,
     index,
     cache_data,
     search_uuid,
-    results,
     user_id,
     schema,
     anchor_properties,
@@ -322,25 +391,34 @@ def get_graph_from_scratch(
     history_parent_id,
     charts,
     external_search,
+    delta=False,
 ):
-    graph_data = get_graph(
-        storage, graph_type, elastic_json, dimensions, schema, index, external_search
+    graph_data, edge_index, node_ids = get_graph(
+        storage,
+        graph_type,
+        results,
+        dimensions,
+        schema,
+        index,
+        external_search,
+        csx_nodes.get_previous_positions(cache_data.get(graph_type)),
     )
-    table_data = convert_table_data(graph_data["nodes"], elastic_json)
     anchor_property_values = csx_nodes.get_anchor_property_values(
-        elastic_json, dimensions["anchor"]["props"]
+        csx_study.get_results_frame(results, dimensions["anchor"]["props"]),
+        dimensions["anchor"]["props"],
     )
 
     graph_data["meta"] = generate_graph_metadata(
         graph_type,
         dimensions,
-        table_data,
         schema,
         query,
         visible_entries,
         anchor_properties,
         anchor_property_values,
         graph_data,
+        edge_index,
+        node_ids,
     )
 
     cache_data = csx_study.generate_cache_data(
@@ -351,14 +429,14 @@ def get_graph_from_scratch(
         index,
         query,
         dimensions,
-        table_data,
-        results,
         comparison_res,
-        elastic_json,
+        results,
         study_id,
     )
 
-    cache_snapshot = csx_study.enrich_cache_with_ng_graph(cache_data, graph_type)
+    cache_snapshot = csx_study.enrich_cache_with_adjacency(
+        cache_data, graph_type, edge_index, node_ids
+    )
 
     storage.insert_history_item(
         study_id,
@@ -366,7 +444,7 @@ def get_graph_from_scratch(
         {
             "action": history_action,
             "graph_type": graph_type,
-            "graph_data": pickle.dumps(cache_snapshot),
+            "graph_data": cache_snapshot,
             "query": query,
             "action_time": action_time,
             "schema": schema,
@@ -378,6 +456,7 @@ def get_graph_from_scratch(
             "charts": charts,
             "edge_count": len(graph_data["edges"]),
             "node_count": len(graph_data["nodes"]),
+            "delta": delta,
         },
     )
 
@@ -389,7 +468,7 @@ def get_graph_with_new_anchor_props(
     comparison_res,
     graph_type,
     dimensions,
-    elastic_json,
+    results,
     user_id,
     study_id,
     action,
@@ -409,7 +488,8 @@ def get_graph_with_new_anchor_props(
 
     graph_data["meta"]["anchor_properties"] = anchor_properties
     graph_data["meta"]["anchor_property_values"] = csx_nodes.get_anchor_property_values(
-        elastic_json, dimensions["anchor"]["props"]
+        csx_study.get_results_frame(results, dimensions["anchor"]["props"]),
+        dimensions["anchor"]["props"],
     )
 
     cache_data[graph_type]["meta"]["anchor_property_values"] = graph_data["meta"][
@@ -423,7 +503,7 @@ def get_graph_with_new_anchor_props(
         {
             "action": history_action,
             "graph_type": graph_type,
-            "graph_data": pickle.dumps(cache_data),
+            "graph_data": cache_data,
             "query": query,
             "action_time": action_time,
             "schema": schema,
@@ -445,7 +525,7 @@ def get_graph_from_existing_data(
     storage,
     graph_type,
     dimensions,
-    elastic_json,
+    results,
     visible_entries,
     cache_data,
     user_id,
@@ -463,37 +543,41 @@ def get_graph_from_existing_data(
 ):
     # Take global table data and generate grpah
 
-    graph_data = get_graph(
+    graph_data, edge_index, node_ids = get_graph(
         storage,
         graph_type,
-        cache_data["global"]["elastic_json"],
+        cache_data["global"]["results"],
         dimensions,
         schema,
         index,
         external_search,
-    )
-
-    table_data = convert_table_data(
-        graph_data["nodes"], cache_data["global"]["elastic_json"]
+        csx_nodes.get_previous_positions(cache_data.get(graph_type)),
     )
 
     anchor_property_values = csx_nodes.get_anchor_property_values(
-        cache_data["global"]["elastic_json"], dimensions["anchor"]["props"]
+        csx_study.get_results_frame(
+            cache_data["global"]["results"], dimensions["anchor"]["props"]
+        ),
+        dimensions["anchor"]["props"],
     )
 
     graph_data["meta"] = generate_graph_metadata(
         graph_type,
         dimensions,
-        table_data,
         schema,
         query,
         visible_entries,
         anchor_properties,
         anchor_property_values,
         graph_data,
+        edge_index,
+        node_ids,
     )
 
     cache_data[graph_type] = graph_data
+    cache_data = csx_study.enrich_cache_with_adjacency(
+        cache_data, graph_type, edge_index, node_ids
+    )
 
     storage.insert_history_item(
         study_id,
@@ -501,7 +585,7 @@ def get_graph_from_existing_data(
         {
             "action": history_action,
             "graph_type": graph_type,
-            "graph_data": pickle.dumps(cache_data),
+            "graph_data": cache_data,
             "query": query,
             "action_time": action_time,
             "schema": schema,
@@ -542,7 +626,7 @@ def get_graph_from_cache(
         {
             "action": history_action,
             "graph_type": graph_type,
-            "graph_data": pickle.dumps(comparison_res["data"]),
+            "graph_data": comparison_res["data"],
             "query": query,
             "action_time": action_time,
             "schema": schema,
@@ -560,9 +644,7 @@ def get_graph_from_cache(
     return comparison_res["data"][graph_type]
 
 
-def calculate_trimmed_graph(cache_data, entries, graph_type):
-    df = cast(pd.DataFrame, pd.read_json(cache_data["global"]["results_df"]))
-
+def calculate_trimmed_graph(cache_data, entries, graph_type, results: pa.Table):
     # Filter graph nodes
     new_nodes = [
         node
@@ -596,30 +678,20 @@ def calculate_trimmed_graph(cache_data, entries, graph_type):
         if len(list(set(component["nodes"]).intersection(set(visible_nodes)))) > 0
     ]
 
-    # Modify table data of graph
-    # Due to the particular structure of table_data in the cxs client both overview and detail graph have to have their own instance of table data
-    cache_data[graph_type]["meta"]["table_data"] = convert_table_data(
-        cache_data[graph_type]["nodes"], cache_data["global"]["elastic_json"]
-    )
-
-    # Generate new NetworkX graph
-    cache_data[graph_type]["meta"]["nx_graph"] = nx.to_dict_of_dicts(
-        from_graph_data(cache_data[graph_type])
+    edge_index, node_ids = csx_components.get_edge_index(
+        cache_data[graph_type]["nodes"],
+        [(edge["source"], edge["target"]) for edge in cache_data[graph_type]["edges"]],
     )
 
     components = csx_components.get_components(
-        cache_data[graph_type]["nodes"],
-        [],
-        from_graph_data(cache_data[graph_type]),
+        cache_data[graph_type]["nodes"], edge_index, node_ids
     )
 
     nodes = csx_nodes.enrich_with_components(new_nodes, components)
-    nodes = csx_nodes.enrich_with_neighbors(
-        nodes, [], from_graph_data(cache_data[graph_type])
-    )
+    nodes = csx_nodes.enrich_with_neighbors(nodes, edge_index, node_ids)
 
     nodes = csx_nodes.adjust_node_size(
-        nodes, df, cache_data[graph_type]["meta"]["dimensions"]
+        nodes, results, cache_data[graph_type]["meta"]["dimensions"]
     )
 
     cache_data[graph_type]["edges"] = csx_edges.enrich_with_components(
@@ -629,8 +701,26 @@ def calculate_trimmed_graph(cache_data, entries, graph_type):
     cache_data[graph_type]["nodes"] = nodes
 
     if graph_type == "overview":
+        # Overview graphs stored before the connection index was introduced keep all connections on edges
+        if "connection_index" not in cache_data[graph_type]:
+            cache_data[graph_type]["connection_index"] = (
+                csx_edges.get_connection_index_from_edges(
+                    cache_data[graph_type]["edges"]
+                )
+            )
+
+        cache_data[graph_type]["connection_index"] = csx_edges.trim_connection_index(
+            cache_data[graph_type]["connection_index"], set(visible_nodes)
+        )
+        cache_data[graph_type]["connection_lookup"] = csx_edges.get_connection_lookup(
+            cache_data[graph_type]["connection_index"]
+        )
+
         components = csx_components.enrich_with_top_connections(
-            components, cache_data[graph_type]["edges"]
+            components,
+            cache_data[graph_type]["connection_index"],
+            nodes,
+            cache_data[graph_type]["edges"],
         )
 
         for property_value in cache_data[graph_type]["meta"]["anchor_property_values"]:
@@ -643,8 +733,14 @@ def calculate_trimmed_graph(cache_data, entries, graph_type):
 
     cache_data[graph_type]["components"] = components
 
-    cache_data[graph_type]["meta"]["max_degree"] = get_max_degree(
-        from_graph_data(cache_data[graph_type])
+    cache_data[graph_type]["meta"] = {
+        **cache_data[graph_type]["meta"],
+        **get_graph_statistics_metadata(cache_data[graph_type], edge_index, node_ids),
+    }
+
+    cache_data[graph_type]["meta"].pop("nx_graph", None)
+    cache_data[graph_type]["meta"]["adjacency"] = csx_adjacency.get_csr_adjacency(
+        cache_data[graph_type], edge_index, node_ids
     )
 
     return cache_data
@@ -0,0 +1,309 @@
+import time
+from typing import Union
+
+import numpy as np
+from app.utils.timer import use_timing
+
+# Graphs up to this size get exact pairwise repulsion, larger graphs use the grid approximation
+EXACT_REPULSION_LIMIT = 1000
+
+# Warm started layouts fall back to a full layout when fewer vertices than this share are known
+MIN_KNOWN_SHARE = 0.5
+
+
+def get_initial_positions(vertex_count: int, seed: int = 0) -> np.ndarray:
+    """Get deterministic random positions spread over an area proportional to the number of vertices."""
+
+    rng = np.random.default_rng(seed)
+
+    return rng.uniform(-1, 1, (vertex_count, 2)) * np.sqrt(max(vertex_count, 1))
+
+
+def get_point_repulsion(
+    positions: np.ndarray,
+    sources: np.ndarray,
+    source_masses: np.ndarray,
+    chunk_size: int = 512,
+) -> np.ndarray:
+    """Get repulsion of each position from all source points weighted by their masses, computed in chunks to bound memory."""
+
+    forces = np.zeros_like(positions)
+
+    for start in range(0, len(positions), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        dx = positions[chunk, 0, None] - sources[None, :, 0]
+        dy = positions[chunk, 1, None] - sources[None, :, 1]
+        weights = source_masses[None, :] / np.maximum(dx * dx + dy * dy, 1e-4)
+
+        forces[chunk, 0] = (weights * dx).sum(axis=1)
+        forces[chunk, 1] = (weights * dy).sum(axis=1)
+
+    return forces
+
+
+def get_exact_repulsion(
+    positions: np.ndarray, masses: np.ndarray, movers: np.ndarray
+) -> np.ndarray:
+    """Get repulsion forces of the moving vertices from all other vertices."""
+
+    # Vertices do not repel themselves since their distance to themselves is zero
+    return (
+        get_point_repulsion(positions[movers], positions, masses) * masses[movers, None]
+    )
+
+
+def get_grid_repulsion(
+    positions: np.ndarray,
+    masses: np.ndarray,
+    movers: np.ndarray,
+    grid_size: int = 32,
+) -> np.ndarray:
+    """Get repulsion forces of the moving vertices approximated by the mass centers of grid cells, a single level Barnes-Hut approximation."""
+
+    lower = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - lower, 1e-9)
+    cells = np.minimum(
+        ((positions - lower) / extent * grid_size).astype(np.int64), grid_size - 1
+    )
+    cell_index = cells[:, 0] * grid_size + cells[:, 1]
+
+    cell_count = grid_size * grid_size
+    cell_masses = np.bincount(cell_index, weights=masses, minlength=cell_count)
+    cell_moments = np.stack(
+        [
+            np.bincount(
+                cell_index, weights=masses * positions[:, axis], minlength=cell_count
+            )
+            for axis in range(2)
+        ],
+        axis=1,
+    )
+
+    occupied = np.flatnonzero(cell_masses > 0)
+    cell_centers = cell_moments[occupied] / cell_masses[occupied, None]
+
+    mover_positions = positions[movers]
+    mover_masses = masses[movers]
+    mover_cells = cell_index[movers]
+    forces = get_point_repulsion(mover_positions, cell_centers, cell_masses[occupied])
+
+    # The own cell of each vertex is replaced by the mass center of the other vertices in that cell
+    own_masses = cell_masses[mover_cells]
+    own_centers = cell_moments[mover_cells] / own_masses[:, None]
+    other_masses = own_masses - mover_masses
+    has_others = other_masses > 1e-9
+    other_centers = (
+        cell_moments[mover_cells] - mover_masses[:, None] * mover_positions
+    ) / np.where(has_others, other_masses, 1)[:, None]
+
+    for centers, center_masses in [
+        (own_centers, -own_masses),
+        (other_centers, np.where(has_others, other_masses, 0)),
+    ]:
+        deltas = mover_positions - centers
+        distances = np.maximum((deltas * deltas).sum(axis=1), 1e-4)
+        forces += deltas * (center_masses / distances)[:, None]
+
+    return forces * mover_masses[:, None]
+
+
+def get_attraction(positions: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Get linear attraction forces along edges."""
+
+    deltas = positions[edges[:, 1]] - positions[edges[:, 0]]
+    forces = np.zeros_like(positions)
+
+    for axis in range(2):
+        forces[:, axis] = np.bincount(
+            edges[:, 0], weights=deltas[:, axis], minlength=len(positions)
+        ) - np.bincount(edges[:, 1], weights=deltas[:, axis], minlength=len(positions))
+
+    return forces
+
+
+def get_masses(vertex_count: int, edges: np.ndarray) -> np.ndarray:
+    """Get vertex masses used by the layout, which are their degrees plus one."""
+
+    return np.bincount(edges.ravel(), minlength=vertex_count).astype(np.float64) + 1
+
+
+def relax_positions(
+    positions: np.ndarray,
+    masses: np.ndarray,
+    edges: np.ndarray,
+    movers: np.ndarray,
+    iterations: int,
+    time_budget: float,
+    max_step: float,
+    repulsion: float = 1.0,
+    gravity: float = 1.0,
+    center: Union[np.ndarray, None] = None,
+) -> np.ndarray:
+    """Move the given vertices along the layout forces while all other vertices stay in place.
+
+    Steps are limited by a temperature which cools down with the used iterations or time budget.
+    """
+
+    get_repulsion = (
+        get_exact_repulsion
+        if len(positions) <= EXACT_REPULSION_LIMIT
+        else get_grid_repulsion
+    )
+
+    if center is None:
+        center = np.zeros(2)
+
+    # Only edges touching moving vertices exert forces that matter
+    is_mover = np.zeros(len(positions), dtype=bool)
+    is_mover[movers] = True
+    edges = edges[is_mover[edges[:, 0]] | is_mover[edges[:, 1]]]
+
+    start_time = time.perf_counter()
+
+    for iteration in range(iterations):
+        progress = max(
+            iteration / iterations, (time.perf_counter() - start_time) / time_budget
+        )
+
+        if progress >= 1:
+            break
+
+        forces = (
+            repulsion * get_repulsion(positions, masses, movers)
+            + get_attraction(positions, edges)[movers]
+        )
+
+        offsets = positions[movers] - center
+        distances = np.maximum(np.linalg.norm(offsets, axis=1), 1e-9)
+        forces -= gravity * masses[movers, None] * offsets / distances[:, None]
+
+        steps = forces / masses[movers, None]
+        step_lengths = np.maximum(np.linalg.norm(steps, axis=1), 1e-9)
+        temperature = max_step * (1 - progress)
+        positions[movers] += (
+            steps * (np.minimum(step_lengths, temperature) / step_lengths)[:, None]
+        )
+
+    return positions
+
+
+@use_timing
+def get_force_layout(
+    vertex_count: int,
+    edges: np.ndarray,
+    iterations: int = 100,
+    time_budget: float = 1.0,
+    seed: int = 0,
+    scale: float = 500,
+    gravity: float = 1.0,
+) -> np.ndarray:
+    """Get ForceAtlas2 style layout of a graph, edges are pairs of vertex positions.
+
+    Vertices repel each other proportional to their degree, edges attract linearly and gravity keeps disconnected parts close.
+    The layout stops after the given number of iterations or once the time budget in seconds is used up.
+    """
+
+    if vertex_count < 2:
+        return np.zeros((vertex_count, 2))
+
+    edges = edges[edges[:, 0] != edges[:, 1]]
+
+    positions = relax_positions(
+        get_initial_positions(vertex_count, seed),
+        get_masses(vertex_count, edges),
+        edges,
+        np.arange(vertex_count),
+        iterations,
+        time_budget,
+        np.sqrt(vertex_count),
+        gravity=gravity,
+    )
+
+    positions -= positions.mean(axis=0)
+    extent = np.abs(positions).max()
+
+    return positions * (scale / extent) if extent > 0 else positions
+
+
+@use_timing
+def get_incremental_layout(
+    known_positions: np.ndarray,
+    edges: np.ndarray,
+    iterations: int = 30,
+    time_budget: float = 0.5,
+    seed: int = 0,
+    scale: float = 500,
+    gravity: float = 1.0,
+) -> np.ndarray:
+    """Get layout of a graph warm started from known vertex positions, unknown positions are NaN.
+
+    Known vertices keep their positions, new vertices are placed next to their known neighbours and relaxed for a few iterations.
+    Falls back to a full layout when too few vertices are known.
+    """
+
+    vertex_count = len(known_positions)
+    is_known = ~np.isnan(known_positions).any(axis=1)
+
+    if is_known.all():
+        return known_positions.copy()
+
+    if is_known.sum() < max(MIN_KNOWN_SHARE * vertex_count, 2):
+        return get_force_layout(
+            vertex_count, edges, seed=seed, scale=scale, gravity=gravity
+        )
+
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    masses = get_masses(vertex_count, edges)
+    movers = np.flatnonzero(~is_known)
+    positions = np.where(is_known[:, None], known_positions, 0.0)
+
+    # Forces are rescaled so that edges between known vertices keep their current length at equilibrium
+    known_edges = edges[is_known[edges[:, 0]] & is_known[edges[:, 1]]]
+    unit = scale / np.sqrt(vertex_count)
+
+    if len(known_edges) > 0:
+        lengths = np.linalg.norm(
+            positions[known_edges[:, 0]] - positions[known_edges[:, 1]], axis=1
+        )
+        edge_unit = np.median(lengths) / np.median(
+            np.sqrt(masses[known_edges[:, 0]] * masses[known_edges[:, 1]])
+        )
+        unit = edge_unit if edge_unit > 0 else unit
+
+    # New vertices start at the mean position of their known neighbours or randomly around the center of the graph
+    center = positions[is_known].mean(axis=0)
+    neighbour_edges = np.concatenate([edges, edges[:, ::-1]])
+    neighbour_edges = neighbour_edges[
+        ~is_known[neighbour_edges[:, 0]] & is_known[neighbour_edges[:, 1]]
+    ]
+    neighbour_counts = np.bincount(neighbour_edges[:, 0], minlength=vertex_count)
+
+    rng = np.random.default_rng(seed)
+    jitter = rng.uniform(-1, 1, (len(movers), 2)) * unit
+
+    for axis in range(2):
+        neighbour_sums = np.bincount(
+            neighbour_edges[:, 0],
+            weights=positions[neighbour_edges[:, 1], axis],
+            minlength=vertex_count,
+        )
+        positions[movers, axis] = np.where(
+            neighbour_counts[movers] > 0,
+            neighbour_sums[movers] / np.maximum(neighbour_counts[movers], 1),
+            center[axis] + jitter[:, axis] * np.sqrt(len(movers)),
+        )
+
+    positions[movers] += jitter
+
+    return relax_positions(
+        positions,
+        masses,
+        edges,
+        movers,
+        iterations,
+        time_budget,
+        unit * np.sqrt(len(movers)),
+        repulsion=unit * unit,
+        gravity=gravity * unit,
+        center=center,
+    )
@@ -0,0 +1,214 @@
+import hashlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+from app.types import Node
+from scipy import sparse
+
+
+def get_node_id(feature: str, label) -> str:
+    """Get stable id of the node representing a given feature, label tuple."""
+
+    return hashlib.blake2b(f"{feature}\x1f{label}".encode(), digest_size=16).hexdigest()
+
+
+def to_object_array(values: List) -> np.ndarray:
+    """Convert list of python values into a one dimensional object array."""
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class NodeTable:
+    """Array backed node storage where every node is addressed by a dense integer id.
+
+    Feature names and entry ids are stored once and referenced by codes, the entries of each node are stored as CSR offsets into the entry codes.
+    String node ids are only materialised for nodes that leave the table.
+    """
+
+    def __init__(
+        self,
+        features: List[str],
+        feature_codes: np.ndarray,
+        labels: np.ndarray,
+        frequencies: np.ndarray,
+        sizes: np.ndarray,
+        entries: np.ndarray,
+        entry_offsets: np.ndarray,
+        entry_codes: np.ndarray,
+    ):
+        node_count = len(feature_codes)
+
+        self.features = features
+        self.feature_codes = feature_codes.astype(np.int32)
+        self.labels = labels
+        self.frequencies = frequencies.astype(np.int64)
+        self.sizes = sizes.astype(np.int64)
+        self.entries = entries
+        self.entry_offsets = entry_offsets.astype(np.int64)
+        self.entry_codes = entry_codes.astype(np.int64)
+        self.communities = np.zeros(node_count, dtype=np.int64)
+        self.components = np.zeros(node_count, dtype=np.int64)
+        self.x = np.full(node_count, np.nan)
+        self.y = np.full(node_count, np.nan)
+        self.properties: Dict[int, Dict] = {}
+        self.__ids = np.full(node_count, None, dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.feature_codes)
+
+    def get_feature(self, node: int) -> str:
+        return self.features[self.feature_codes[node]]
+
+    def get_feature_index(self, features: List[str]) -> np.ndarray:
+        """Get ids of all nodes of the given features."""
+
+        codes = [
+            code for code, feature in enumerate(self.features) if feature in features
+        ]
+        return np.flatnonzero(np.isin(self.feature_codes, codes))
+
+    def get_entry_counts(self) -> np.ndarray:
+        return np.diff(self.entry_offsets)
+
+    def get_entry_codes(self, node: int) -> np.ndarray:
+        return self.entry_codes[self.entry_offsets[node] : self.entry_offsets[node + 1]]
+
+    def get_entries(self, node: int) -> List[str]:
+        return self.entries[self.get_entry_codes(node)].tolist()
+
+    def get_entry_incidence(self) -> sparse.csr_matrix:
+        """Get sparse entry to node incidence matrix."""
+
+        return sparse.csr_matrix(
+            (
+                np.ones(len(self.entry_codes), dtype=np.int8),
+                self.entry_codes,
+                self.entry_offsets,
+            ),
+            shape=(len(self), len(self.entries)),
+        ).T.tocsr()
+
+    def get_ids(self, index: np.ndarray) -> np.ndarray:
+        """Get stable string ids of the given nodes, ids are generated on first use."""
+
+        for node in np.unique(index).tolist():
+            if self.__ids[node] is None:
+                self.__ids[node] = get_node_id(
+                    self.get_feature(node), self.labels[node]
+                )
+
+        return self.__ids[index]
+
+    def get_edge_index(
+        self, node_index: np.ndarray, edges: List[Tuple[int, int]]
+    ) -> Tuple[np.ndarray, List[str]]:
+        """Get edges as pairs of positions into the returned node id list.
+
+        The given nodes come first, nodes which are only referenced by edges are appended after them.
+        """
+
+        edge_array = np.array(edges, dtype=np.int64).reshape(-1, 2)
+        vertices = np.concatenate(
+            [node_index, np.setdiff1d(np.unique(edge_array), node_index)]
+        ).astype(np.int64)
+
+        positions = np.full(len(self), -1, dtype=np.int64)
+        positions[vertices] = np.arange(len(vertices))
+
+        return positions[edge_array], self.get_ids(vertices).tolist()
+
+    def to_nodes(self, index: np.ndarray) -> List[Node]:
+        """Materialise node objects with stable string ids for the given nodes."""
+
+        ids = self.get_ids(index).tolist()
+        entry_counts = self.get_entry_counts()
+        nodes = []
+
+        for position, node in enumerate(index.tolist()):
+            new_node = {
+                "feature": self.get_feature(node),
+                "label": self.labels[node],
+                "csx_frequency": int(self.frequencies[node]),
+                "entries": self.get_entries(node),
+                "csx_entry_frequency": int(entry_counts[node]),
+                "community": int(self.communities[node]),
+                "component": int(self.components[node]),
+                "id": ids[position],
+                "size": int(self.sizes[node]),
+            }
+
+            if node in self.properties:
+                new_node["properties"] = self.properties[node]
+
+            if not np.isnan(self.x[node]):
+                new_node["x"] = float(self.x[node])
+                new_node["y"] = float(self.y[node])
+
+            nodes.append(new_node)
+
+        return nodes
+
+
+def get_feature_node_table(
+    feature: str,
+    labels: List,
+    frequencies: np.ndarray,
+    sizes: np.ndarray,
+    entries: np.ndarray,
+    entry_counts: np.ndarray,
+    entry_codes: np.ndarray,
+) -> NodeTable:
+    """Create node table holding the nodes of a single feature."""
+
+    return NodeTable(
+        [feature],
+        np.zeros(len(labels), dtype=np.int32),
+        to_object_array(labels),
+        frequencies,
+        sizes,
+        entries,
+        np.concatenate([[0], np.cumsum(entry_counts, dtype=np.int64)]),
+        entry_codes,
+    )
+
+
+def concat_node_tables(tables: List[NodeTable]) -> NodeTable:
+    """Concatenate node tables sharing the same entries, node ids are assigned in order of the tables."""
+
+    features = list(
+        dict.fromkeys(feature for table in tables for feature in table.features)
+    )
+    feature_codes = []
+    entry_offsets = [np.zeros(1, dtype=np.int64)]
+    entry_count = 0
+
+    for table in tables:
+        table_features = np.array(
+            [features.index(feature) for feature in table.features], dtype=np.int32
+        )
+        feature_codes.append(table_features[table.feature_codes])
+        entry_offsets.append(table.entry_offsets[1:] + entry_count)
+        entry_count += len(table.entry_codes)
+
+    new_table = NodeTable(
+        features,
+        np.concatenate(feature_codes),
+        np.concatenate([table.labels for table in tables]),
+        np.concatenate([table.frequencies for table in tables]),
+        np.concatenate([table.sizes for table in tables]),
+        tables[0].entries,
+        np.concatenate(entry_offsets),
+        np.concatenate([table.entry_codes for table in tables]),
+    )
+
+    offset = 0
+
+    for table in tables:
+        for node, properties in table.properties.items():
+            new_table.properties[node + offset] = properties
+
+        offset += len(table)
+
+    return new_table
@@ -1,21 +1,25 @@
 import itertools
-import math
-import uuid
 from collections import Counter
-from typing import Dict, List, Tuple, cast
+from typing import Dict, List, Tuple, Union
 
-import networkx as nx
+import app.services.graph.communities as csx_communities
+import app.services.graph.components as csx_components
+import app.services.graph.layout as csx_layout
+import app.services.graph.node_table as csx_node_table
 import numpy as np
 import pandas as pd
 import polars as pl
+import pyarrow as pa
+from app.services.graph.node_table import NodeTable
 from app.types import Component, Node
 from app.utils.timer import use_timing
+from scipy import sparse
 
 
 @use_timing
 def get_labels(df: pd.DataFrame, feature: str) -> Counter:
     """Extract unique values and their counts of a given feature."""
-    isFeatureList = isinstance(df[feature].iloc[0], list)
+    isFeatureList = df[feature].map(lambda value: isinstance(value, list)).any()
 
     if isFeatureList:
         return Counter(itertools.chain.from_iterable(df[feature]))
@@ -23,6 +27,21 @@ def get_labels(df: pd.DataFrame, feature: str) -> Counter:
     return Counter(df[feature].tolist())
 
 
+def get_table_labels(table: pa.Table, feature: str) -> pl.DataFrame:
+    """Extract unique values and their counts of a given feature of an Arrow table, values of list features are counted one by one."""
+
+    if feature not in table.column_names:
+        return pl.DataFrame({"label": [], "counts": []})
+
+    column = pl.from_arrow(table.column(feature)).alias("label")
+
+    # Empty lists explode into nulls which are not values of the list
+    if isinstance(column.dtype, pl.List):
+        column = column.explode().drop_nulls()
+
+    return column.value_counts(sort=False)
+
+
 def get_label_entries(df: pd.DataFrame, feature: str, label: str) -> List[str]:
     """Extract entry ids for a given feature, label tuple."""
     isFeatureList = isFeatureList = isinstance(df[feature].iloc[0], list)
@@ -33,9 +52,9 @@ def get_label_entries(df: pd.DataFrame, feature: str, label: str) -> List[str]:
     return df[df[feature] == label]["entry"].tolist()
 
 
-def get_anchor_property_values(search_results, anchor_properties: List[str]) -> List:
-    search_results_df = pd.DataFrame(search_results)
-
+def get_anchor_property_values(
+    search_results_df: pd.DataFrame, anchor_properties: List[str]
+) -> List:
     return [
         {"values": search_results_df[prop].unique().tolist(), "property": prop}
         for prop in anchor_properties
@@ -46,231 +65,151 @@ def get_anchor_property_values(search_results, anchor_properties: List[str]) ->
 def enrich_with_components(
     nodes: List[Node], components: List[Component]
 ) -> List[Node]:
+    node_components = csx_components.get_node_components(components)
+
     for node in nodes:
-        for component in components:
-            if node["id"] in component["nodes"]:
-                node["component"] = component["id"]
-                break
+        if node["id"] in node_components:
+            node["component"] = node_components[node["id"]]
     return nodes
 
 
 @use_timing
 def enrich_with_neighbors(
-    nodes: List[Node], edges: List[Tuple[str, str]], graph=None
+    nodes: List[Node], edges: np.ndarray, node_ids: List[str]
 ) -> List[Node]:
-    if not graph:
-        graph = nx.MultiGraph()
-        graph.add_nodes_from([node["id"] for node in nodes])
-        graph.add_edges_from(edges)
+    """Enrich nodes with the ids of their neighbours, edges are pairs of positions into the node id list."""
 
-    for node in nodes:
-        node["neighbours"] = set(graph.neighbors(node["id"]))
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.argsort(sources, kind="stable")
+    offsets = np.searchsorted(sources[order], np.arange(len(node_ids) + 1))
+    neighbours = np.array(node_ids, dtype=object)[targets[order]]
+
+    for position, node in enumerate(nodes):
+        node["neighbours"] = set(neighbours[offsets[position] : offsets[position + 1]])
 
     return nodes
 
 
-def enrich_node_with_props(
-    node: Node, df: pd.DataFrame, anchor_properties: List[str]
-) -> Node:
-    properties = {
-        feature: df[df[node["feature"]] == node["label"]][feature].values[0]
-        for feature in anchor_properties
+@use_timing
+def enrich_with_props(
+    df: pd.DataFrame, table: NodeTable, anchor: str, anchor_properties: List[str]
+) -> NodeTable:
+    """Enrich anchor nodes with the property values of the first entry holding their label."""
+
+    node_index = table.get_feature_index([anchor])
+    first_rows = table.entry_codes[table.entry_offsets[node_index]]
+
+    # Converting whole columns to lists turns numpy scalars into python values in bulk
+    property_values = {
+        prop: df[prop].to_numpy()[first_rows].tolist() for prop in anchor_properties
     }
 
-    for feature in properties:
-        if not type(properties[feature]) == str and np.issubdtype(
-            properties[feature], np.integer
-        ):
-            if type(properties[feature]).__module__ == np.__name__:
-                properties[feature] = properties[feature].item()
+    for position, node in enumerate(node_index.tolist()):
+        table.properties[node] = {
+            prop: property_values[prop][position] for prop in anchor_properties
+        }
 
-    node["properties"] = properties
-    return node
+    return table
 
 
-@use_timing
-def enrich_with_props(
-    df: pd.DataFrame, nodes: List[Node], anchor: str, anchor_properties: List[str]
-) -> List[Node]:
-    return [
-        enrich_node_with_props(node, df, anchor_properties)
-        if node["feature"] == anchor
-        else node
-        for node in nodes
-    ]
+def get_node_sizes(frequencies: np.ndarray, size_factor: int = 5) -> np.ndarray:
+    """Get node sizes from label frequencies, labels without any occurrence get the base size."""
+
+    sizes = np.zeros(len(frequencies))
+    np.log2(frequencies, out=sizes, where=frequencies > 0)
+
+    return np.ceil(sizes + size_factor).astype(np.int64)
 
 
 def adjust_node_size(
-    nodes: List[Node], df: pd.DataFrame, features: List[str]
+    nodes: List[Node], results: pa.Table, features: List[str]
 ) -> List[Node]:
-    """Adjust size of nodes based on frequency of labesl in given dataframe"""
+    """Adjust size of nodes based on frequency of labesl in given Arrow table of search results"""
 
-    node_label_frequencies = {}
+    node_features = np.array([node["feature"] for node in nodes], dtype=object)
+    labels = [node["label"] for node in nodes]
+    frequencies = np.zeros(len(nodes), dtype=np.int64)
 
     for feature in features:
-        node_label_frequencies[feature] = get_labels(df, feature)
+        positions = np.flatnonzero(node_features == feature)
 
-    for node in nodes:
-        if (
-            node["feature"] in node_label_frequencies
-            and node["label"] in node_label_frequencies[node["feature"]]
-        ):
-            calculated_size = np.log2(
-                node_label_frequencies[node["feature"]][node["label"]]
-            )
+        if len(positions) == 0:
+            continue
+
+        label_counts = get_table_labels(results, feature)
+
+        if label_counts.height == 0:
+            continue
 
-            if calculated_size == -np.inf:
-                calculated_size = 0
-        else:
-            calculated_size = 0
+        # Labels are looked up by python equality like dictionary keys, labels which do not occur get no frequency
+        label_index = pd.Index(label_counts.get_column("label").to_list()).get_indexer(
+            [labels[position] for position in positions.tolist()]
+        )
+        counts = label_counts.get_column("counts").to_numpy().astype(np.int64)
+
+        frequencies[positions] = np.where(
+            label_index >= 0, counts[np.maximum(label_index, 0)], 0
+        )
 
-        node["size"] = math.ceil(calculated_size + 5)
+    for node, size in zip(nodes, get_node_sizes(frequencies).tolist()):
+        node["size"] = size
 
     return nodes
 
 
-def get_label_counts(
-    data: pl.DataFrame, feature, featureIsList, size_factor
-) -> List[Dict]:
-    """Get counts of labels in a given feature"""
+def get_label_counts(data: pl.LazyFrame, feature, featureIsList) -> pl.LazyFrame:
+    """Get query for counts and entry rows of labels in a given feature"""
     if featureIsList:
-        data = (
-            data.explode(feature)
-            .with_columns(csx_entry=pl.col("entry"))
-            .groupby(feature, maintain_order=True)
-            .all()
-        )
-
-        return (
-            data.lazy()
-            .with_columns(
-                [
-                    pl.col("csx_entry").list.lengths().alias("csx_frequency"),
-                    pl.col("csx_entry").list.unique().alias("csx_entries"),
-                    pl.lit(feature).alias("feature"),
-                    pl.lit(0).alias("community"),
-                    pl.lit(0).alias("component"),
-                    pl.Series(
-                        name="id", values=[uuid.uuid4().hex for _ in range(len(data))]
-                    ),
-                ]
-            )
-            .with_columns(
-                pl.col("csx_entries").list.lengths().alias("csx_entry_frequency")
-            )
-            .with_columns(
-                pl.col("csx_entry_frequency")
-                .apply(lambda x: math.ceil(np.log2(x) + size_factor))
-                .alias("size")
-            )
-            .drop("csx_entry")
-            .rename({feature: "label", "csx_entries": "entries"})
-            .select(
-                pl.col(
-                    [
-                        "feature",
-                        "label",
-                        "csx_frequency",
-                        "entries",
-                        "csx_entry_frequency",
-                        "community",
-                        "component",
-                        "id",
-                        "size",
-                    ]
-                )
-            )
-            .collect()
-            .to_dicts()
-        )
+        data = data.explode(feature)
 
-    data = (
-        data.with_columns(csx_entry=pl.col("entry"))
-        .groupby(feature, maintain_order=True)
-        .all()
-    )
     return (
-        data.lazy()
+        data.groupby(feature, maintain_order=True)
+        .agg(pl.col("csx_row"))
         .with_columns(
             [
-                pl.col("csx_entry").list.lengths().alias("csx_frequency"),
-                pl.col("csx_entry").list.lengths().alias("csx_entry_frequency"),
-                pl.lit(feature).alias("feature"),
-                pl.lit(0).alias("community"),
-                pl.lit(0).alias("component"),
-                pl.Series(
-                    name="id", values=[uuid.uuid4().hex for _ in range(len(data))]
-                ),
+                pl.col("csx_row").list.lengths().alias("csx_frequency"),
+                (
+                    pl.col("csx_row").list.unique().list.sort()
+                    if featureIsList
+                    else pl.col("csx_row")
+                ).alias("csx_entries"),
             ]
         )
-        .with_columns(
-            pl.col("csx_entry_frequency")
-            .apply(lambda x: math.ceil(np.log2(x) + size_factor))
-            .alias("size")
-        )
-        .rename({"csx_entry": "entries", feature: "label"})
+        .with_columns(pl.col("csx_entries").list.lengths().alias("csx_entry_frequency"))
+        .rename({feature: "label"})
         .select(
             pl.col(
                 [
-                    "feature",
                     "label",
                     "csx_frequency",
-                    "entries",
+                    "csx_entries",
                     "csx_entry_frequency",
-                    "community",
-                    "component",
-                    "id",
-                    "size",
                 ]
             )
         )
-        .collect()
-        .to_dicts()
     )
 
 
-def get_entry_list(df: pl.DataFrame):
-    return {entry: [] for entry in df.get_column("entry").to_list()}
-
-
-@use_timing
-def get_feature_nodes(df: pd.DataFrame, feature: str, size_factor: int = 2):
-    # -> List[Node]:
-    """Generate list of node objects for all values of a given feature."""
-    pldf = pl.from_pandas(df)
-
-    featureIsList = isinstance(df.iloc[0][feature], list)
-
-    new_entry_list = get_entry_list(pldf)
-    new_nodes = get_label_counts(pldf, feature, featureIsList, size_factor)
-    for node in new_nodes:
-        for entry in node["entries"]:
-            new_entry_list[entry].append(node)
-
-    return new_nodes, new_entry_list
-
-
-def enrich_entries_with_nodes(entries_with_nodes: Dict, nodes: List[Node]) -> Dict:
-    """Enrich existing entries with nodes with additional nodes"""
-    for node in nodes:
-        for entry in node["entries"]:
-            if entry in entries_with_nodes:
-                entries_with_nodes[entry].append(node)
-            else:
-                entries_with_nodes[entry] = [node]
-
-    return entries_with_nodes
-
-@use_timing
-def get_new_entries(new_entries_array):
-    entries = {}
-    for entry_array in new_entries_array:
-        for entry in entry_array:
-            if entry in entries:
-                entries[entry] = entries[entry] + entry_array[entry]
-            else:
-                entries[entry] = entry_array[entry]
-    return entries
+def get_feature_nodes(
+    feature: str,
+    label_counts: pl.DataFrame,
+    entries: np.ndarray,
+    size_factor: int = 2,
+) -> NodeTable:
+    """Generate node table for all values of a given feature, entries of the nodes are referenced by row."""
+
+    entry_counts = label_counts.get_column("csx_entry_frequency").to_numpy()
+
+    return csx_node_table.get_feature_node_table(
+        feature,
+        label_counts.get_column("label").to_list(),
+        label_counts.get_column("csx_frequency").to_numpy(),
+        get_node_sizes(entry_counts, size_factor),
+        entries,
+        entry_counts,
+        label_counts.get_column("csx_entries").explode().to_numpy(),
+    )
 
 
 @use_timing
@@ -280,28 +219,60 @@ def get_nodes(
     anchor: str = "",
     anchor_properties: List[str] = [],
     is_anchor_list=False,
-):
-    """Get node objects for each feature or each passed feature in dataframe."""
+) -> Tuple[NodeTable, sparse.csr_matrix]:
+    """Get node table for each feature or each passed feature in dataframe and the entry to node incidence matrix."""
 
     features = links + [anchor] if anchor != "" and not is_anchor_list else links
-    nodes = []
-    entries = {}
 
-    new_entries_arrays = []
+    feature_list = features if len(features) > 0 else df.columns.tolist()
 
-    feature_list = features if len(features) > 0 else df.columns
+    pldf = pl.from_pandas(df[feature_list]).with_row_count("csx_row")
+    entries = csx_node_table.to_object_array(df["entry"].tolist())
+
+    # Label counts of all features are computed in a single batch of lazy queries
+    label_counts = pl.collect_all(
+        [
+            get_label_counts(
+                pldf.lazy().select(["csx_row", feature]),
+                feature,
+                isinstance(pldf.schema[feature], pl.List),
+            )
+            for feature in feature_list
+        ]
+    )
 
-    for feature in feature_list:
-        new_nodes, new_entries = get_feature_nodes(df, feature, 5)
-        nodes.extend(new_nodes)
-        new_entries_arrays.append(new_entries)
+    table = csx_node_table.concat_node_tables(
+        [
+            get_feature_nodes(feature, feature_label_counts, entries, 5)
+            for feature, feature_label_counts in zip(feature_list, label_counts)
+        ]
+    )
 
     if len(features) > 0:
-        nodes = enrich_with_props(df, nodes, anchor, anchor_properties)
+        table = enrich_with_props(df, table, anchor, anchor_properties)
 
-    entries = get_new_entries(new_entries_arrays)
+    return table, table.get_entry_incidence()
 
-    return nodes, entries
+
+@use_timing
+def get_missing_entries_node(
+    table: NodeTable, incidence: sparse.csr_matrix, feature: str
+) -> NodeTable:
+    """Get node table with a single node holding all entries without a value for the given feature."""
+
+    entry_codes = np.flatnonzero(
+        incidence[:, table.get_feature_index([feature])].getnnz(axis=1) == 0
+    )
+
+    return csx_node_table.get_feature_node_table(
+        feature,
+        [f"CSX_No_{feature}"],
+        np.array([len(entry_codes)]),
+        np.array([len(entry_codes) + 5]),
+        table.entries,
+        np.array([len(entry_codes)]),
+        entry_codes,
+    )
 
 
 @use_timing
@@ -317,28 +288,78 @@ def get_node_lookup_dict(nodes: List[Node]) -> Dict[str, str]:
 
 
 @use_timing
-def get_positions(nodes: List[Node], edges) -> List[Node]:
-    """Generate a position for each node in graph."""
+def get_positions(
+    table: NodeTable,
+    node_index: np.ndarray,
+    edges: np.ndarray,
+    node_ids: List[str],
+    previous_positions: Dict[str, Tuple[float, float]] = {},
+) -> NodeTable:
+    """Generate a position for each node in graph using a force directed layout.
+
+    Edges are pairs of positions into the node id list which starts with the given nodes.
+    Nodes with previous positions keep them and only new nodes are placed.
+    """
+
+    if len(previous_positions) > 0:
+        positions = csx_layout.get_incremental_layout(
+            np.array(
+                [
+                    previous_positions.get(node_id, (np.nan, np.nan))
+                    for node_id in node_ids
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 2),
+            edges,
+        )
+    else:
+        positions = csx_layout.get_force_layout(len(node_ids), edges)
 
-    graph = nx.MultiGraph()
-    graph.add_nodes_from([range(0, len(nodes))])
-    graph.add_edges_from(edges)
+    table.x[node_index] = positions[: len(node_index), 0]
+    table.y[node_index] = positions[: len(node_index), 1]
 
-    positions = nx.circular_layout(graph, scale=500)
+    return table
 
-    for index, node in enumerate(nodes):
-        if node["id"] in positions:
-            nodes[index]["x"] = positions[node["id"]][0]
-            nodes[index]["y"] = positions[node["id"]][1]
-    return nodes
+
+def get_communities(
+    table: NodeTable,
+    node_index: np.ndarray,
+    edges: np.ndarray,
+    vertex_count: int,
+    weights: Union[np.ndarray, None] = None,
+    resolution: float = 1.0,
+    time_limit: Union[float, None] = None,
+) -> NodeTable:
+    """Detect communities of the graph and store the community of each node.
+
+    Edges are pairs of positions into the node id list which starts with the given nodes.
+    """
+
+    communities = csx_communities.get_communities(
+        vertex_count, edges, weights, resolution, time_limit
+    )
+    table.communities[node_index] = communities[: len(node_index)]
+
+    return table
+
+
+def get_previous_positions(graph_data: Dict) -> Dict[str, Tuple[float, float]]:
+    """Get positions of nodes of a cached graph by node id."""
+
+    if not graph_data or "nodes" not in graph_data:
+        return {}
+
+    return {
+        node["id"]: (node["x"], node["y"])
+        for node in graph_data["nodes"]
+        if "x" in node and "y" in node
+    }
 
 
 @use_timing
-def get_visible_nodes(nodes: List[Node], visible_features: List[str]) -> List[Node]:
-    """Extract visible nodes from list of all nodes based on the provided visible features"""
+def get_visible_nodes(table: NodeTable, visible_features: List[str]) -> np.ndarray:
+    """Extract ids of visible nodes from node table based on the provided visible features"""
 
-    return [
-        node
-        for node in nodes
-        if node["feature"] in visible_features and node["label"] != ""
-    ]
+    node_index = table.get_feature_index(visible_features)
+
+    return node_index[table.labels[node_index] != ""]
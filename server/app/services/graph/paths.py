@@ -0,0 +1,176 @@
+from typing import Dict, List, Union
+
+import app.services.graph.adjacency as csx_adjacency
+import numpy as np
+from app.utils.timer import use_timing
+
+# Maximum number of equally short paths returned by a single path search
+MAX_PATHS = 100
+
+
+def get_positions(adjacency: Dict, node_ids: List[str]) -> np.ndarray:
+    """Get positions of the given nodes in the adjacency, unknown nodes are skipped."""
+
+    positions = {node_id: i for i, node_id in enumerate(adjacency["node_ids"])}
+
+    return np.unique(
+        np.array(
+            [positions[node_id] for node_id in node_ids if node_id in positions],
+            dtype=np.int64,
+        )
+    )
+
+
+def expand_frontier(
+    adjacency: Dict, frontier: np.ndarray, distances: np.ndarray, distance: int
+) -> np.ndarray:
+    """Visit all unvisited neighbours of the frontier and return them as the next frontier."""
+
+    neighbours = np.unique(csx_adjacency.get_neighbours(adjacency, frontier))
+    frontier = neighbours[distances[neighbours] < 0]
+    distances[frontier] = distance
+
+    return frontier
+
+
+def get_previous_layer(
+    adjacency: Dict, layer: np.ndarray, distances: np.ndarray, distance: int
+) -> np.ndarray:
+    """Get the neighbours of a layer of path nodes which are one step closer to the start of the search."""
+
+    neighbours = np.unique(csx_adjacency.get_neighbours(adjacency, layer))
+
+    return neighbours[distances[neighbours] == distance]
+
+
+@use_timing
+def get_path_layers(
+    adjacency: Dict,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    max_distance: Union[int, None] = None,
+) -> List[np.ndarray]:
+    """Get the nodes on all shortest paths between two node sets grouped by their distance from the sources.
+
+    Searches breadth first from both sets at once, always expanding the smaller frontier, until the searches meet.
+    Returns no layers if the sets are not connected within max_distance hops.
+    """
+
+    node_count = len(adjacency["node_ids"])
+    source_distances = np.full(node_count, -1, dtype=np.int64)
+    target_distances = np.full(node_count, -1, dtype=np.int64)
+    source_distances[sources] = 0
+    target_distances[targets] = 0
+
+    source_frontier, target_frontier = sources, targets
+    source_depth, target_depth = 0, 0
+
+    # The searches meet once a node is reached from both sides, all such nodes are exactly source_depth and target_depth away
+    while not ((source_distances >= 0) & (target_distances >= 0)).any():
+        if len(source_frontier) == 0 or len(target_frontier) == 0:
+            return []
+
+        if max_distance is not None and source_depth + target_depth >= max_distance:
+            return []
+
+        if len(source_frontier) <= len(target_frontier):
+            source_depth += 1
+            source_frontier = expand_frontier(
+                adjacency, source_frontier, source_distances, source_depth
+            )
+        else:
+            target_depth += 1
+            target_frontier = expand_frontier(
+                adjacency, target_frontier, target_distances, target_depth
+            )
+
+    meeting = np.flatnonzero(
+        (source_distances == source_depth) & (target_distances == target_depth)
+    )
+
+    # Walk back from the meeting nodes towards both node sets
+    source_layers = [meeting]
+
+    for distance in range(source_depth - 1, -1, -1):
+        source_layers.append(
+            get_previous_layer(adjacency, source_layers[-1], source_distances, distance)
+        )
+
+    target_layers = [meeting]
+
+    for distance in range(target_depth - 1, -1, -1):
+        target_layers.append(
+            get_previous_layer(adjacency, target_layers[-1], target_distances, distance)
+        )
+
+    return source_layers[::-1] + target_layers[1:]
+
+
+def get_layer_paths(
+    adjacency: Dict, layers: List[np.ndarray], max_paths: int
+) -> List[List[int]]:
+    """Get up to max_paths paths through consecutive layers, paths along the heaviest edges come first."""
+
+    node_layers = np.full(len(adjacency["node_ids"]), -1, dtype=np.int64)
+
+    for i, layer in enumerate(layers):
+        node_layers[layer] = i
+
+    paths = []
+    stack = [[node] for node in reversed(layers[0].tolist())] if layers else []
+
+    while stack and len(paths) < max_paths:
+        path = stack.pop()
+
+        if len(path) == len(layers):
+            paths.append(path)
+            continue
+
+        neighbours = adjacency["neighbours"][
+            adjacency["offsets"][path[-1]] : adjacency["offsets"][path[-1] + 1]
+        ]
+        next_nodes = neighbours[node_layers[neighbours] == len(path)]
+        stack.extend(path + [node] for node in reversed(next_nodes.tolist()))
+
+    return paths
+
+
+def get_path_graph(
+    graph_data: Dict,
+    source_ids: List[str],
+    target_ids: List[str],
+    max_paths: int = 1,
+    max_distance: Union[int, None] = None,
+) -> Dict:
+    """Get the subgraph made of up to max_paths shortest paths between the given source and target nodes."""
+
+    adjacency = csx_adjacency.get_adjacency(graph_data)
+    layers = get_path_layers(
+        adjacency,
+        get_positions(adjacency, source_ids),
+        get_positions(adjacency, target_ids),
+        max_distance,
+    )
+
+    paths = [
+        [adjacency["node_ids"][position] for position in path]
+        for path in get_layer_paths(adjacency, layers, max_paths)
+    ]
+    path_nodes = set(node_id for path in paths for node_id in path)
+    path_edges = set(
+        (source, target)
+        for path in paths
+        for source, target in zip(path[:-1], path[1:])
+    )
+
+    return {
+        "nodes": [node for node in graph_data["nodes"] if node["id"] in path_nodes],
+        "edges": [
+            edge
+            for edge in graph_data["edges"]
+            if (edge["source"], edge["target"]) in path_edges
+            or (edge["target"], edge["source"]) in path_edges
+        ],
+        "paths": paths,
+        "distance": len(layers) - 1 if layers else None,
+    }
@@ -0,0 +1,117 @@
+from typing import Tuple, Union
+
+import numpy as np
+import polars as pl
+from app.types import SparsificationMethod, SparsificationReport
+from app.utils.timer import use_timing
+
+# Parameters used when none are given: significance level of the disparity filter, edges kept per node and minimum weight
+DEFAULT_PARAMETERS = {"disparity": 0.05, "top_k": 5, "threshold": 2}
+
+
+def get_disparity_scores(
+    sources: np.ndarray, targets: np.ndarray, weights: np.ndarray, vertex_count: int
+) -> np.ndarray:
+    """Get disparity filter p-value of each edge, the smaller p-value of both endpoints is used.
+
+    Edges carrying a large share of the weight of one of their endpoints get small p-values, endpoints with a single edge do not judge it.
+    """
+
+    strengths = np.bincount(sources, weights=weights, minlength=vertex_count)
+    strengths += np.bincount(targets, weights=weights, minlength=vertex_count)
+    degrees = np.bincount(sources, minlength=vertex_count)
+    degrees += np.bincount(targets, minlength=vertex_count)
+
+    scores = np.ones(len(weights))
+
+    for endpoints in (sources, targets):
+        degree = degrees[endpoints]
+        has_choice = degree > 1
+        p_values = np.power(
+            1 - weights / strengths[endpoints], np.maximum(degree - 1, 1)
+        )
+        scores = np.where(has_choice, np.minimum(scores, p_values), scores)
+
+    return scores
+
+
+def get_top_k_scores(
+    sources: np.ndarray, targets: np.ndarray, weights: np.ndarray
+) -> np.ndarray:
+    """Get the best rank of each edge among the edges of its endpoints ordered by descending weight."""
+
+    edge_count = len(weights)
+    scores = np.full(edge_count, edge_count, dtype=np.int64)
+
+    for endpoints in (sources, targets):
+        order = np.lexsort((-weights, endpoints))
+        sorted_endpoints = endpoints[order]
+        starts = np.flatnonzero(
+            np.concatenate([[True], sorted_endpoints[1:] != sorted_endpoints[:-1]])
+        )
+        group_sizes = np.diff(np.concatenate([starts, [edge_count]]))
+        ranks = np.empty(edge_count, dtype=np.int64)
+        ranks[order] = np.arange(edge_count) - np.repeat(starts, group_sizes)
+        scores = np.minimum(scores, ranks)
+
+    return scores
+
+
+@use_timing
+def sparsify_edges(
+    edges: pl.DataFrame,
+    vertex_count: int,
+    method: SparsificationMethod,
+    parameter: Union[float, None] = None,
+    max_edges: Union[int, None] = None,
+) -> Tuple[pl.DataFrame, SparsificationReport]:
+    """Drop the least important weighted edges of a graph given as source, target and weight frame.
+
+    Disparity keeps edges which are significant at the given level for one of their endpoints, top k keeps the k heaviest edges of each node and threshold keeps edges with at least the given weight.
+    At most max_edges of the kept edges remain, the most important ones first. Given max_edges without a parameter the max_edges most important edges are kept.
+    """
+
+    if parameter is None and max_edges is None:
+        parameter = DEFAULT_PARAMETERS[method]
+
+    sources = edges.get_column("source").to_numpy()
+    targets = edges.get_column("target").to_numpy()
+    weights = edges.get_column("weight").to_numpy().astype(np.float64)
+
+    # Smaller scores mark more important edges
+    if method == "disparity":
+        scores = get_disparity_scores(sources, targets, weights, vertex_count)
+    elif method == "top_k":
+        scores = get_top_k_scores(sources, targets, weights)
+    else:
+        scores = -weights
+
+    if parameter is None:
+        kept = np.arange(len(weights))
+    elif method == "threshold":
+        kept = np.flatnonzero(weights >= parameter)
+    else:
+        kept = np.flatnonzero(scores < parameter)
+
+    if max_edges is not None and len(kept) > max_edges:
+        kept = kept[np.lexsort((-weights[kept], scores[kept]))[:max_edges]]
+
+    kept = np.sort(kept)
+
+    connected = np.zeros(vertex_count, dtype=bool)
+    connected[sources] = True
+    connected[targets] = True
+    still_connected = np.zeros(vertex_count, dtype=bool)
+    still_connected[sources[kept]] = True
+    still_connected[targets[kept]] = True
+
+    return edges[kept], {
+        "method": method,
+        "parameter": parameter,
+        "max_edges": max_edges,
+        "edge_count": len(weights),
+        "kept_edge_count": len(kept),
+        "dropped_edge_count": len(weights) - len(kept),
+        "dropped_weight": float(weights.sum() - weights[kept].sum()),
+        "isolated_node_count": int((connected & ~still_connected).sum()),
+    }
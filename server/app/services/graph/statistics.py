@@ -0,0 +1,119 @@
+from typing import Dict, List, Tuple, Union
+
+import app.services.graph.components as csx_components
+import numpy as np
+from app.types import ComponentStatistics, GraphStatistics
+from app.utils.timer import use_timing
+
+
+def get_degrees(vertex_count: int, edges: np.ndarray) -> np.ndarray:
+    """Get degree of each vertex, edges are pairs of vertex positions.
+
+    Repeated edges between the same vertices count once and self loops count twice, like in a simple graph.
+    """
+
+    pairs = np.sort(edges.reshape(-1, 2), axis=1)
+    pairs = np.unique(pairs[:, 0] * vertex_count + pairs[:, 1])
+
+    return np.bincount(pairs // vertex_count, minlength=vertex_count) + np.bincount(
+        pairs % vertex_count, minlength=vertex_count
+    )
+
+
+def get_distribution(values: np.ndarray) -> List[Tuple[int, int]]:
+    """Get the number of occurrences of each non negative integer value, values which do not occur are skipped."""
+
+    counts = np.bincount(values)
+    present = np.flatnonzero(counts)
+
+    return list(zip(present.tolist(), counts[present].tolist()))
+
+
+def get_component_statistics(
+    vertex_count: int,
+    edges: np.ndarray,
+    weights: np.ndarray,
+    degrees: np.ndarray,
+    labels: np.ndarray,
+) -> List[ComponentStatistics]:
+    """Get node and edge counts, max degree and total edge weight of each labelled component, vertices labelled -1 are skipped."""
+
+    is_labelled = labels >= 0
+
+    if not is_labelled.any():
+        return []
+
+    component_count = labels.max() + 1
+    node_counts = np.bincount(labels[is_labelled], minlength=component_count)
+
+    # Both endpoints of an edge belong to the same component
+    edge_labels = labels[edges[:, 0]] if len(edges) > 0 else np.zeros(0, np.int64)
+    is_labelled_edge = edge_labels >= 0
+    edge_counts = np.bincount(edge_labels[is_labelled_edge], minlength=component_count)
+    component_weights = np.bincount(
+        edge_labels[is_labelled_edge],
+        weights=weights[is_labelled_edge],
+        minlength=component_count,
+    )
+
+    max_degrees = np.zeros(component_count, dtype=np.int64)
+    np.maximum.at(max_degrees, labels[is_labelled], degrees[is_labelled])
+
+    return [
+        {
+            "id": component,
+            "node_count": int(node_counts[component]),
+            "edge_count": int(edge_counts[component]),
+            "max_degree": int(max_degrees[component]),
+            "weight": float(component_weights[component]),
+        }
+        for component in np.flatnonzero(node_counts).tolist()
+    ]
+
+
+@use_timing
+def get_graph_statistics(
+    graph_data: Dict,
+    edge_index: Union[np.ndarray, None] = None,
+    node_ids: Union[List[str], None] = None,
+) -> GraphStatistics:
+    """Get degree and edge weight distributions of a graph and statistics of its components.
+
+    An edge index already built for the graph can be passed in to avoid building it again.
+    """
+
+    if edge_index is None or node_ids is None:
+        edge_index, node_ids = csx_components.get_edge_index(
+            graph_data["nodes"],
+            [(edge["source"], edge["target"]) for edge in graph_data["edges"]],
+        )
+
+    vertex_count = len(node_ids)
+    weights = np.array(
+        [edge.get("weight", 1) for edge in graph_data["edges"]], dtype=np.float64
+    )
+    degrees = get_degrees(vertex_count, edge_index)
+
+    node_components = csx_components.get_node_components(
+        graph_data.get("components", [])
+    )
+    labels = np.array(
+        [node_components.get(node_id, -1) for node_id in node_ids], dtype=np.int64
+    )
+
+    return {
+        "node_count": len(graph_data["nodes"]),
+        "edge_count": len(graph_data["edges"]),
+        "max_degree": int(degrees.max()) if vertex_count > 0 else 0,
+        "degree_distribution": [
+            {"degree": degree, "count": count}
+            for degree, count in get_distribution(degrees)
+        ],
+        "weight_distribution": [
+            {"weight": weight, "count": count}
+            for weight, count in get_distribution(np.rint(weights).astype(np.int64))
+        ],
+        "components": get_component_statistics(
+            vertex_count, edge_index, weights, degrees, labels
+        ),
+    }
@@ -36,7 +36,9 @@ class BaseStorageConnector(ABC):
         pass
 
     @abstractmethod
-    def get_history_item(self, item_id: str) -> dict:
+    def get_history_item(
+        self, item_id: str, sections: Union[List[str], None] = None
+    ) -> dict:
         pass
 
     @abstractmethod
@@ -81,6 +83,18 @@ class BaseStorageConnector(ABC):
     ) -> None:
         pass
 
+    @abstractmethod
+    def get_history_item_centrality(
+        self, item_id: str, graph_type: str
+    ) -> Union[dict, None]:
+        pass
+
+    @abstractmethod
+    def insert_history_item_centrality(
+        self, item_id: str, graph_type: str, centrality: dict
+    ) -> None:
+        pass
+
     @abstractmethod
     def update_study_settings(self, study_id, user_id, settings):
         pass
@@ -2,6 +2,7 @@ import os
 import pickle
 from typing import List, Union
 
+import app.services.storage.snapshot as csx_snapshot
 import gridfs
 from app.config import settings
 from app.services.storage.base import BaseStorageConnector
@@ -15,6 +16,7 @@ class MongoStorageConnector(BaseStorageConnector):
         self.hostname = hostname
         self.port = port
         self.db = db
+        self.read_item = None
         self.connect()
 
     def __del__(self):
@@ -65,13 +67,65 @@ class MongoStorageConnector(BaseStorageConnector):
             {"dataset_name": dataset_name}, {"$set": config}
         )
 
-    def get_history_item(self, item_id: str) -> dict:
+    def get_history_item_tables(
+        self, item_id: str, sections: Union[List[str], None] = None
+    ) -> dict:
+        """Read the section tables of a stored snapshot, delta snapshots are applied to the tables of their base item.
+
+        Chains of deltas are at most MAX_DELTA_CHAIN_LENGTH long, so only that many base items are read.
+        """
+
+        history_item = self.fs.get(ObjectId(item_id))
+        header = csx_snapshot.read_snapshot_header(history_item)
+        base = (
+            self.get_history_item_tables(header["base"], sections)["sections"]
+            if "base" in header
+            else None
+        )
+        tables = csx_snapshot.read_snapshot_tables(history_item, header, sections, base)
+
+        # Global search data is shared between history items and stored on its own
+        global_id = getattr(history_item, "global_id", None)
+
+        if global_id and (
+            sections is None or "global" in csx_snapshot.get_section_keys(sections)
+        ):
+            global_data = self.fs.get(global_id)
+            tables.update(
+                csx_snapshot.read_snapshot_tables(
+                    global_data, csx_snapshot.read_snapshot_header(global_data)
+                )
+            )
+
+        return {"chain_length": header.get("chain_length", 0), "sections": tables}
+
+    def get_history_item(
+        self, item_id: str, sections: Union[List[str], None] = None
+    ) -> dict:
         try:
-            history_item = self.fs.get(ObjectId(item_id)).read()
+            history_item = self.fs.get(ObjectId(item_id))
+
+            if csx_snapshot.is_snapshot(
+                history_item.read(len(csx_snapshot.SNAPSHOT_MAGIC))
+            ):
+                tables = self.get_history_item_tables(item_id, sections)
+
+                # Items are mostly read in full right before a delta against them is stored
+                if sections is None:
+                    self.read_item = {"id": str(item_id), **tables}
+
+                return {
+                    name: csx_snapshot.get_value(section)
+                    for name, section in tables["sections"].items()
+                }
+
+            history_item.seek(0)
+            cache_data = history_item.read()
         except ConnectionError as e:
             raise e
 
-        return pickle.loads(history_item)
+        # History items stored before snapshots were introduced are pickled
+        return pickle.loads(cache_data)
 
     def get_history_items(self, study_id: str, user_id: str) -> List[dict]:
         try:
@@ -82,9 +136,10 @@ class MongoStorageConnector(BaseStorageConnector):
         if not study:
             return []
 
+        # Centrality rankings were memoised in the study document by earlier versions
         history = [
             {
-                **item,
+                **{key: value for key, value in item.items() if key != "centrality"},
                 "id": str(item["item_id"]),
                 "item_id": None,
                 "parent_id": str(item["parent"]),
@@ -103,8 +158,92 @@ class MongoStorageConnector(BaseStorageConnector):
 
         return history
 
+    def insert_global_data(self, global_data: dict) -> str:
+        """Store global search data once per distinct content and return its id."""
+
+        global_id = f"global_{csx_snapshot.get_content_hash(global_data)}"
+
+        if not self.fs.exists(global_id):
+            try:
+                self.fs.put(
+                    csx_snapshot.get_snapshot({"global": global_data}), _id=global_id
+                )
+            except gridfs.errors.FileExists:
+                # Stored by a concurrent insert of the same search data
+                pass
+
+        return global_id
+
+    def delete_history_item_files(self, item_ids: List[ObjectId]) -> None:
+        """Delete stored history items and the global search data no other history item references."""
+
+        global_ids = set(
+            history_item["global_id"]
+            for history_item in self.database["fs.files"].find(
+                {"_id": {"$in": item_ids}, "global_id": {"$exists": True}}
+            )
+        )
+
+        for item_id in item_ids:
+            self.fs.delete(item_id)
+
+        for centrality in self.database["fs.files"].find(
+            {"history_item_id": {"$in": item_ids}}, {"_id": 1}
+        ):
+            self.fs.delete(centrality["_id"])
+
+        for global_id in global_ids:
+            if not self.database["fs.files"].find_one({"global_id": global_id}):
+                self.fs.delete(global_id)
+
+    def get_delta_base(self, item_id: Union[str, None]) -> Union[dict, None]:
+        """Get id, chain length and section tables of a history item to store a delta against.
+
+        Returns None if the item is not a snapshot or its chain of deltas is due for a full snapshot.
+        """
+
+        if not item_id:
+            return None
+
+        if self.read_item and self.read_item["id"] == str(item_id):
+            return (
+                self.read_item
+                if self.read_item["chain_length"] < csx_snapshot.MAX_DELTA_CHAIN_LENGTH
+                else None
+            )
+
+        history_item = self.fs.get(ObjectId(item_id))
+
+        if not csx_snapshot.is_snapshot(
+            history_item.read(len(csx_snapshot.SNAPSHOT_MAGIC))
+        ):
+            return None
+
+        header = csx_snapshot.read_snapshot_header(history_item)
+
+        if header.get("chain_length", 0) >= csx_snapshot.MAX_DELTA_CHAIN_LENGTH:
+            return None
+
+        return {"id": str(item_id), **self.get_history_item_tables(item_id)}
+
     def insert_history_item(self, study_id: str, user_id: str, history_item_data: dict):
-        fs_id = self.fs.put(history_item_data["graph_data"])
+        cache_data = history_item_data["graph_data"]
+        base = (
+            self.get_delta_base(history_item_data["history_parent_id"])
+            if history_item_data.get("delta")
+            else None
+        )
+
+        if base:
+            # Deltas store their global search data against the base item too, base items are only deleted together with the items built on them
+            fs_id = self.fs.put(csx_snapshot.get_snapshot(cache_data, base))
+        else:
+            fs_id = self.fs.put(
+                csx_snapshot.get_snapshot(
+                    {key: value for key, value in cache_data.items() if key != "global"}
+                ),
+                global_id=self.insert_global_data(cache_data["global"]),
+            )
         self.database["studies"].update_one(
             {"study_uuid": study_id, "user_uuid": user_id},
             {
@@ -150,8 +289,9 @@ class MongoStorageConnector(BaseStorageConnector):
         study = self.get_study(user_id, study_id)
         nodes_to_delete = self.get_history_ids_from_parent(study["history"], item_id)
 
-        for item_id in nodes_to_delete:
-            self.fs.delete(ObjectId(item_id))
+        self.delete_history_item_files(
+            [ObjectId(item_id) for item_id in nodes_to_delete]
+        )
 
         self.database["studies"].update_one(
             {"study_uuid": study_id, "user_uuid": user_id},
@@ -186,6 +326,38 @@ class MongoStorageConnector(BaseStorageConnector):
             },
         )
 
+    def get_history_item_centrality(
+        self, item_id: str, graph_type: str
+    ) -> Union[dict, None]:
+        """Get memoised centrality rankings of a graph of a history item, None if they were not computed yet."""
+
+        centrality_id = f"centrality_{item_id}_{graph_type}"
+
+        if not self.fs.exists(centrality_id):
+            return None
+
+        centrality = self.fs.get(centrality_id)
+        tables = csx_snapshot.read_snapshot_tables(
+            centrality, csx_snapshot.read_snapshot_header(centrality)
+        )
+
+        return csx_snapshot.get_value(tables["centrality"])
+
+    def insert_history_item_centrality(
+        self, item_id: str, graph_type: str, centrality: dict
+    ) -> None:
+        """Store centrality rankings of a graph of a history item next to the history item, they are deleted along with it."""
+
+        try:
+            self.fs.put(
+                csx_snapshot.get_snapshot({"centrality": centrality}),
+                _id=f"centrality_{item_id}_{graph_type}",
+                history_item_id=ObjectId(item_id),
+            )
+        except gridfs.errors.FileExists:
+            # Stored by a concurrent request for the same rankings
+            pass
+
     def insert_study(self, study: dict):
         self.database["studies"].insert_one(study)
 
@@ -223,8 +395,7 @@ class MongoStorageConnector(BaseStorageConnector):
         study = self.get_study(user_id, study_id)
 
         history_ids = [item["item_id"] for item in study["history"]]
-        for item_id in history_ids:
-            self.fs.delete(item_id)
+        self.delete_history_item_files(history_ids)
 
         self.database["studies"].delete_one(
             {"study_uuid": study_id, "user_uuid": user_id}
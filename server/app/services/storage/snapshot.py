@@ -0,0 +1,772 @@
+import hashlib
+import json
+import struct
+from typing import IO, Dict, List, Tuple, Union
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+
+# Snapshots start with this marker, anything else is a pickled cache from before snapshots were introduced
+SNAPSHOT_MAGIC = b"CSXSNAP\x00"
+SNAPSHOT_VERSION = 3
+
+# Delta snapshots store record tables against the tables of their base item, a full snapshot is written instead once a chain of deltas would get longer than this
+MAX_DELTA_CHAIN_LENGTH = 8
+
+# Record tables where more than this share of the rows is not found in the base table are stored in full
+MAX_DELTA_ROW_SHARE = 0.5
+
+# Length of the JSON header follows the marker as an unsigned 32 bit integer
+HEADER_LENGTH_FORMAT = "<I"
+HEADER_OFFSET = len(SNAPSHOT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT)
+
+# Strings longer than this are stored as compressed tables instead of in the header
+MAX_HEADER_STRING_LENGTH = 256
+
+IPC_OPTIONS = pa.ipc.IpcWriteOptions(compression="zstd")
+
+# Sets of strings nested in json values are stored as objects with only this key, json has no sets
+JSON_SET_KEY = "__csx_set__"
+
+# Content hashes are taken over uncompressed Arrow IPC streams, so that they do not depend on how compression settings change
+CONTENT_HASH_IPC_OPTIONS = pa.ipc.IpcWriteOptions(compression=None)
+
+
+def is_snapshot(data: bytes) -> bool:
+    return data[: len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC
+
+
+def to_json_value(value):
+    """Convert values json cannot encode, numpy values become python values and sets of strings become objects marking them as sets."""
+
+    if isinstance(value, (set, frozenset)):
+        if not all(isinstance(item, str) for item in value):
+            raise TypeError("Cannot store set of values other than strings")
+
+        # Items are sorted so that equal sets are stored the same way
+        return {JSON_SET_KEY: sorted(value)}
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    raise TypeError(f"Cannot store value of type {type(value).__name__}")
+
+
+def check_json_value(value) -> None:
+    """Reject values json would silently change, tuples would be read back as lists and dict keys other than strings as strings."""
+
+    if isinstance(value, tuple):
+        raise TypeError("Cannot store tuple, it would be read back as a list")
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise TypeError(
+                    f"Cannot store dict key of type {type(key).__name__}, it would be read back as a string"
+                )
+
+            check_json_value(item)
+
+    elif isinstance(value, list):
+        for item in value:
+            check_json_value(item)
+
+
+def to_json(value) -> str:
+    check_json_value(value)
+
+    return json.dumps(value, default=to_json_value)
+
+
+def from_json_object(value: Dict):
+    """Restore sets from the objects to_json_value marks them with."""
+
+    if len(value) == 1 and JSON_SET_KEY in value:
+        return set(value[JSON_SET_KEY])
+
+    return value
+
+
+def has_json_sets(values: List[str]) -> bool:
+    return any(JSON_SET_KEY in value for value in values)
+
+
+def get_column_kind(values: List) -> str:
+    """Get how a record column is stored, columns with missing values or mixed types are stored as json."""
+
+    if all(isinstance(value, (bool, np.bool_)) for value in values):
+        return "bool"
+
+    if all(
+        isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+        for value in values
+    ):
+        return "int"
+
+    if all(isinstance(value, (float, np.floating)) for value in values):
+        return "float"
+
+    if all(isinstance(value, str) for value in values):
+        return "str"
+
+    if all(
+        isinstance(value, list) and all(isinstance(item, str) for item in value)
+        for value in values
+    ):
+        return "str_list"
+
+    if all(
+        isinstance(value, (set, frozenset))
+        and all(isinstance(item, str) for item in value)
+        for value in values
+    ):
+        return "str_set"
+
+    return "json"
+
+
+COLUMN_TYPES = {
+    "bool": pa.bool_(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "str": pa.large_string(),
+    "str_list": pa.large_list(pa.large_string()),
+    "str_set": pa.large_list(pa.large_string()),
+    "json": pa.large_string(),
+    "json_sets": pa.large_string(),
+}
+
+
+def get_column_values(values: List, kind: str) -> Tuple[pa.Array, str]:
+    """Get array of the values present in a record column."""
+
+    if kind != "json":
+        try:
+            # Items of sets are sorted so that equal sets are stored the same way
+            return (
+                pa.array(
+                    (
+                        [sorted(value) for value in values]
+                        if kind == "str_set"
+                        else values
+                    ),
+                    type=COLUMN_TYPES[kind],
+                ),
+                kind,
+            )
+        except (pa.ArrowInvalid, OverflowError):
+            # Integers beyond 64 bits do not fit a column
+            pass
+
+    values = [to_json(value) for value in values]
+
+    # Only columns with sets are parsed with a hook restoring them
+    return (
+        pa.array(values, type=COLUMN_TYPES["json"]),
+        "json_sets" if has_json_sets(values) else "json",
+    )
+
+
+def get_records_table(records: List[Dict]) -> Tuple[pa.Table, List[str]]:
+    """Get table with one column per key of the given records, records without a key get a null.
+
+    Records often have keys of their own, so only the keys present in each record are visited.
+    """
+
+    rows = {}
+    values = {}
+
+    for row, record in enumerate(records):
+        for key, value in record.items():
+            if key not in rows:
+                rows[key] = []
+                values[key] = []
+
+            rows[key].append(row)
+            values[key].append(value)
+
+    columns = []
+    kinds = []
+
+    for key in rows:
+        present, kind = get_column_values(values[key], get_column_kind(values[key]))
+
+        # Spread the present values over all rows, the other rows point to null
+        positions = np.full(len(records), -1, dtype=np.int64)
+        positions[rows[key]] = np.arange(len(rows[key]))
+
+        columns.append(present.take(pa.array(positions, mask=positions < 0)))
+        kinds.append(kind)
+
+    return pa.table(columns, names=list(rows)), kinds
+
+
+def get_values(column: pa.Array, kind: str) -> List:
+    """Get python values of a column without nulls, converting through numpy is much faster than converting each value."""
+
+    if kind in ["str_list", "str_set"]:
+        items = column.flatten().to_numpy(zero_copy_only=False).tolist()
+        offsets = (column.offsets.to_numpy() - column.offsets[0].as_py()).tolist()
+        values = [items[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+        return [set(value) for value in values] if kind == "str_set" else values
+
+    values = column.to_numpy(zero_copy_only=False).tolist()
+
+    if kind in ["json", "json_sets"]:
+        # Parsing all values as one array avoids the overhead of parsing each value on its own
+        return json.loads(
+            f"[{','.join(values)}]",
+            object_hook=from_json_object if kind == "json_sets" else None,
+        )
+
+    return values
+
+
+def get_records(table: pa.Table, kinds: List[str]) -> List[Dict]:
+    """Get records from a table written by get_records_table, nulls mark missing keys."""
+
+    dense_keys = []
+    dense_values = []
+    sparse_columns = []
+
+    for key, kind in zip(table.column_names, kinds):
+        column = table.column(key).combine_chunks()
+
+        if column.null_count == 0:
+            dense_keys.append(key)
+            dense_values.append(get_values(column, kind))
+        else:
+            sparse_columns.append((key, kind, column))
+
+    if dense_keys:
+        records = [dict(zip(dense_keys, row)) for row in zip(*dense_values)]
+    else:
+        records = [{} for _ in range(table.num_rows)]
+
+    for key, kind, column in sparse_columns:
+        rows = np.flatnonzero(column.is_valid().to_numpy(zero_copy_only=False))
+
+        for row, value in zip(rows.tolist(), get_values(column.drop_null(), kind)):
+            records[row][key] = value
+
+    return records
+
+
+def is_records(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(isinstance(item, dict) for item in value)
+        and all(isinstance(key, str) for item in value for key in item)
+        and any(len(item) > 0 for item in value)
+    )
+
+
+def is_strings(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(isinstance(item, str) for item in value)
+    )
+
+
+def write_table(table: pa.Table, sink: pa.BufferOutputStream) -> Dict:
+    start = sink.tell()
+
+    with pa.ipc.new_stream(sink, table.schema, options=IPC_OPTIONS) as writer:
+        writer.write_table(table)
+
+    return {"offset": start, "length": sink.tell() - start}
+
+
+def is_list_type(column_type: pa.DataType) -> bool:
+    return pa.types.is_list(column_type) or pa.types.is_large_list(column_type)
+
+
+def is_hashable_type(column_type: pa.DataType) -> bool:
+    """Check if rows can be hashed through a column of the given type, lists are only hashed through their joined strings."""
+
+    if is_list_type(column_type):
+        return pa.types.is_string(column_type.value_type) or pa.types.is_large_string(
+            column_type.value_type
+        )
+
+    return (
+        pa.types.is_null(column_type)
+        or pa.types.is_boolean(column_type)
+        or pa.types.is_integer(column_type)
+        or pa.types.is_floating(column_type)
+        or pa.types.is_string(column_type)
+        or pa.types.is_large_string(column_type)
+    )
+
+
+def get_table_kinds(table: pa.Table) -> List[str]:
+    """Get kinds of the columns of a table, a column only matches columns of the same type and field metadata."""
+
+    return [
+        str(field.type)
+        + "".join(
+            f";{key.decode()}={value.decode()}"
+            for key, value in sorted((field.metadata or {}).items())
+        )
+        for field in table.schema
+    ]
+
+
+def get_row_hashes(table: pa.Table) -> pl.DataFrame:
+    """Get two independently seeded hashes of the content of each row, lists are hashed through their joined items and their length."""
+
+    frame = pl.from_arrow(table)
+    columns = []
+
+    for i, (name, column_type) in enumerate(
+        zip(table.column_names, table.schema.types)
+    ):
+        if is_list_type(column_type):
+            columns += [
+                pl.col(name).list.join("\x00").alias(f"{i}_items"),
+                pl.col(name).list.lengths().alias(f"{i}_length"),
+            ]
+        else:
+            columns.append(pl.col(name).alias(str(i)))
+
+    content = frame.select(columns)
+
+    return pl.DataFrame(
+        {
+            "hash": content.hash_rows(seed=0),
+            "check": content.hash_rows(seed=1),
+        }
+    )
+
+
+def conform_table(
+    table: pa.Table, table_kinds: List[str], schema: pa.Schema, kinds: List[str]
+) -> pa.Table:
+    """Get table with the columns of the given schema, columns the table does not have with the same kind are null."""
+
+    columns = {
+        (name, kind): column
+        for name, kind, column in zip(table.column_names, table_kinds, table.columns)
+    }
+
+    return pa.Table.from_arrays(
+        [
+            columns.get(
+                (field.name, kind),
+                pa.chunked_array([pa.nulls(table.num_rows, field.type)]),
+            )
+            for field, kind in zip(schema, kinds)
+        ],
+        schema=schema,
+    )
+
+
+def get_delta_rows(
+    base_table: pa.Table, base_kinds: List[str], table: pa.Table, kinds: List[str]
+) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+    """Get position of each row of a table in the base table and the rows not found there.
+
+    Rows not found in the base table get -(k + 1) for the k-th of them. Returns None if too many rows are not found for a delta to pay off or rows of the table cannot be hashed.
+    """
+
+    if not all(is_hashable_type(column_type) for column_type in table.schema.types):
+        return None
+
+    columns = set(zip(table.column_names, kinds))
+
+    # Base rows with values in columns the table does not have would get keys the records do not have
+    is_reusable = np.ones(base_table.num_rows, dtype=bool)
+
+    for name, kind, column in zip(
+        base_table.column_names, base_kinds, base_table.columns
+    ):
+        if (name, kind) not in columns:
+            is_reusable &= column.is_null().to_numpy()
+
+    base_rows = (
+        get_row_hashes(conform_table(base_table, base_kinds, table.schema, kinds))
+        .with_row_count("base_row")
+        .filter(pl.Series(is_reusable))
+        .unique(subset=["hash", "check"], keep="first")
+    )
+    rows = (
+        get_row_hashes(table)
+        .join(base_rows, on=["hash", "check"], how="left")
+        .get_column("base_row")
+    )
+
+    is_added = rows.is_null().to_numpy()
+
+    if is_added.sum() > MAX_DELTA_ROW_SHARE * len(is_added):
+        return None
+
+    positions = np.where(
+        is_added, -np.cumsum(is_added), rows.fill_null(0).to_numpy().astype(np.int64)
+    )
+
+    return positions, np.flatnonzero(is_added)
+
+
+def is_columnar(tables: Dict) -> bool:
+    """Check if tables read by read_tables hold an Arrow table rather than a list of records."""
+
+    return "table" in tables or tables.get("columnar", False)
+
+
+def apply_delta(
+    base: Dict, positions: np.ndarray, added: pa.Table, kinds: List[str]
+) -> Dict:
+    """Get the tables of a record or Arrow table stored as delta against the given base tables.
+
+    Tables are only put together by get_table, so a chain of deltas takes rows from all its tables at once.
+    """
+
+    pieces = base["pieces"] if "pieces" in base else [(get_table(base), base["kinds"])]
+    base_rows = base.get("rows", np.arange(pieces[0][0].num_rows))
+    offset = sum(table.num_rows for table, _ in pieces)
+
+    return {
+        "pieces": pieces + [(added, kinds)],
+        "rows": np.where(
+            positions >= 0,
+            base_rows[np.maximum(positions, 0)],
+            offset - positions - 1,
+        ),
+        "kinds": kinds,
+        "columnar": is_columnar(base),
+    }
+
+
+def get_table(tables: Dict) -> pa.Table:
+    """Get record or Arrow table from the tables read by read_tables."""
+
+    if "records" in tables:
+        return tables["records"]
+
+    if "table" in tables:
+        return tables["table"]
+
+    # The last table of a delta has all columns of the value
+    schema = tables["pieces"][-1][0].schema
+
+    return pa.concat_tables(
+        [
+            conform_table(table, kinds, schema, tables["kinds"])
+            for table, kinds in tables["pieces"]
+        ]
+    ).take(tables["rows"])
+
+
+def write_value(
+    value, sink: pa.BufferOutputStream, base: Union[Dict, None] = None
+) -> Dict:
+    """Write a value of a cache section, returns the header entry describing where it was stored.
+
+    Given the tables of the same value of a base item, record and Arrow tables are stored as a delta against them where that pays off.
+    """
+
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        base_items = base.get("dict", {}) if base else {}
+
+        return {
+            "dict": {
+                key: write_value(item, sink, base_items.get(key))
+                for key, item in value.items()
+            }
+        }
+
+    if is_records(value) or isinstance(value, pa.Table):
+        is_table = isinstance(value, pa.Table)
+        table, kinds = (
+            (value, get_table_kinds(value)) if is_table else get_records_table(value)
+        )
+        delta = None
+
+        if base and "kinds" in base and is_columnar(base) == is_table:
+            delta = get_delta_rows(get_table(base), base["kinds"], table, kinds)
+
+        if delta is None:
+            return {
+                "table" if is_table else "records": write_table(table, sink),
+                "kinds": kinds,
+            }
+
+        rows, added = delta
+
+        # Consecutive rows mostly keep their order, so differences of positions compress well
+        return {
+            "delta": {
+                "rows": write_table(
+                    pa.table([pa.array(np.diff(rows, prepend=0))], names=["value"]),
+                    sink,
+                ),
+                "records": write_table(table.take(added), sink),
+            },
+            "kinds": kinds,
+            "columnar": is_table,
+        }
+
+    if isinstance(value, np.ndarray) and value.ndim == 1:
+        return {
+            "array": write_table(pa.table([pa.array(value)], names=["value"]), sink),
+        }
+
+    if is_strings(value) or (
+        isinstance(value, str) and len(value) > MAX_HEADER_STRING_LENGTH
+    ):
+        table = pa.table(
+            [
+                pa.array(
+                    value if isinstance(value, list) else [value], pa.large_string()
+                )
+            ],
+            names=["value"],
+        )
+
+        return {
+            "strings" if isinstance(value, list) else "text": write_table(table, sink)
+        }
+
+    value = to_json(value)
+
+    if has_json_sets([value]):
+        return {"value": json.loads(value), "sets": True}
+
+    return {"value": json.loads(value)}
+
+
+def read_table(data: memoryview, location: Dict) -> pa.Table:
+    start = location["offset"]
+
+    return pa.ipc.open_stream(
+        pa.py_buffer(data[start : start + location["length"]])
+    ).read_all()
+
+
+def read_tables(entry: Dict, data: memoryview, base: Union[Dict, None] = None) -> Dict:
+    """Read the tables of a value of a cache section, deltas are applied to the tables of the same value of the base item.
+
+    Returns the header entry with tables in place of their locations.
+    """
+
+    if "dict" in entry:
+        base_items = base.get("dict", {}) if base else {}
+
+        return {
+            "dict": {
+                key: read_tables(item, data, base_items.get(key))
+                for key, item in entry["dict"].items()
+            }
+        }
+
+    if "delta" in entry:
+        return apply_delta(
+            base,
+            np.cumsum(
+                read_table(data, entry["delta"]["rows"]).column("value").to_numpy()
+            ),
+            read_table(data, entry["delta"]["records"]),
+            entry["kinds"],
+        )
+
+    for key in ["records", "table", "array", "strings", "text"]:
+        if key in entry:
+            return {**entry, key: read_table(data, entry[key])}
+
+    return entry
+
+
+def get_value(tables: Dict):
+    """Get a value of a cache section from the tables read by read_tables."""
+
+    if "dict" in tables:
+        return {key: get_value(item) for key, item in tables["dict"].items()}
+
+    if "kinds" in tables:
+        if is_columnar(tables):
+            return get_table(tables)
+
+        return get_records(get_table(tables), tables["kinds"])
+
+    if "table" in tables:
+        return tables["table"]
+
+    if "array" in tables:
+        return tables["array"].column("value").to_numpy()
+
+    if "strings" in tables:
+        return tables["strings"].column("value").to_pylist()
+
+    if "text" in tables:
+        return tables["text"].column("value")[0].as_py()
+
+    if tables.get("sets", False):
+        return json.loads(json.dumps(tables["value"]), object_hook=from_json_object)
+
+    return tables["value"]
+
+
+def get_table_hash(table: pa.Table) -> str:
+    """Get hash of an Arrow table, chunks are combined first so that equal tables split into different chunks get the same hash."""
+
+    sink = pa.BufferOutputStream()
+
+    with pa.ipc.new_stream(
+        sink, table.schema, options=CONTENT_HASH_IPC_OPTIONS
+    ) as writer:
+        writer.write_table(table.combine_chunks())
+
+    return hashlib.sha256(sink.getvalue()).hexdigest()
+
+
+def to_content_value(value):
+    """Convert values to json for content hashes, tables and arrays are replaced by hashes of their content."""
+
+    if isinstance(value, pa.Table):
+        return {"table": get_table_hash(value)}
+
+    if isinstance(value, np.ndarray):
+        return {
+            "array": str(value.dtype),
+            "hash": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest(),
+        }
+
+    return to_json_value(value)
+
+
+def get_content_hash(value) -> str:
+    """Get hash of the content of a value, which is much cheaper than writing a snapshot of it.
+
+    The hash is taken over a canonical json encoding with sorted keys, so a value gets the same hash when it is built anew and when it is read back from a snapshot.
+    """
+
+    return hashlib.sha256(
+        json.dumps(
+            value, sort_keys=True, separators=(",", ":"), default=to_content_value
+        ).encode()
+    ).hexdigest()
+
+
+def get_snapshot(cache_data: Dict, base: Union[Dict, None] = None) -> bytes:
+    """Get versioned columnar snapshot of cached study data.
+
+    Each top level key of the cache is a section which can be read on its own. Lists of records, Arrow tables, arrays and long strings are stored as zstd compressed Arrow IPC streams, everything else goes to the JSON header.
+    Sets of strings are read back as sets at any depth, values which would be read back as something else than they were written are rejected.
+    Given the id, chain length and section tables of a base item, record and Arrow tables are stored as deltas against it where that pays off.
+    """
+
+    sections = {}
+    bodies = []
+    offset = 0
+
+    for name, value in cache_data.items():
+        sink = pa.BufferOutputStream()
+        entry = write_value(value, sink, base["sections"].get(name) if base else None)
+        body = sink.getvalue().to_pybytes()
+
+        sections[name] = {"offset": offset, "length": len(body), "entry": entry}
+        bodies.append(body)
+        offset += len(body)
+
+    header = {"version": SNAPSHOT_VERSION, "sections": sections}
+
+    if base:
+        header["base"] = base["id"]
+        header["chain_length"] = base["chain_length"] + 1
+
+    header = json.dumps(header).encode()
+
+    return b"".join(
+        [SNAPSHOT_MAGIC, struct.pack(HEADER_LENGTH_FORMAT, len(header)), header]
+        + bodies
+    )
+
+
+def read_snapshot_header(file: IO[bytes]) -> Dict:
+    """Read the header of a snapshot, delta snapshots name their base item and the length of their chain of deltas."""
+
+    file.seek(0)
+
+    if not is_snapshot(file.read(len(SNAPSHOT_MAGIC))):
+        raise ValueError("Not a snapshot")
+
+    (header_length,) = struct.unpack(
+        HEADER_LENGTH_FORMAT, file.read(struct.calcsize(HEADER_LENGTH_FORMAT))
+    )
+    header = json.loads(file.read(header_length))
+
+    if header["version"] > SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {header['version']}")
+
+    return {**header, "body_start": HEADER_OFFSET + header_length}
+
+
+def read_snapshot_tables(
+    file: IO[bytes],
+    header: Dict,
+    sections: Union[List[str], None] = None,
+    base: Union[Dict, None] = None,
+) -> Dict:
+    """Read the tables of the sections of a snapshot, only the given sections are read if given.
+
+    A section can be narrowed down to one of its keys as "section.key", only the tables of the given keys of such a section are read.
+    Delta snapshots need the section tables of their base item. The file has to support seeking, sections are read with one seek each.
+    """
+
+    if "base" in header and base is None:
+        raise ValueError("Delta snapshot read without its base")
+
+    section_keys = get_section_keys(sections)
+    tables = {}
+
+    for name, section in header["sections"].items():
+        if section_keys is not None and name not in section_keys:
+            continue
+
+        entry = section["entry"]
+
+        if section_keys is not None and section_keys[name] and "dict" in entry:
+            entry = {
+                "dict": {
+                    key: item
+                    for key, item in entry["dict"].items()
+                    if key in section_keys[name]
+                }
+            }
+
+        file.seek(header["body_start"] + section["offset"])
+        tables[name] = read_tables(
+            entry,
+            memoryview(file.read(section["length"])),
+            base.get(name) if base else None,
+        )
+
+    return tables
+
+
+def get_section_keys(
+    sections: Union[List[str], None],
+) -> Union[Dict[str, Union[List[str], None]], None]:
+    """Get the keys to read of each given section, None for sections read in full."""
+
+    if sections is None:
+        return None
+
+    section_keys = {}
+
+    for section in sections:
+        name, _, key = section.partition(".")
+
+        if not key:
+            section_keys[name] = None
+        elif section_keys.get(name, []) is not None:
+            section_keys[name] = section_keys.get(name, []) + [key]
+
+    return section_keys
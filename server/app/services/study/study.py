@@ -1,10 +1,18 @@
-from typing import Dict, List, Literal
+import io
+import json
+from typing import Dict, List, Literal, Union
 
-import app.services.graph.graph as csx_graph
-import networkx as nx
+import app.services.graph.adjacency as csx_adjacency
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
 from app.types import ComparisonResults
 
+# Search result columns mixing value types are stored as JSON strings with this field metadata
+JSON_COLUMN_METADATA = {b"csx_type": b"json"}
+
 
 def compare_instances(
     cache_data: Dict, params: Dict, graph_type: Literal["overview", "detail"]
@@ -69,13 +77,11 @@ def generate_cache_data(
     index: str,
     query: str,
     dimensions: Dict,
-    table_data: List[Dict],
-    results: pd.DataFrame,
     comparison_res: ComparisonResults,
-    elastic_json: Dict,
+    results: pa.Table,
     study_id: str,
 ) -> Dict:
-    """Generate cache data"""
+    """Generate cache data, the Arrow table of search results is the only copy of the result rows."""
 
     if graph_type == "overview":
         overview = graph_data
@@ -99,20 +105,162 @@ def generate_cache_data(
             "index": index,
             "new_dimensions": dimensions["query_generated"],
             "query": query,
-            "table_data": table_data,
-            "results_df": results.to_json(),
-            "elastic_json": elastic_json,
+            "results": results,
         },
     }
 
 
-def enrich_cache_with_ng_graph(
-    cache_data: Dict, graph_type: Literal["overview", "detail"]
+def drop_derived_data(cache_data: Dict) -> Dict:
+    """Drop copies of the search results which caches stored before they were derived on demand still hold.
+
+    Result rows of caches stored before the results table was introduced are converted to one.
+    """
+
+    if cache_data:
+        cache_data["global"]["results"] = get_results(cache_data["global"])
+        cache_data["global"].pop("elastic_json", None)
+        cache_data["global"].pop("table_data", None)
+        cache_data["global"].pop("results_df", None)
+
+        for graph_type in ["overview", "detail"]:
+            if "meta" in cache_data[graph_type]:
+                cache_data[graph_type]["meta"].pop("table_data", None)
+
+    return cache_data
+
+
+def get_results(global_data: Dict) -> pa.Table:
+    """Get the Arrow table of search results of the global data of a cache, caches stored before it was introduced keep result rows."""
+
+    if "results" in global_data:
+        return global_data["results"]
+
+    return get_rows_results_table(global_data["elastic_json"])
+
+
+def get_results_table(results: pd.DataFrame) -> pa.Table:
+    """Get Arrow table of search results, which is the canonical store of the result rows.
+
+    Results are parsed from their JSON records so that values are the same as in the rows sent to the client. Columns mixing value types are stored as JSON strings and marked as such.
+    """
+
+    records = results.to_json(orient="records", lines=True)
+
+    try:
+        return pa_json.read_json(io.BytesIO(records.encode()))
+    except pa.ArrowInvalid:
+        return get_rows_results_table(json.loads(results.to_json(orient="records")))
+
+
+def get_rows_results_table(rows: List[Dict]) -> pa.Table:
+    """Get Arrow table of search result rows, columns mixing value types are stored as JSON strings marked in their field metadata."""
+
+    fields = []
+    columns = []
+
+    for column in dict.fromkeys(key for row in rows for key in row):
+        values = [row.get(column) for row in rows]
+
+        try:
+            columns.append(pa.array(values))
+            fields.append(pa.field(column, columns[-1].type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            columns.append(
+                pa.array(
+                    [None if value is None else json.dumps(value) for value in values],
+                    pa.string(),
+                )
+            )
+            fields.append(pa.field(column, pa.string(), metadata=JSON_COLUMN_METADATA))
+
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+def is_json_column(field: pa.Field) -> bool:
+    return (field.metadata or {}).get(b"csx_type") == JSON_COLUMN_METADATA[b"csx_type"]
+
+
+def get_result_columns(
+    results: pa.Table, columns: Union[List[str], None] = None
+) -> Dict[str, List]:
+    """Get python values of the columns of the search results table, values of JSON columns are decoded."""
+
+    values = {}
+
+    for column in columns if columns is not None else results.column_names:
+        values[column] = results.column(column).to_pylist()
+
+        if is_json_column(results.schema.field(column)):
+            values[column] = [
+                None if value is None else json.loads(value) for value in values[column]
+            ]
+
+    return values
+
+
+def get_result_rows(results: pa.Table) -> List[Dict]:
+    """Get rows of the search results table, they are only built for responses and connectors which need rows."""
+
+    columns = get_result_columns(results)
+
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def get_results_frame(
+    results: pa.Table, columns: Union[List[str], None] = None
+) -> pd.DataFrame:
+    """Get data frame of the search results table, cells of list columns are python lists like in frames built from rows."""
+
+    return pd.DataFrame(get_result_columns(results, columns))
+
+
+def filter_results(results: pa.Table, entries: List[str]) -> pa.Table:
+    """Get the rows of the search results table which belong to the given entries."""
+
+    return results.filter(
+        pc.is_in(
+            results.column("entry"),
+            value_set=pa.array(entries, results.schema.field("entry").type),
+        )
+    )
+
+
+def concat_results(results: pa.Table, new_results: pa.Table) -> pa.Table:
+    """Append the rows of new search results to the search results table, rows of entries already in the table are skipped."""
+
+    new_results = new_results.filter(
+        pc.invert(
+            pc.is_in(new_results.column("entry"), value_set=results.column("entry"))
+        )
+    )
+
+    if not any(
+        is_json_column(field)
+        for field in list(results.schema) + list(new_results.schema)
+    ):
+        try:
+            return pa.concat_tables(
+                [results, new_results], promote_options="permissive"
+            )
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+
+    # Columns with values of different types in both tables become JSON columns
+    return get_rows_results_table(
+        get_result_rows(results) + get_result_rows(new_results)
+    )
+
+
+def enrich_cache_with_adjacency(
+    cache_data: Dict,
+    graph_type: Literal["overview", "detail"],
+    edge_index: Union[np.ndarray, None] = None,
+    node_ids: Union[List[str], None] = None,
 ):
     cache_data[graph_type]["meta"] = {
         **cache_data[graph_type]["meta"],
-        "nx_graph": nx.to_dict_of_dicts(
-            csx_graph.from_graph_data(cache_data[graph_type])
+        "adjacency": csx_adjacency.get_csr_adjacency(
+            cache_data[graph_type], edge_index, node_ids
         ),
     }
 
@@ -53,6 +53,12 @@ class EdgeConnection(TypedDict):
     feature: str
 
 
+class ConnectionIndexEntry(TypedDict):
+    label: str
+    feature: str
+    anchors: List[str]
+
+
 class Edge(TypedDict):
     id: str
     source: str
@@ -81,3 +87,49 @@ class Component(TypedDict):
     largest_connections: List[ConnectionCount]
     entries: List[str]
     nodes: List[str]
+
+
+SparsificationMethod = Literal["disparity", "top_k", "threshold"]
+
+
+class SparsificationReport(TypedDict):
+    method: SparsificationMethod
+    parameter: Optional[float]
+    max_edges: Optional[int]
+    edge_count: int
+    kept_edge_count: int
+    dropped_edge_count: int
+    dropped_weight: float
+    isolated_node_count: int
+
+
+class CentralityEntry(TypedDict):
+    id: str
+    value: float
+
+
+class DegreeCount(TypedDict):
+    degree: int
+    count: int
+
+
+class WeightCount(TypedDict):
+    weight: int
+    count: int
+
+
+class ComponentStatistics(TypedDict):
+    id: int
+    node_count: int
+    edge_count: int
+    max_degree: int
+    weight: float
+
+
+class GraphStatistics(TypedDict):
+    node_count: int
+    edge_count: int
+    max_degree: int
+    degree_distribution: List[DegreeCount]
+    weight_distribution: List[WeightCount]
+    components: List[ComponentStatistics]
@@ -0,0 +1,12 @@
+import os
+
+# Settings are read from the environment when the app is imported, tests do not connect to any service
+for name, value in {
+    "DISABLE_UPLOAD": "true",
+    "SEARCH_SOURCE": "mongo",
+    "ELASTIC_PASSWORD": "test",
+    "MONGO_PASSWORD": "test",
+    "MONGO_USERNAME": "test",
+    "SHOW_DOCS": "false",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,121 @@
+import random
+
+import app.services.graph.coarsening as csx_coarsening
+import app.services.graph.graph as csx_graph
+import app.services.study.study as csx_study
+import pandas as pd
+import pytest
+
+
+class Storage:
+    def get_config(self, index):
+        return {
+            "dimension_types": {
+                "entry": "string",
+                "Title": "string",
+                "Authors": "list",
+            }
+        }
+
+
+def get_graph_data():
+    rng = random.Random(1)
+    authors = [f"Author {i}" for i in range(40)]
+    results = csx_study.get_results_table(
+        pd.DataFrame(
+            [
+                {
+                    "entry": str(i),
+                    "Title": f"Title {i}",
+                    "Authors": rng.sample(authors, rng.randrange(1, 4)),
+                }
+                for i in range(80)
+            ]
+        )
+    )
+
+    graph_data, _, _ = csx_graph.get_graph(
+        Storage(),
+        "detail",
+        results,
+        {
+            "links": ["Authors"],
+            "anchor": {"dimension": "Title", "props": []},
+            "visible": ["Title", "Authors"],
+            "all": ["entry", "Title", "Authors"],
+            "query_generated": {},
+        },
+        [{"src": "Title", "dest": "Authors", "relationship": "oneToMany"}],
+        "test",
+        None,
+    )
+
+    return graph_data
+
+
+@pytest.mark.parametrize("cluster_key", ["community", "component"])
+def test_coarse_graph_is_bounded_and_keeps_weights(cluster_key):
+    graph_data = get_graph_data()
+    coarse_graph = csx_coarsening.get_coarse_graph(graph_data, 5, cluster_key)
+
+    assert 1 < len(coarse_graph["nodes"]) <= 5
+    assert sum(node["node_count"] for node in coarse_graph["nodes"]) == len(
+        graph_data["nodes"]
+    )
+
+    # Edges within a cluster disappear, edges between clusters are summed up
+    clusters = dict(
+        zip(
+            [node["id"] for node in graph_data["nodes"]],
+            csx_coarsening.get_node_clusters(graph_data["nodes"], cluster_key, 5),
+        )
+    )
+    between_edges = [
+        edge
+        for edge in graph_data["edges"]
+        if clusters[edge["source"]] != clusters[edge["target"]]
+    ]
+
+    assert sum(edge["edge_count"] for edge in coarse_graph["edges"]) == len(
+        between_edges
+    )
+    assert sum(edge["weight"] for edge in coarse_graph["edges"]) == sum(
+        edge["weight"] for edge in between_edges
+    )
+
+
+def test_cluster_graphs_split_the_graph():
+    graph_data = get_graph_data()
+    coarse_graph = csx_coarsening.get_coarse_graph(graph_data, 5)
+    node_count = 0
+
+    # Clusters with more nodes than the limit are collapsed again when drilling into them
+    for cluster_node in coarse_graph["nodes"]:
+        cluster_graph = csx_coarsening.get_cluster_graph(
+            graph_data, [cluster_node["cluster"]], 5
+        )
+
+        if "level_of_detail" in cluster_graph:
+            cluster_node_count = cluster_graph["level_of_detail"]["node_count"]
+        else:
+            cluster_node_count = len(cluster_graph["nodes"])
+
+        assert cluster_node_count == cluster_node["node_count"]
+        node_count += cluster_node_count
+
+    assert node_count == len(graph_data["nodes"])
+
+
+def test_cluster_graphs_beyond_the_limit_are_collapsed_again():
+    graph_data = get_graph_data()
+    largest = max(
+        csx_coarsening.get_coarse_graph(graph_data, 2)["nodes"],
+        key=lambda node: node["node_count"],
+    )
+    cluster_graph = csx_coarsening.get_cluster_graph(
+        graph_data, [largest["cluster"]], 2
+    )
+
+    assert len(cluster_graph["nodes"]) <= 2
+    assert cluster_graph["level_of_detail"]["path"] == [largest["cluster"]]
+    assert cluster_graph["level_of_detail"]["node_count"] == largest["node_count"]
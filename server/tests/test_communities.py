@@ -0,0 +1,65 @@
+import logging
+
+import app.services.graph.communities as csx_communities
+import numpy as np
+import pytest
+
+
+def get_planted_graph(community_count=6, community_size=30, seed=0):
+    """Get edges of a graph whose vertices are dense within their planted community and sparse between them."""
+
+    rng = np.random.default_rng(seed)
+    vertex_count = community_count * community_size
+    communities = np.arange(vertex_count) // community_size
+
+    sources, targets = np.triu_indices(vertex_count, k=1)
+    probabilities = np.where(communities[sources] == communities[targets], 0.3, 0.01)
+    is_edge = rng.random(len(sources)) < probabilities
+
+    return vertex_count, np.stack([sources[is_edge], targets[is_edge]], axis=1)
+
+
+@pytest.mark.parametrize("resolution", [0.5, 1.0, 2.0])
+def test_communities_are_the_same_across_runs(resolution):
+    vertex_count, edges = get_planted_graph()
+
+    runs = [
+        csx_communities.get_communities(
+            vertex_count, edges, resolution=resolution, time_limit=time_limit
+        )
+        for time_limit in [None, 60.0, None]
+    ]
+
+    for labels in runs[1:]:
+        assert np.array_equal(labels, runs[0])
+
+
+def test_communities_find_planted_partition():
+    vertex_count, edges = get_planted_graph()
+    labels = csx_communities.get_communities(vertex_count, edges)
+
+    # Each planted community ends up in a community of its own
+    planted = np.arange(vertex_count) // 30
+
+    for community in range(6):
+        assert len(np.unique(labels[planted == community])) == 1
+
+    assert len(np.unique(labels)) == 6
+    assert np.bincount(labels)[0] == np.bincount(labels).max()
+
+
+def test_communities_are_bounded_by_levels():
+    vertex_count, edges = get_planted_graph()
+    labels = csx_communities.get_communities(vertex_count, edges, max_levels=0)
+
+    assert np.array_equal(labels, np.arange(vertex_count))
+
+
+def test_time_limit_is_logged(caplog):
+    vertex_count, edges = get_planted_graph()
+
+    with caplog.at_level(logging.WARNING, logger=csx_communities.__name__):
+        labels = csx_communities.get_communities(vertex_count, edges, time_limit=0.0)
+
+    assert len(labels) == vertex_count
+    assert "time limit" in caplog.text
@@ -0,0 +1,197 @@
+import itertools
+import random
+from collections import Counter
+
+import app.services.graph.edges as csx_edges
+import app.services.graph.graph as csx_graph
+import app.services.study.study as csx_study
+import numpy as np
+import pandas as pd
+import pytest
+from app.config import settings
+from scipy import sparse
+
+DIMENSION_TYPES = {
+    "entry": "string",
+    "Title": "string",
+    "Authors": "list",
+    "Keywords": "list",
+    "Year": "float",
+}
+
+
+class Storage:
+    def get_config(self, index):
+        return {"dimension_types": DIMENSION_TYPES}
+
+
+def get_results():
+    """Get search results of titles with random authors and keywords, with repeated titles, shared authors and empty lists."""
+
+    rng = random.Random(0)
+    authors = [f"Author {i}" for i in range(15)]
+    keywords = [f"Keyword {i}" for i in range(8)]
+
+    return csx_study.get_results_table(
+        pd.DataFrame(
+            [
+                {
+                    "entry": str(i),
+                    "Title": f"Title {rng.randrange(50)}",
+                    "Authors": rng.sample(authors, rng.randrange(4)),
+                    "Keywords": rng.sample(keywords, rng.randrange(1, 3)),
+                    "Year": float(2000 + rng.randrange(5)),
+                }
+                for i in range(60)
+            ]
+        )
+    )
+
+
+def get_graph(graph_type, results, schema, links=None):
+    graph, _, _ = csx_graph.get_graph(
+        Storage(),
+        graph_type,
+        results,
+        {
+            "links": links or ["Authors"],
+            "anchor": {"dimension": "Title", "props": ["Year"]},
+            "visible": ["Title", "Authors", "Keywords"],
+            "all": list(DIMENSION_TYPES),
+            "query_generated": {},
+        },
+        schema,
+        "test",
+        None,
+    )
+
+    return graph
+
+
+def get_edge_weights(graph):
+    """Get edge weights by the feature and label of their nodes, edges are undirected."""
+
+    nodes = {node["id"]: (node["feature"], node["label"]) for node in graph["nodes"]}
+    weights = Counter()
+
+    for edge in graph["edges"]:
+        weights[frozenset([nodes[edge["source"]], nodes[edge["target"]]])] += edge.get(
+            "weight", 1
+        )
+
+    return weights
+
+
+def get_values(row, feature):
+    value = row[feature]
+
+    return value if isinstance(value, list) else [value]
+
+
+@pytest.mark.parametrize(
+    "schema",
+    [
+        [{"src": "Title", "dest": "Authors", "relationship": "oneToMany"}],
+        [
+            {"src": "Title", "dest": "Authors", "relationship": "oneToMany"},
+            {"src": "Authors", "dest": "Keywords", "relationship": "manyToMany"},
+        ],
+    ],
+)
+def test_detail_edges_match_rows(schema):
+    results = get_results()
+    rows = csx_study.get_result_rows(results)
+    graph = get_graph("detail", results, schema)
+
+    # Each schema relation links the values of its features found in the same row once, edges are weighted by the number of such rows
+    expected = Counter(
+        pair
+        for row in rows
+        for element in schema
+        for pair in set(
+            ((element["src"], source), (element["dest"], target))
+            for source, target in itertools.product(
+                get_values(row, element["src"]), get_values(row, element["dest"])
+            )
+        )
+    )
+
+    nodes = {node["id"]: (node["feature"], node["label"]) for node in graph["nodes"]}
+    edges = [
+        ((nodes[edge["source"]], nodes[edge["target"]]), edge["weight"])
+        for edge in graph["edges"]
+    ]
+
+    assert len(set(pair for pair, _ in edges)) == len(edges)
+    assert dict(edges) == dict(expected)
+    assert any(weight > 1 for weight in expected.values())
+
+
+@pytest.mark.parametrize("max_connections", [None, 1])
+def test_overview_edges_match_shared_links(monkeypatch, max_connections):
+    monkeypatch.setattr(settings, "overview_max_connections", max_connections)
+    results = get_results()
+    rows = csx_study.get_result_rows(results)
+    graph = get_graph("overview", results, [])
+
+    # Anchor nodes are connected by the distinct link values their rows share
+    links = {}
+
+    for row in rows:
+        links.setdefault(row["Title"], set()).update(row["Authors"])
+
+    expected = {
+        frozenset([("Title", source), ("Title", target)]): len(
+            links[source] & links[target]
+        )
+        for source, target in itertools.combinations(sorted(links), 2)
+        if links[source] & links[target]
+    }
+
+    assert dict(get_edge_weights(graph)) == expected
+
+    labels = {node["id"]: node["label"] for node in graph["nodes"]}
+
+    # Capped edges keep their top ranked connections, weights still count all shared links
+    for edge in graph["edges"]:
+        shared = links[labels[edge["source"]]] & links[labels[edge["target"]]]
+        connections = set(connection["label"] for connection in edge["connections"])
+
+        if max_connections is None:
+            assert connections == shared
+        else:
+            assert len(connections) == min(len(shared), max_connections)
+            assert connections <= shared
+
+
+def test_overview_connections_are_not_capped_below_one():
+    with pytest.raises(ValueError):
+        csx_edges.get_projection_connections(sparse.csr_matrix(np.eye(2)), 0)
+
+
+@pytest.mark.parametrize("sparsification", ["top_k", "disparity"])
+def test_overview_top_connections_count_kept_edges(monkeypatch, sparsification):
+    monkeypatch.setattr(settings, "overview_max_connections", None)
+    monkeypatch.setattr(settings, "overview_sparsification", sparsification)
+    graph = get_graph("overview", get_results(), [], ["Authors", "Keywords"])
+
+    assert graph["sparsification"]["dropped_edge_count"] > 0
+
+    # Each edge counts once for every connection its anchors share
+    counts = {component["id"]: Counter() for component in graph["components"]}
+
+    for edge in graph["edges"]:
+        for connection in edge["connections"]:
+            counts[edge["component"]][(connection["feature"], connection["label"])] += 1
+
+    for component in graph["components"]:
+        top_connections = component["largest_connections"]
+
+        assert [connection["count"] for connection in top_connections] == sorted(
+            counts[component["id"]].values(), reverse=True
+        )[:5]
+
+        for connection in top_connections:
+            assert connection["count"] == (
+                counts[component["id"]][(connection["feature"], connection["label"])]
+            )
@@ -0,0 +1,93 @@
+import random
+
+import app.services.graph.adjacency as csx_adjacency
+import networkx as nx
+import pytest
+
+
+def get_graph_data(seed: int = 0):
+    """Get a random sparse graph with weighted edges and a few isolated nodes."""
+
+    rng = random.Random(seed)
+    nodes = [{"id": f"node_{i}"} for i in range(60)]
+    pairs = set()
+
+    while len(pairs) < 80:
+        source, target = rng.sample(range(55), 2)
+        pairs.add((min(source, target), max(source, target)))
+
+    return {
+        "nodes": nodes,
+        "edges": [
+            {
+                "id": f"edge_{i}",
+                "source": nodes[source]["id"],
+                "target": nodes[target]["id"],
+                "weight": rng.randrange(1, 10),
+            }
+            for i, (source, target) in enumerate(sorted(pairs))
+        ],
+    }
+
+
+def get_nx_graph(graph_data):
+    graph = nx.Graph()
+    graph.add_nodes_from(node["id"] for node in graph_data["nodes"])
+    graph.add_weighted_edges_from(
+        (edge["source"], edge["target"], edge["weight"]) for edge in graph_data["edges"]
+    )
+
+    return graph
+
+
+@pytest.mark.parametrize("hops", [0, 1, 2, 3, csx_adjacency.MAX_EGO_HOPS])
+def test_ego_graph_matches_breadth_first_search(hops):
+    graph_data = get_graph_data()
+    seeds = ["node_0", "node_1", "node_57"]
+    ego_graph = csx_adjacency.get_ego_graph(graph_data, seeds, hops)
+
+    expected = {}
+
+    for seed in seeds:
+        for node_id, distance in nx.single_source_shortest_path_length(
+            get_nx_graph(graph_data), seed, cutoff=hops
+        ).items():
+            expected[node_id] = min(distance, expected.get(node_id, distance))
+
+    assert ego_graph["hops"] == expected
+    assert set(node["id"] for node in ego_graph["nodes"]) == set(expected)
+    assert set(edge["id"] for edge in ego_graph["edges"]) == set(
+        edge["id"]
+        for edge in graph_data["edges"]
+        if edge["source"] in expected and edge["target"] in expected
+    )
+
+
+def test_ego_graph_follows_heaviest_neighbours_up_to_fanout():
+    graph_data = get_graph_data()
+    graph = get_nx_graph(graph_data)
+    ego_graph = csx_adjacency.get_ego_graph(graph_data, ["node_0"], 3, [2, 1])
+
+    # Nodes of each hop are reached from the previous hop through its heaviest edges only, ties may go either way
+    for node_id, distance in ego_graph["hops"].items():
+        if distance == 0:
+            continue
+
+        fanout = 2 if distance == 1 else 1
+        assert any(
+            ego_graph["hops"].get(neighbour) == distance - 1
+            and graph[neighbour][node_id]["weight"]
+            >= sorted(
+                (edge["weight"] for edge in graph[neighbour].values()), reverse=True
+            )[:fanout][-1]
+            for neighbour in graph[node_id]
+        )
+
+    assert list(ego_graph["hops"].values()).count(1) <= 2
+    assert len(ego_graph["hops"]) <= 1 + 2 + 2 + 2
+
+
+def test_ego_graph_skips_unknown_nodes():
+    ego_graph = csx_adjacency.get_ego_graph(get_graph_data(), ["unknown"], 2)
+
+    assert ego_graph == {"nodes": [], "edges": [], "hops": {}}
@@ -0,0 +1,112 @@
+import itertools
+
+import app.services.graph.paths as csx_paths
+import networkx as nx
+import pytest
+
+
+def get_graph_data(seed: int = 0):
+    """Get a random sparse graph with weighted edges, it has several components."""
+
+    graph = nx.gnm_random_graph(50, 55, seed=seed)
+
+    return {
+        "nodes": [{"id": f"node_{node}"} for node in graph.nodes],
+        "edges": [
+            {
+                "id": f"edge_{i}",
+                "source": f"node_{source}",
+                "target": f"node_{target}",
+                "weight": 1 + (source * target) % 5,
+            }
+            for i, (source, target) in enumerate(graph.edges)
+        ],
+    }
+
+
+def get_nx_graph(graph_data):
+    graph = nx.Graph()
+    graph.add_nodes_from(node["id"] for node in graph_data["nodes"])
+    graph.add_edges_from(
+        (edge["source"], edge["target"]) for edge in graph_data["edges"]
+    )
+
+    return graph
+
+
+def get_distance(graph, sources, targets):
+    distances = [
+        nx.shortest_path_length(graph, source, target)
+        for source, target in itertools.product(sources, targets)
+        if nx.has_path(graph, source, target)
+    ]
+
+    return min(distances) if distances else None
+
+
+@pytest.mark.parametrize(
+    "sources, targets",
+    [
+        (["node_0"], ["node_1"]),
+        (["node_2", "node_3"], ["node_4", "node_5", "node_6"]),
+        (["node_7"], ["node_7", "node_8"]),
+    ]
+    + [([f"node_{i}"], [f"node_{49 - i}"]) for i in range(10, 20)],
+)
+def test_paths_are_shortest_paths(sources, targets):
+    graph_data = get_graph_data()
+    graph = get_nx_graph(graph_data)
+    path_graph = csx_paths.get_path_graph(
+        graph_data, sources, targets, max_paths=csx_paths.MAX_PATHS
+    )
+    distance = get_distance(graph, sources, targets)
+
+    assert path_graph["distance"] == distance
+
+    if distance is None:
+        assert path_graph["paths"] == []
+        return
+
+    # All paths between the closest source and target pairs are found
+    expected = set(
+        tuple(path)
+        for source, target in itertools.product(sources, targets)
+        if nx.has_path(graph, source, target)
+        and nx.shortest_path_length(graph, source, target) == distance
+        for path in nx.all_shortest_paths(graph, source, target)
+    )
+
+    assert set(tuple(path) for path in path_graph["paths"]) == expected
+
+    path_nodes = set(node_id for path in expected for node_id in path)
+    assert set(node["id"] for node in path_graph["nodes"]) == path_nodes
+
+    for edge in path_graph["edges"]:
+        assert edge["source"] in path_nodes and edge["target"] in path_nodes
+
+
+def test_paths_are_bounded_by_max_paths_and_max_distance():
+    graph_data = get_graph_data()
+    graph = get_nx_graph(graph_data)
+    sources, targets = ["node_0"], ["node_36"]
+    distance = get_distance(graph, sources, targets)
+
+    assert distance is not None and distance > 1
+    assert len(list(nx.all_shortest_paths(graph, "node_0", "node_36"))) > 1
+
+    path_graph = csx_paths.get_path_graph(graph_data, sources, targets, max_paths=1)
+
+    assert len(path_graph["paths"]) == 1
+    assert len(path_graph["paths"][0]) == distance + 1
+
+    path_graph = csx_paths.get_path_graph(
+        graph_data, sources, targets, max_distance=distance - 1
+    )
+
+    assert path_graph["paths"] == [] and path_graph["distance"] is None
+
+    path_graph = csx_paths.get_path_graph(
+        graph_data, sources, targets, max_distance=distance
+    )
+
+    assert path_graph["distance"] == distance
@@ -0,0 +1,343 @@
+import io
+import pickle
+
+import app.services.graph.graph as csx_graph
+import app.services.storage.snapshot as csx_snapshot
+import app.services.study.study as csx_study
+import numpy as np
+import pytest
+from app.services.storage.mongo_storage_connector import MongoStorageConnector
+from bson import ObjectId
+
+
+class FakeFile(io.BytesIO):
+    def __init__(self, document):
+        super().__init__(document["data"])
+        self.__dict__.update(
+            {key: value for key, value in document.items() if key != "data"}
+        )
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = {}
+        self.updates = []
+
+    @staticmethod
+    def matches(document, query):
+        for key, condition in query.items():
+            if isinstance(condition, dict) and "$in" in condition:
+                if document.get(key) not in condition["$in"]:
+                    return False
+            elif isinstance(condition, dict) and "$exists" in condition:
+                if (key in document) != condition["$exists"]:
+                    return False
+            elif document.get(key) != condition:
+                return False
+
+        return True
+
+    def find(self, query, projection=None):
+        return [
+            document
+            for document in list(self.documents.values())
+            if self.matches(document, query)
+        ]
+
+    def find_one(self, query):
+        return next(iter(self.find(query)), None)
+
+    def update_one(self, query, update):
+        self.updates.append(update)
+
+
+class FakeGridFS:
+    """GridFS keeping files in memory, its files collection is shared with the fake database."""
+
+    def __init__(self, files: FakeCollection):
+        self.files = files
+
+    def put(self, data, _id=None, **kwargs):
+        _id = _id if _id is not None else ObjectId()
+        self.files.documents[_id] = {"_id": _id, "data": data, **kwargs}
+
+        return _id
+
+    def get(self, file_id):
+        return FakeFile(self.files.documents[file_id])
+
+    def exists(self, file_id):
+        return file_id in self.files.documents
+
+    def delete(self, file_id):
+        self.files.documents.pop(file_id, None)
+
+
+@pytest.fixture
+def storage():
+    storage = MongoStorageConnector.__new__(MongoStorageConnector)
+    files = FakeCollection()
+    storage.read_item = None
+    storage.database = {"fs.files": files, "studies": FakeCollection()}
+    storage.fs = FakeGridFS(files)
+    storage.client = None
+    storage.disconnect = lambda: None
+
+    return storage
+
+
+def get_results(count: int, offset: int = 0):
+    return csx_study.get_rows_results_table(
+        [
+            {
+                "entry": str(i),
+                "title": f"Title {i}",
+                "authors": [f"Author {i}", f"Author {i % 7}"],
+                "year": 2000 + i % 20,
+                "mixed": i if i % 2 else "none",
+            }
+            for i in range(offset, offset + count)
+        ]
+    )
+
+
+def get_cache(count: int, offset: int = 0):
+    results = get_results(count, offset)
+
+    return {
+        "overview": {},
+        "detail": {
+            "nodes": [
+                {
+                    "id": str(i),
+                    "label": f"Node {i}",
+                    "entries": [str(i)],
+                    "neighbours": {str(i - 1), str(i + 1)},
+                    "size": float(i),
+                    "properties": {"year": 2000 + i % 20} if i % 3 else None,
+                }
+                for i in range(offset, offset + count)
+            ],
+            "meta": {
+                "adjacency": {"offsets": np.arange(count + 1)},
+                "description": "x" * (csx_snapshot.MAX_HEADER_STRING_LENGTH + 1),
+                "dimensions": ["title", "authors"],
+            },
+        },
+        "global": {
+            "search_uuid": "search",
+            "query": "query",
+            "new_dimensions": {},
+            "results": results,
+        },
+    }
+
+
+def read_snapshot(snapshot: bytes, base=None) -> dict:
+    file = io.BytesIO(snapshot)
+    tables = csx_snapshot.read_snapshot_tables(
+        file, csx_snapshot.read_snapshot_header(file), None, base
+    )
+
+    return {name: csx_snapshot.get_value(section) for name, section in tables.items()}
+
+
+def assert_cache_equal(cache, expected):
+    assert cache["overview"] == expected["overview"]
+    assert cache["global"]["results"].equals(
+        expected["global"]["results"], check_metadata=True
+    )
+    assert {
+        key: value for key, value in cache["global"].items() if key != "results"
+    } == {key: value for key, value in expected["global"].items() if key != "results"}
+    assert cache["detail"]["nodes"] == expected["detail"]["nodes"]
+    assert np.array_equal(
+        cache["detail"]["meta"]["adjacency"]["offsets"],
+        expected["detail"]["meta"]["adjacency"]["offsets"],
+    )
+    assert cache["detail"]["meta"]["description"] == (
+        expected["detail"]["meta"]["description"]
+    )
+    assert cache["detail"]["meta"]["dimensions"] == (
+        expected["detail"]["meta"]["dimensions"]
+    )
+
+
+def test_snapshot_round_trip():
+    cache = get_cache(100)
+    read_cache = read_snapshot(csx_snapshot.get_snapshot(cache))
+
+    assert_cache_equal(read_cache, cache)
+    assert isinstance(read_cache["detail"]["nodes"][0]["neighbours"], set)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"edge": ("a", "b")},
+        {"counts": {1: "a"}},
+        {"ids": {1, 2}},
+        [{"id": "a", "pair": ("a", "b")}, {"id": "b", "pair": ["a"]}],
+    ],
+)
+def test_snapshot_rejects_values_read_back_differently(value):
+    with pytest.raises(TypeError):
+        csx_snapshot.get_snapshot({"detail": value})
+
+
+def test_snapshot_round_trip_of_nested_sets():
+    cache = {
+        "detail": {
+            "components": [
+                {"id": 0, "largest_nodes": [{"id": "a", "neighbours": {"b", "c"}}]},
+                {"id": 1, "largest_nodes": []},
+            ],
+            "meta": {"selected": {"ids": {"a"}}},
+        }
+    }
+
+    assert read_snapshot(csx_snapshot.get_snapshot(cache)) == cache
+
+
+class Storage:
+    def get_config(self, index):
+        return {
+            "dimension_types": {
+                "entry": "string",
+                "title": "string",
+                "authors": "list",
+                "year": "integer",
+                "mixed": "string",
+            }
+        }
+
+
+@pytest.mark.parametrize("graph_type", ["detail", "overview"])
+def test_snapshot_round_trip_of_graph(graph_type):
+    graph, _, _ = csx_graph.get_graph(
+        Storage(),
+        graph_type,
+        get_results(60),
+        {
+            "links": ["authors"],
+            "anchor": {"dimension": "title", "props": ["year"]},
+            "visible": ["title", "authors"],
+            "all": ["entry", "title", "authors", "year"],
+            "query_generated": {},
+        },
+        [{"src": "title", "dest": "authors", "relationship": "oneToMany"}],
+        "test",
+        None,
+    )
+
+    # Largest nodes of detail components are the graph nodes themselves, along with their neighbour sets
+    if graph_type == "detail":
+        assert any(component["largest_nodes"] for component in graph["components"])
+
+    read_graph = read_snapshot(csx_snapshot.get_snapshot({graph_type: graph}))[
+        graph_type
+    ]
+
+    for key in ["nodes", "edges", "components"]:
+        assert read_graph[key] == graph[key]
+
+
+def test_content_hash_of_read_back_global_data():
+    cache = get_cache(100)
+    read_cache = read_snapshot(csx_snapshot.get_snapshot({"global": cache["global"]}))
+
+    assert csx_snapshot.get_content_hash(read_cache["global"]) == (
+        csx_snapshot.get_content_hash(cache["global"])
+    )
+    assert csx_snapshot.get_content_hash(get_cache(100, 1)["global"]) != (
+        csx_snapshot.get_content_hash(cache["global"])
+    )
+
+
+def insert_history_item(storage, cache, parent_id=None, delta=False):
+    storage.insert_history_item(
+        "study",
+        "user",
+        {
+            "graph_data": cache,
+            "history_parent_id": parent_id,
+            "delta": delta,
+            "action": "action",
+            "graph_type": "detail",
+            "query": "query",
+            "action_time": "time",
+            "schema": [],
+            "anchor_properties": [],
+            "anchor": "title",
+            "links": [],
+            "visible_dimensions": [],
+            "charts": [],
+            "edge_count": 0,
+            "node_count": len(cache["detail"]["nodes"]),
+        },
+    )
+
+    return storage.database["studies"].updates[-1]["$push"]["history"]["item_id"]
+
+
+def test_delta_chain_round_trip(storage):
+    caches = []
+    item_ids = []
+    chain_lengths = []
+
+    for i in range(2 * csx_snapshot.MAX_DELTA_CHAIN_LENGTH + 2):
+        cache = get_cache(200 - i, i)
+        item_id = insert_history_item(
+            storage, cache, str(item_ids[-1]) if item_ids else None, delta=True
+        )
+
+        caches.append(cache)
+        item_ids.append(item_id)
+        chain_lengths.append(
+            csx_snapshot.read_snapshot_header(storage.fs.get(item_id)).get(
+                "chain_length", 0
+            )
+        )
+
+        # Items are read before deltas are stored against them, reading from scratch must not rely on that
+        storage.read_item = None
+
+    assert chain_lengths == [
+        i % (csx_snapshot.MAX_DELTA_CHAIN_LENGTH + 1) for i in range(len(caches))
+    ]
+
+    for item_id, cache in zip(item_ids, caches):
+        assert_cache_equal(storage.get_history_item(str(item_id)), cache)
+
+
+def test_legacy_pickle_fallback(storage):
+    cache = {"detail": {"nodes": [{"id": "a", "neighbours": {"b"}}]}, "global": {}}
+    item_id = storage.fs.put(pickle.dumps(cache))
+
+    assert storage.get_history_item(str(item_id)) == cache
+
+
+def test_delete_history_item_files_removes_orphan_global_data(storage):
+    shared_ids = [insert_history_item(storage, get_cache(50)) for _ in range(2)]
+    other_id = insert_history_item(storage, get_cache(50, 1))
+    storage.insert_history_item_centrality(str(shared_ids[0]), "detail", {"a": [1]})
+
+    global_ids = {
+        storage.fs.files.documents[item_id]["global_id"]
+        for item_id in shared_ids + [other_id]
+    }
+    shared_global_id = storage.fs.files.documents[shared_ids[0]]["global_id"]
+
+    assert len(global_ids) == 2
+    assert storage.fs.files.documents[shared_ids[1]]["global_id"] == shared_global_id
+
+    storage.delete_history_item_files([shared_ids[0]])
+
+    assert not storage.fs.exists(shared_ids[0])
+    assert not storage.fs.exists(f"centrality_{shared_ids[0]}_detail")
+    assert storage.fs.exists(shared_global_id)
+
+    storage.delete_history_item_files([shared_ids[1], other_id])
+
+    assert not any(storage.fs.exists(global_id) for global_id in global_ids)
+    assert storage.fs.files.documents == {}